@@ -0,0 +1,112 @@
+# coding=utf8
+
+import re
+
+import numpy as np
+import pandas as pd
+
+GROUP_SIZE_RE = re.compile(r"^(?P<name>.+)\((?P<size>\d+)\)$")
+
+
+def group_sizes(columns):
+    """Number of genomes of every taxonomic group column, parsed from
+    headers like "baumannii(55)".
+    """
+    sizes = {}
+    for column in columns:
+        match = GROUP_SIZE_RE.match(str(column))
+        if match and int(match.group("size")) > 0:
+            sizes[column] = int(match.group("size"))
+    return sizes
+
+
+def category_counts(codes, n_categories, flags=None):
+    """Number of rows per category code, split by a boolean flag.
+
+    Returns an (n_categories, 2) array whose second axis counts the rows
+    with flag False and True (all rows count as False without flags).
+    Missing values (code -1) are not counted.
+    """
+    codes = np.asarray(codes)
+    present = codes >= 0
+    keys = codes[present].astype(np.int64) * 2
+    if flags is not None:
+        keys += np.asarray(flags, dtype=bool)[present]
+    return np.bincount(keys, minlength=2 * n_categories).reshape(n_categories, 2)
+
+
+class CompositionTable:
+    """Category counts of some columns for every group (assembly), split
+    by a boolean flag column, precomputed as dense
+    (n_groups, n_categories, 2) arrays.
+    """
+
+    def __init__(self, groups, columns, flags):
+        groups = pd.Categorical(groups)
+        self.groups = pd.Index(groups.categories, dtype=object)
+        group_codes = groups.codes.astype(np.int64)
+        flags = np.asarray(flags, dtype=bool)
+        self.categories = {}
+        self.counts = {}
+        for name, values in columns.items():
+            values = pd.Categorical(values)
+            n_categories = len(values.categories)
+            present = group_codes >= 0
+            keys = group_codes[present] * n_categories + values.codes[present]
+            keys = np.where(values.codes[present] >= 0, keys, -1)
+            counts = category_counts(keys, len(self.groups) * n_categories, flags[present])
+            self.categories[name] = pd.Index(values.categories, dtype=object)
+            self.counts[name] = counts.reshape(len(self.groups), n_categories, 2)
+
+    def get(self, group, column):
+        """(categories, counts) of column within group, None if unknown.
+        """
+        if column not in self.counts or group not in self.groups:
+            return None
+        return self.categories[column], self.counts[column][self.groups.get_loc(group)]
+
+    @property
+    def nbytes(self):
+        return sum(counts.nbytes for counts in self.counts.values())
+
+
+class PrevalenceMatrix:
+    """Prevalence [%] of every HOG in each taxonomic group, as a dense
+    (n_hogs, n_groups) float32 matrix, with the HOG of every protein.
+    """
+
+    def __init__(self, frame, groups, hog_column="hog_id1"):
+        frame = frame[~frame.index.duplicated()]
+        sizes = group_sizes(groups)
+        self.groups = [g for g in groups if g in sizes]
+        self.proteins = frame.index
+        hog_codes, hogs = pd.factorize(frame[hog_column].to_numpy(dtype=object))
+        self.hog_codes = np.asarray(hog_codes)
+        self.hogs = pd.Index(hogs, dtype=object)
+        # all proteins of a HOG share its prevalences, keep the first
+        _, first = np.unique(self.hog_codes, return_index=True)
+        first = first[self.hog_codes[first] >= 0]
+        counts = np.column_stack([frame[g].to_numpy(dtype=np.float64, na_value=np.nan)[first]
+                                  for g in self.groups]) \
+            if self.groups else np.zeros((len(first), 0))
+        totals = np.array([sizes[g] for g in self.groups], dtype=np.float64)
+        self.values = (counts / totals * 100).astype(np.float32)
+
+    def rows(self, proteins):
+        """HOG ids (None for proteins without a HOG) and prevalence rows
+        (NaN) of proteins.
+        """
+        positions = self.proteins.get_indexer(list(proteins))
+        # only index with found positions/codes, the tables may be empty
+        codes = np.full(len(positions), -1, dtype=np.intp)
+        codes[positions >= 0] = self.hog_codes[positions[positions >= 0]]
+        known = codes >= 0
+        hogs = np.full(len(codes), None, dtype=object)
+        hogs[known] = self.hogs.to_numpy()[codes[known]]
+        values = np.full((len(codes), len(self.groups)), np.nan, dtype=np.float32)
+        values[known] = self.values[codes[known]]
+        return hogs, values
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.hog_codes.nbytes
@@ -2,6 +2,10 @@
 
 import os
 import json
+import time
+import hmac
+import hashlib
+import logging
 import dash_table
 import dash_core_components as dcc
 import dash_html_components as html
@@ -11,23 +15,55 @@ from dash import callback_context
 import chart_studio.plotly as py
 import plotly.graph_objs as go
 import plotly.express as px
+import numpy as np
 import pandas as pd
-from flask import Flask
-from dash import Dash
-from dash.dependencies import Input, Output, State
+from flask import Flask, jsonify, request
+from dash import Dash, DiskcacheManager
+from dash.dependencies import ClientsideFunction, Input, Output, State
 from dash.exceptions import PreventUpdate
+from dash import no_update
 from dotenv import load_dotenv
 #from .exceptions import ImproperlyConfigured
 from collections import Counter
-from numpy import random
 from plotly.figure_factory import create_dendrogram
 from plotly.subplots import make_subplots
 import pickle
 import bz2
 import _pickle as cPickle
 from pathlib import Path
-import sqlite3
 import urllib3
+import diskcache
+
+try:
+    from .datacache import DatasetCache
+    from . import columnar
+    from . import schema
+    from .indexes import PartitionIndex, PositionMap, ProteinSearchIndex
+    from . import sqlstore
+    from . import filtering
+    from .figcache import FigureCache, fingerprint
+    from .aggregates import CompositionTable, PrevalenceMatrix, category_counts, group_sizes
+    from . import figures
+    from .exceptions import FilterQueryError
+    from .loader import BackgroundLoader, FAILED, run_concurrently
+    from .metrics import CallbackMetrics
+    from .memory import TracemallocDiff, frame_usage, process_memory
+except ImportError:
+    from datacache import DatasetCache
+    import columnar
+    import schema
+    from indexes import PartitionIndex, PositionMap, ProteinSearchIndex
+    import sqlstore
+    import filtering
+    from figcache import FigureCache, fingerprint
+    from aggregates import CompositionTable, PrevalenceMatrix, category_counts, group_sizes
+    import figures
+    from exceptions import FilterQueryError
+    from loader import BackgroundLoader, FAILED, run_concurrently
+    from metrics import CallbackMetrics
+    from memory import TracemallocDiff, frame_usage, process_memory
+
+logger = logging.getLogger(__name__)
 
 #TODO: Fix stderr  error message when changing the genome, reporting the missing column for hueing markers in the main graph
 
@@ -77,7 +113,12 @@ external_stylesheets = [
     "https://fonts.googleapis.com/css?family=Lobster|Raleway",
     "//maxcdn.bootstrapcdn.com/font-awesome/4.7.0/css/font-awesome.min.css", ]
 
-app = Dash(name=app_name, server=server, external_stylesheets=[dbc.themes.LUMEN])
+# the content is swapped in once the datasets are loaded, so not all
+# callback components exist in the initial (placeholder) layout
+app = Dash(name=app_name, server=server, external_stylesheets=[dbc.themes.LUMEN],
+           assets_folder=str(path / "assets"), suppress_callback_exceptions=True)
+
+PAGE_SIZE = 15
 
 PLOTLY_LOGO = "https://applbio.biologie.uni-frankfurt.de/acinetobacter/wp-content/uploads/2017/11/for_logo.png"
 
@@ -86,61 +127,296 @@ PLOTLY_LOGO = "https://applbio.biologie.uni-frankfurt.de/acinetobacter/wp-conten
 
 ########################### DATA ####################################
 
-http = urllib3.PoolManager()
-resp = http.request('GET','https://aci-dash.s3.computational.bio.uni-giessen.de/data/p_feature_tables.pickle.bz2')
-req_decompr = bz2.decompress(resp.data)
-df = cPickle.loads(req_decompr)
-
-df.index.rename("id", inplace=True)
-
-relevant_columns = [  # "# feature",
-   "genomic_accession",
-   "assembly",
-   "start",
-   "end",
-   "strand",
-   "non-redundant_refseq",
-   "name",
-   "symbol",
-   "locus_tag",
-   "feature_interval_length",
-   # "product_length",
-   "attributes"]
-
-df = df[(df["# feature"] == "CDS") & (df["class"] == "with_protein")][relevant_columns]
-
-df.columns = [  # "feat",
-   "Genomic Acc",
-   "assembly",
-   "Start",
-   "End",
-   "Str",
-   "RefSeq Acc",
-   "Protein Annotation",
-   "Sym",
-   "Locus_tag",
-   "Len",
-   # "product_len",
-   "Comments"]
-
-df['id'] = df.index
-
-rel_path = 'https://aci-dash.s3.computational.bio.uni-giessen.de/data/extended_assembly2strain.csv'
-genomes_df = pd.read_csv( rel_path , header="infer",
-                         sep='\t', index_col=1, dtype=str)
-
-genomes_dict = genomes_df.to_dict(orient="index")
-
-rel_path = 'https://aci-dash.s3.computational.bio.uni-giessen.de/data/hogs2virulence_factors_with_source.tsv'
-hog2vir_df = pd.read_csv(rel_path, header=None,
-                         sep='\t',
-                         index_col=0,
-                         names=["query", "eval", "hit_id", "hit_description", "source"])
-
-http = urllib3.PoolManager()
-resp = http.request('GET','https://aci-dash.s3.computational.bio.uni-giessen.de/data/p_full_annot.pickle.bz2')
-req_decompr = bz2.decompress(resp.data)
-full_hog_table = cPickle.loads(req_decompr)
+DATA_URL = os.getenv("DATA_URL", "https://aci-dash.s3.computational.bio.uni-giessen.de/data/")
+CACHE_DIR = os.getenv("DATA_CACHE_DIR", os.path.join(str(Path.home()), ".cache", "aci-dash"))
+OFFLINE = os.getenv("DATA_OFFLINE", "0").lower() in ("1", "true", "yes")
+FIGURE_CACHE_BYTES = int(os.getenv("FIGURE_CACHE_BYTES", 64 * 2 ** 20))
+# "memory": serve genomes from the memory-mapped feature table,
+# "sqlite": from an indexed SQLite copy of it. Only the per-genome row
+# reads (table, figures, clicks) go to SQLite; the protein search, the
+# composition aggregates and the protein x HOG join are still built from
+# the memory-mapped table at startup
+DATA_BACKEND = os.getenv("DATA_BACKEND", "memory")
+
+if DATA_BACKEND not in ("memory", "sqlite"):
+    raise ImproperlyConfigured("DATA_BACKEND must be 'memory' or 'sqlite'")
+
+dataset_cache = DatasetCache(CACHE_DIR, offline=OFFLINE)
+
+# long-running callbacks (background=True) run in a new process per job,
+# forked from the worker and so seeing its datasets as loaded at that
+# moment; jobs and results are kept in a disk cache shared by all workers
+background_callback_manager = DiskcacheManager(
+    diskcache.Cache(os.getenv("JOBS_CACHE_DIR", os.path.join(CACHE_DIR, "jobs"))))
+
+# latency, phase and payload-size histograms of the callbacks on /metrics
+CALLBACK_METRICS = os.getenv("CALLBACK_METRICS", "0").lower() in ("1", "true", "yes")
+callback_metrics = CallbackMetrics(enabled=CALLBACK_METRICS)
+
+# bump when the preparation of the columnar tables below changes
+COLUMNS_REVISION = 5
+
+# columns joined onto full_hog_table from the virulence factor hits
+VIR_COLUMN = "vir_hit"
+VIR_BEST_HIT_COLUMN = "vir_best_hit"
+# highlights-checkb option -> boolean membership column
+HIGHLIGHT_COLUMNS = {"VIR": VIR_COLUMN}
+# value of these HOG table columns for proteins without a HOG; numeric
+# columns (the prevalences) get 0, all others stay empty
+STRAIN_SPECIFIC_COLUMNS = ['gained_at', 'aci_core231_of_234', 'acb_core91_of_93']
+STRAIN_SPECIFIC = "Strain specific"
+# hue criteria whose per-genome composition is precomputed
+COMPOSITION_COLUMNS = ['aci_core231_of_234', 'gained_at']
+# taxonomic ranges combining several groups, left out of the prevalence bar chart
+SUMMARY_GROUPS = ['complete_acb', 'other']
+# at most this many proteins of a lasso selection are compared in the bar chart
+MAX_COMPARED_PROTEINS = 12
+# per-protein x offset of the jittered scatter plot
+JITTER_COLUMN = "jitter"
+
+
+def prepare_feature_table(df):
+    df.index.rename("id", inplace=True)
+
+    relevant_columns = [  # "# feature",
+       "genomic_accession",
+       "assembly",
+       "start",
+       "end",
+       "strand",
+       "non-redundant_refseq",
+       "name",
+       "symbol",
+       "locus_tag",
+       "feature_interval_length",
+       # "product_length",
+       "attributes"]
+
+    df = df[(df["# feature"] == "CDS") & (df["class"] == "with_protein")][relevant_columns]
+
+    df.columns = [  # "feat",
+       "Genomic Acc",
+       "assembly",
+       "Start",
+       "End",
+       "Str",
+       "RefSeq Acc",
+       "Protein Annotation",
+       "Sym",
+       "Locus_tag",
+       "Len",
+       # "product_len",
+       "Comments"]
+
+    df['id'] = df.index
+    # keep the rows of every assembly contiguous for the partition index
+    df = df.sort_values("assembly", kind="stable")
+    return df
+
+
+def fetch(name, timings):
+    start = time.perf_counter()
+    local_path = dataset_cache.fetch(DATA_URL + name)
+    timings[name] = {"fetch_s": round(time.perf_counter() - start, 3),
+                     "bytes": local_path.stat().st_size}
+    return local_path
+
+
+def load_table(name, timings, prepare=None):
+    """Load the pickled table name from the dataset cache as a memory-mapped
+    columnar table, building the columnar copy on first use.
+    """
+    pickle_path = fetch(name, timings)
+    columns_dir = Path(CACHE_DIR) / "columns" / "{}-r{}-{}".format(name.split('.')[0], COLUMNS_REVISION,
+                                                                  pickle_path.name)
+    timings[name]["table"] = columns_dir.name
+
+    def build():
+        # bz2 decompresses incrementally while pickle reads from the stream,
+        # so neither the compressed nor the raw bytes are held in memory
+        with bz2.open(str(pickle_path), 'rb') as fh:
+            table = cPickle.load(fh)
+        if prepare:
+            table = prepare(table)
+        table, reports["schema"] = schema.normalize(table, name)
+        return table
+
+    reports = {}
+    table = columnar.load_or_build(columns_dir, build, metadata=lambda: reports)
+    # stored with the table, so startups from the cached copy report it too
+    report = columnar.read_metadata(columns_dir)["schema"]
+    timings[name]["memory_before"] = report["before"]
+    timings[name]["memory_after"] = report["after"]
+    return table
+
+
+def load_genomes(timings):
+    return pd.read_csv(fetch('extended_assembly2strain.csv', timings), header="infer",
+                       sep='\t', index_col=1, dtype=str)
+
+
+def load_virulence_factors(timings):
+    return pd.read_csv(fetch('hogs2virulence_factors_with_source.tsv', timings), header=None,
+                       sep='\t',
+                       index_col=0,
+                       names=["query", "eval", "hit_id", "hit_description", "source"])
+
+
+def join_protein_hogs(features, hog_table):
+    """Left join of the feature table onto the HOG table: one row per
+    feature row, with the same integer ids, and the strain-specific
+    defaults filled in for proteins without a HOG.
+    """
+    hog_table = hog_table[~hog_table.index.duplicated()]
+    positions = hog_table.index.get_indexer(features["RefSeq Acc"].to_numpy(dtype=object))
+    missing = positions < 0
+    positions[missing] = 0
+
+    columns = {"RefSeq Acc": features["RefSeq Acc"]}
+    for column in hog_table.columns:
+        values = hog_table[column]
+        default = STRAIN_SPECIFIC if column in STRAIN_SPECIFIC_COLUMNS else None
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = values.cat.categories
+            if default is not None and default not in categories:
+                categories = categories.append(pd.Index([default]))
+            codes = values.cat.codes.to_numpy().astype(np.int32)[positions]
+            codes[missing] = -1 if default is None else categories.get_loc(default)
+            columns[column] = pd.Categorical.from_codes(codes, categories=categories)
+        elif values.dtype.kind in "biuf":
+            # taking from .array keeps nullable integers (and their missing values)
+            taken = values.array.take(positions)
+            taken[missing] = 0
+            columns[column] = taken
+        else:
+            taken = values.to_numpy(dtype=object)[positions]
+            taken[missing] = default
+            columns[column] = taken
+    return pd.DataFrame(columns, index=features.index)
+
+
+def load_protein_hogs(features, hog_table, timings):
+    """The joined protein x HOG table, built once per pair of source tables
+    and memory-mapped like them.
+    """
+    start = time.perf_counter()
+    sources = "{}+{}".format(timings['p_feature_tables.pickle.bz2']["table"],
+                             timings['p_full_annot.pickle.bz2']["table"])
+    columns_dir = Path(CACHE_DIR) / "columns" / "protein_hogs-r{}-{}".format(
+        COLUMNS_REVISION, hashlib.sha256(sources.encode()).hexdigest())
+    table = columnar.load_or_build(columns_dir, lambda: join_protein_hogs(features, hog_table))
+    timings["protein_hogs"] = {"table": columns_dir.name,
+                               "total_s": round(time.perf_counter() - start, 3)}
+    return table
+
+
+def build_composition_table(features, protein_hogs):
+    """Counts of the hue criteria per assembly, split by VIR membership,
+    for the pie and sunburst charts of unfiltered genomes. Like the plots,
+    each protein counts once per assembly.
+    """
+    first = ~pd.DataFrame({"assembly": features["assembly"].to_numpy(),
+                           "protein": protein_hogs["RefSeq Acc"].to_numpy()}).duplicated().to_numpy()
+    return CompositionTable(features["assembly"].iloc[first],
+                            {c: protein_hogs[c].iloc[first] for c in COMPOSITION_COLUMNS},
+                            protein_hogs[VIR_COLUMN].to_numpy()[first])
+
+
+def protein_jitter(accessions):
+    """Stable jitter offset in [-0.25, 0.75) for every accession, seeded
+    from the accession itself so redraws (and cached figures) agree.
+    """
+    accessions = pd.Categorical(accessions)
+    hashes = pd.util.hash_array(np.asarray(accessions.categories, dtype=object))
+    offsets = (hashes >> np.uint64(40)).astype(np.float32) / np.float32(2 ** 24) - np.float32(0.25)
+    offsets = np.append(offsets, np.float32(0))  # missing accessions are not jittered
+    return offsets[accessions.codes]
+
+
+def annotate_virulence_factors(hog_table, hog2vir):
+    """Join VIR membership and the best (lowest e-value) hit of every HOG
+    onto hog_table.
+    """
+    # the published file repeats its header line as a row, so eval is read as text
+    evalues = pd.to_numeric(hog2vir["eval"], errors="coerce")
+    best_hits = hog2vir["hit_description"].iloc[np.argsort(evalues.to_numpy(), kind="stable")]
+    best_hits = best_hits[~best_hits.index.duplicated(keep="first")]
+    positions = best_hits.index.get_indexer(hog_table["hog_id1"].to_numpy(dtype=object))
+    is_hit = positions >= 0
+    hog_table[VIR_COLUMN] = is_hit
+    hog_table[VIR_BEST_HIT_COLUMN] = pd.Categorical(
+        np.where(is_hit, best_hits.to_numpy(dtype=object)[positions], None))
+    return hog_table
+
+
+def load_datasets():
+    """Fetch and prepare all datasets concurrently; runs in the background
+    loader thread.
+    """
+    timings = {}
+    datasets, totals = run_concurrently({
+        "df": lambda: load_table('p_feature_tables.pickle.bz2', timings, prepare_feature_table),
+        "genomes_df": lambda: load_genomes(timings),
+        "hog2vir_df": lambda: load_virulence_factors(timings),
+        "full_hog_table": lambda: load_table('p_full_annot.pickle.bz2', timings),
+    })
+    for key, name in [("df", 'p_feature_tables.pickle.bz2'),
+                      ("genomes_df", 'extended_assembly2strain.csv'),
+                      ("hog2vir_df", 'hogs2virulence_factors_with_source.tsv'),
+                      ("full_hog_table", 'p_full_annot.pickle.bz2')]:
+        timings[name]["total_s"] = totals[key]
+        logger.info("Loaded %s in %.3fs (fetch %.3fs, %d bytes)", name, totals[key],
+                    timings[name]["fetch_s"], timings[name]["bytes"])
+
+    datasets["genomes_dict"] = datasets["genomes_df"].to_dict(orient="index")
+    datasets["protein_hogs"] = load_protein_hogs(datasets["df"], datasets["full_hog_table"], timings)
+    annotate_virulence_factors(datasets["protein_hogs"], datasets["hog2vir_df"])
+    datasets["protein_hogs"][JITTER_COLUMN] = protein_jitter(datasets["protein_hogs"]["RefSeq Acc"])
+    datasets["composition"] = build_composition_table(datasets["df"], datasets["protein_hogs"])
+    datasets["prevalence"] = PrevalenceMatrix(
+        datasets["full_hog_table"],
+        [g for g in group_sizes(datasets["full_hog_table"].columns)
+         if g.rsplit("(", 1)[0] not in SUMMARY_GROUPS])
+    datasets["assembly_partitions"] = datasets["feature_db"] = None
+    if DATA_BACKEND == "sqlite":
+        # df stays mapped for the startup builds below, the callbacks read genomes from SQLite
+        db_path = Path(CACHE_DIR) / "sqlite" / (timings['p_feature_tables.pickle.bz2']["table"] + ".sqlite")
+        if not db_path.is_file():
+            # workers starting together wait for the one building the database
+            with columnar.build_lock(db_path):
+                if not db_path.is_file():
+                    sqlstore.build_database(datasets["df"], db_path)
+        datasets["feature_db"] = sqlstore.FeatureDatabase(db_path)
+    else:
+        datasets["assembly_partitions"] = PartitionIndex(datasets["df"], "assembly")
+    datasets["search_index"] = ProteinSearchIndex(datasets["df"])
+    datasets["timings"] = timings
+    return datasets
+
+
+df = genomes_df = genomes_dict = hog2vir_df = full_hog_table = None
+assembly_partitions = feature_db = search_index = protein_hogs = composition = prevalence = None
+load_timings = {}
+
+
+def publish_datasets(datasets):
+    global df, genomes_df, genomes_dict, hog2vir_df, full_hog_table, load_timings
+    global assembly_partitions, feature_db, search_index, protein_hogs, composition, prevalence
+    df = datasets["df"]
+    genomes_df = datasets["genomes_df"]
+    genomes_dict = datasets["genomes_dict"]
+    hog2vir_df = datasets["hog2vir_df"]
+    full_hog_table = datasets["full_hog_table"]
+    load_timings = datasets["timings"]
+    assembly_partitions = datasets["assembly_partitions"]
+    feature_db = datasets["feature_db"]
+    search_index = datasets["search_index"]
+    protein_hogs = datasets["protein_hogs"]
+    composition = datasets["composition"]
+    prevalence = datasets["prevalence"]
+
+
+data_loader = BackgroundLoader(load_datasets, on_ready=publish_datasets).start()
 
 categories = ["baumannii(55)", "calcoaceticus(4)", "other_acb(34)", "haemolyticus(50)", "baylyi(9)",
           "lwoffii(71)", "brisouii(7)",
@@ -151,6 +427,11 @@ categories = ["baumannii(55)", "calcoaceticus(4)", "other_acb(34)", "haemolyticu
 ################### LAYOUT #########################################
 
 
+def genome_label(assembly_acc):
+    species_name = genomes_dict[assembly_acc]["species_name"]
+    return '{} - {}'.format(" ".join(species_name.split('~', 2)[0:2]), assembly_acc)
+
+
 def create_header():
     navbar = dbc.Navbar(
         [
@@ -184,40 +465,41 @@ def create_header():
 
 ############# BODY ################
 
-Card_genome_selection = dbc.Card([
-        html.P(html.Strong("Search/Select Genome:"),
-               style={"margin-bottom": "0.5rem",
-                      "font-weight": 900}),
-        dcc.Dropdown(
-            id='genome-dropdown',
-            options=[{'label': '{} - {}'.format(" ".join(v["species_name"].split('~', 2)[0:2]), k),
-                      'value': k}
-                     for k, v in genomes_dict.items()
-                     ],
-            value='GCF_000737145.1',
-            clearable=False,
-            searchable=True,
-            optionHeight=35,
-            placeholder="Select/Search Genome"
-        ),
-        html.Div(id="assembly-acc",
-                 style={"display": "none"}
-        ),
-        dbc.Table([
-            html.Tbody([
-            html.Tr([html.Td(['NCBI Taxonomy ID:']), html.Td(id='taxid')]),
-            html.Tr([html.Td(['Corrected Species:']), html.Td(id='assign')]),
-            html.Tr([html.Td(['Sample Year:']), html.Td(id='year')]),
-            html.Tr([html.Td(['Isolated from:']), html.Td(id='isol-site')]),
-            html.Tr(
-                [html.Td(['Publication:']), html.Td(html.A("Link", id='publication', target='_blank'))]),
-            ]),
+def create_genome_selection_card():
+    return dbc.Card([
+            html.P(html.Strong("Search/Select Genome:"),
+                   style={"margin-bottom": "0.5rem",
+                          "font-weight": 900}),
+            dcc.Dropdown(
+                id='genome-dropdown',
+                options=[{'label': genome_label(k),
+                          'value': k}
+                         for k in genomes_dict
+                         ],
+                value='GCF_000737145.1',
+                clearable=False,
+                searchable=True,
+                optionHeight=35,
+                placeholder="Select/Search Genome"
+            ),
+            html.Div(id="assembly-acc",
+                     style={"display": "none"}
+            ),
+            dbc.Table([
+                html.Tbody([
+                html.Tr([html.Td(['NCBI Taxonomy ID:']), html.Td(id='taxid')]),
+                html.Tr([html.Td(['Corrected Species:']), html.Td(id='assign')]),
+                html.Tr([html.Td(['Sample Year:']), html.Td(id='year')]),
+                html.Tr([html.Td(['Isolated from:']), html.Td(id='isol-site')]),
+                html.Tr(
+                    [html.Td(['Publication:']), html.Td(html.A("Link", id='publication', target='_blank'))]),
+                ]),
+                ],
+                style={"margin-top": "0.5rem"},
+            ),
             ],
-            style={"margin-top": "0.5rem"},
-        ),
-        ],
-        body=True,
-    )
+            body=True,
+        )
 
 Card_map = dbc.Card([
         #html.Label('Sampled:'),
@@ -286,6 +568,8 @@ Card_data_table = dbc.Card(
                                     id="modal-xl",
                                     size="xl",
                                 ),
+                                # ids of the selected rows on all pages, the table only knows the current one
+                                dcc.Store(id="selected-row-ids", data=[]),
                                 dash_table.DataTable(
                                     id='datatable-interactivity',
                                     # columns=[
@@ -298,16 +582,17 @@ Card_data_table = dbc.Card(
                                     #style_table={'overflowY': 'scroll'},
                                     # data=df.to_dict('records'),
                                     editable=False,
-                                    filter_action="native",
-                                    sort_action="native",
+                                    # filtering, sorting and paging happen on the server
+                                    filter_action="custom",
+                                    sort_action="custom",
                                     sort_mode="multi",
                                     # column_selectable="single",
                                     row_selectable="multi",
                                     # row_deletable=True,
                                     # selected_rows=list(range(len(df.index))),
-                                    page_action="native",
+                                    page_action="custom",
                                     page_current=0,
-                                    page_size=15,
+                                    page_size=PAGE_SIZE,
                                     style_cell_conditional=[
                                         {
                                             'if': {'column_id': "Sym"},
@@ -400,162 +685,221 @@ Card_genome_browser = dbc.Card(
     outline = True,
 )
 
-Card_scatter_plot_and_controls = dbc.Card([
-    html.Fieldset([
-        html.Div([
+Card_protein_search = dbc.Card(
+                        dbc.CardBody([
+                            html.P("Search the proteins of all genomes by annotation words, gene symbol, " + \
+                                   "locus tag or RefSeq accession (e.g. OXA-23, blaOXA, WP_000446781). " + \
+                                   "Genomes are ranked by their best matching protein; " + \
+                                   "click a genome to select it.",
+                                   className="text-secondary"),
+                            dbc.InputGroup([
+                                dbc.Input(id="protein-search-input",
+                                          placeholder="OXA-23-like, WP_000446781.1, ...",
+                                          debounce=True),
+                                dbc.InputGroupAddon(
+                                    dbc.Button("Search", id="protein-search-button", className="btn btn-secondary"),
+                                    addon_type="append",
+                                ),
+                                dbc.InputGroupAddon(
+                                    dbc.Button("Cancel", id="protein-search-cancel", className="btn btn-light",
+                                               disabled=True),
+                                    addon_type="append",
+                                ),
+                            ],
+                                style={"margin-bottom": 10},
+                            ),
+                            dbc.Progress(id="protein-search-progress", value=0, max=1, striped=True,
+                                         style={"height": "4px", "margin-bottom": 10}),
+                            html.P(id="protein-search-summary", className="text-secondary"),
+                            dash_table.DataTable(
+                                id='protein-search-results',
+                                columns=[{"name": "Genome", "id": "Genome"},
+                                         {"name": "#Hits", "id": "Hits"},
+                                         {"name": "Score", "id": "Score"},
+                                         {"name": "Best matching proteins", "id": "Proteins"}],
+                                data=[],
+                                page_action="native",
+                                page_size=PAGE_SIZE,
+                                style_cell={
+                                    'overflow': 'hidden',
+                                    'textOverflow': 'ellipsis',
+                                    'maxWidth': 0,
+                                    'font-size': '12px',
+                                    'textAlign': 'left',
+                                },
+                                style_cell_conditional=[
+                                    {'if': {'column_id': "Hits"}, "width": "6%"},
+                                    {'if': {'column_id': "Score"}, "width": "6%"},
+                                    {'if': {'column_id': "Genome"}, "width": "28%"},
+                                ],
+                                style_header={
+                                    'backgroundColor': 'rgb(230, 230, 230)',
+                                    'fontWeight': 'bold',
+                                },
+                            ),
+                        ]),
+    className="mb-3",
+)
+
+def create_scatter_plot_card():
+    return dbc.Card([
+        html.Fieldset([
             html.Div([
-                html.Label('Taxonomic Range (Y-Axis):'),
-                dcc.Dropdown(
-                    id='y-axis',
-                    options=[{'label': k,
-                              'value': k}
-                             for k in [cat for cat in full_hog_table.columns
-                                       if '(' in cat
-                                       ]
-                             ],
-                    value='complete_acb(93)',
-                    clearable=False,
-                    searchable=True,
-                    optionHeight=25,
-                    placeholder="Select Taxonomic Group"
+                html.Div([
+                    html.Label('Taxonomic Range (Y-Axis):'),
+                    dcc.Dropdown(
+                        id='y-axis',
+                        options=[{'label': k,
+                                  'value': k}
+                                 for k in taxonomic_ranges()
+                                 ],
+                        value='complete_acb(93)',
+                        clearable=False,
+                        searchable=True,
+                        optionHeight=25,
+                        placeholder="Select Taxonomic Group"
+                    ),
+                ],
+                style={'width': '48%', 'display': 'inline-block'}
                 ),
-            ],
-            style={'width': '48%', 'display': 'inline-block'}
+                html.Div([
+                    html.Label('Taxonomic Range (X-Axis):'),
+                    dcc.Dropdown(
+                        id='x-axis',
+                        options=[{'label': k,
+                                  'value': k}
+                                 for k in taxonomic_ranges()
+                                 ],
+                        value='other(141)',
+                        clearable=False,
+                        searchable=True,
+                        optionHeight=25,
+                        placeholder="Select Taxonomic Group"
+                    )
+                    ],
+                    style={'width': '48%', 'float': 'right', 'display': 'inline-block'}
+                )
+                ],
+                className="form-group",
             ),
+
             html.Div([
-                html.Label('Taxonomic Range (X-Axis):'),
-                dcc.Dropdown(
-                    id='x-axis',
-                    options=[{'label': k,
-                              'value': k}
-                             for k in [cat for cat in full_hog_table.columns
-                                       if '(' in cat
-                                       ]
-                             ],
-                    value='other(141)',
-                    clearable=False,
-                    searchable=True,
-                    optionHeight=25,
-                    placeholder="Select Taxonomic Group"
-                )
+                html.Label('Color By:',
+                           style={'margin-right':'4px'}
+                ),
+                dcc.RadioItems(
+                    id='hue-criterion-radio',
+                    options=[
+                        {'label': 'Genus-level Core/Pan Genome', 'value': 'aci_core231_of_234'},
+                        {'label': "Phylostratum Gained", 'value': 'gained_at'},
+                    ],
+                    value='aci_core231_of_234',
+                    labelStyle={'display': 'inline-block', 'padding-left': '0.85rem',
+                                'vertical-align': 'top'},
+                    style={'float':'right', 'display': 'block'},
+                    inputStyle={"margin-right": "0.3rem"}
+                ),
                 ],
-                style={'width': '48%', 'float': 'right', 'display': 'inline-block'}
-            )
-            ],
-            className="form-group",
-        ),
+                className="custom control custom-radio",
+                style={#"min-height": "1.3125rem",
+                        #"padding-left": "1.5rem",
+                        #"box-sizing": "border-box",
+                        "text-align": "left",
+                        "display": 'inline-block'
+                        #"line-height": 1.5
+                }
 
-        html.Div([
-            html.Label('Color By:',
-                       style={'margin-right':'4px'}
             ),
-            dcc.RadioItems(
-                id='hue-criterion-radio',
+            dcc.Checklist(
                 options=[
-                    {'label': 'Genus-level Core/Pan Genome', 'value': 'aci_core231_of_234'},
-                    {'label': "Phylostratum Gained", 'value': 'gained_at'},
+                    {'label': ' Highlight known virulence factors (hits in databases)', 'value': 'VIR'},
+                    # {'label': 'Montréal', 'value': 'MTL'},
+                    # {'label': 'San Francisco', 'value': 'SF'}
                 ],
-                value='aci_core231_of_234',
-                labelStyle={'display': 'inline-block', 'padding-left': '0.85rem',
-                            'vertical-align': 'top'},
-                style={'float':'right', 'display': 'block'},
-                inputStyle={"margin-right": "0.3rem"}
-            ),
-            ],
-            className="custom control custom-radio",
-            style={#"min-height": "1.3125rem",
-                    #"padding-left": "1.5rem",
-                    #"box-sizing": "border-box",
-                    "text-align": "left",
-                    "display": 'inline-block'
-                    #"line-height": 1.5
-            }
-
+                id="highlights-checkb",
+                value=[],
+                inputStyle={"margin-right": "0.3rem"},
+                labelStyle={'vertical-align': 'top',
+                           }
+            )
+        ]
         ),
-        dcc.Checklist(
-            options=[
-                {'label': ' Highlight known virulence factors (hits in databases)', 'value': 'VIR'},
-                # {'label': 'Montréal', 'value': 'MTL'},
-                # {'label': 'San Francisco', 'value': 'SF'}
-            ],
-            id="highlights-checkb",
-            value=[],
-            inputStyle={"margin-right": "0.3rem"},
-            labelStyle={'vertical-align': 'top',
-                       }
-        )
-    ]
-    ),
-    html.Div(
-        children=[
-            dbc.Spinner([
-                dcc.Graph(
-                    id="graph-0",
-                    config={"modeBarButtonsToRemove": ['toggleSpikelines', 'autoScale2d', 'hoverClosestCartesian']}
-                )
-            ], id="loading-spinner", color="primary", type="border"),  # Spinner
-        ],
-    ),
-    html.Div([
         html.Div(
-            daq.BooleanSwitch(
-                id="jitter-option",
-                on=False,
-                label = {'label': "add jitter x ± [0, .25] to resolve overlaps",
-                        "style": {'font-size':'12px'} #this must be part of a label object
-                        },
-                color='#158cba',
-                labelPosition="right",
-            ),
-            className='custom-control custom-switch',
-            style={'z-index': 1,
-                   'width': '42%',
-                   'display': 'inline-block',
-                  }
+            children=[
+                dbc.Spinner([
+                    dcc.Graph(
+                        id="graph-0",
+                        config={"modeBarButtonsToRemove": ['toggleSpikelines', 'autoScale2d', 'hoverClosestCartesian']}
+                    )
+                ], id="loading-spinner", color="primary", type="border"),  # Spinner
+                # identifies the set of rows shown in the genome figures
+                dcc.Store(id="genome-rows"),
+                # their proteins and the figure colours, for the clientside scatter and pie
+                dcc.Store(id="genome-points"),
+                dcc.Store(id="figure-style", data=figures.figure_style(CMAP)),
+            ],
         ),
         html.Div([
             html.Div(
-                id='selected_data_points',
-                style={"display": "none"}
+                daq.BooleanSwitch(
+                    id="jitter-option",
+                    on=False,
+                    label = {'label': "add jitter x ± [0, .25] to resolve overlaps",
+                            "style": {'font-size':'12px'} #this must be part of a label object
+                            },
+                    color='#158cba',
+                    labelPosition="right",
+                ),
+                className='custom-control custom-switch',
+                style={'z-index': 1,
+                       'width': '42%',
+                       'display': 'inline-block',
+                      }
             ),
-            #dbc.Button('KUCKUCK')
+            html.Div([
+                html.Div(
+                    id='selected_data_points',
+                    style={"display": "none"}
+                ),
+                #dbc.Button('KUCKUCK')
+                ],
+                style={'z-index': 1,
+                       'width': '42%',
+                       'display': 'inline-block',
+                       'float': 'right'}
+            )
             ],
-            style={'z-index': 1,
-                   'width': '42%',
-                   'display': 'inline-block',
-                   'float': 'right'}
-        )
+            style={'display':'inline-block', 'position':'relative', 'margin-top': '10px'}
+        ),
+        html.Div(html.P("Click on a datapoint to select a protein. On selection, enriched protein annotation and orthologous-group specific information " + \
+                 "are displayed in the cards shown below. Also, the selected protein and its genomic context are highlighted in the tabular view above. " + \
+                 "Beware, without jittering, a point may reflect several proteins sharing the exact same coordinates. " + \
+                 "Single-click on a legend entry deselect the class of data points, double-click focuses on it. " + \
+                 "On hover, you will find tools for navigation. Additionally, you may select a group of interest. Simply choose" + \
+                 " the 'lasso' or 'box select' tool, select the data points to open the filter window."),
+                 style={"width": "100%",
+                        "float": "left",
+                        "margin-right": "20px",
+                        "margin-top": "20px",
+                        "font-size": "0.875rem",
+                        # "border": "1px solid red"
+                        },
+                 className="text-secondary"
+        ),
         ],
-        style={'display':'inline-block', 'position':'relative', 'margin-top': '10px'}
-    ),
-    html.Div(html.P("Click on a datapoint to select a protein. On selection, enriched protein annotation and orthologous-group specific information " + \
-             "are displayed in the cards shown below. Also, the selected protein and its genomic context are highlighted in the tabular view above. " + \
-             "Beware, without jittering, a point may reflect several proteins sharing the exact same coordinates. " + \
-             "Single-click on a legend entry deselect the class of data points, double-click focuses on it. " + \
-             "On hover, you will find tools for navigation. Additionally, you may select a group of interest. Simply choose" + \
-             " the 'lasso' or 'box select' tool, select the data points to open the filter window."),
-             style={"width": "100%",
-                    "float": "left",
-                    "margin-right": "20px",
-                    "margin-top": "20px",
-                    "font-size": "0.875rem",
-                    # "border": "1px solid red"
-                    },
-             className="text-secondary"
-    ),
-    ],
-    body=True,
-    style={'font-size': '12px'}
-)
+        body=True,
+        style={'font-size': '12px'}
+    )
 
 
-content_first_row = dbc.CardDeck(
-    [Card_genome_selection,
-     Card_map
-     ],
-    style = {"margin-bottom": 20,
-             "margin-top": 20},
-)
+def create_content_first_row():
+    return dbc.CardDeck(
+        [create_genome_selection_card(),
+         Card_map
+         ],
+        style = {"margin-bottom": 20,
+                 "margin-top": 20},
+    )
 
 content_second_row = dbc.Row([
     dbc.Col([
@@ -571,6 +915,11 @@ content_second_row = dbc.Row([
             ],
                 label="Proteins: Genome View",
             ),
+            dbc.Tab([
+                Card_protein_search,
+            ],
+                label="Proteins: Genus-wide Search",
+            ),
         ]
         ),
     ],
@@ -769,21 +1118,22 @@ Card_additional_annotations_table = dbc.Card([
                     html.Div(id='selected-data')
                     ],
                 )
-content_third_row =         dbc.Row([
-            dbc.Col(
-                Card_scatter_plot_and_controls,
-                lg={'size': 9, 'offset': 0, 'order': 1},
-                style={"margin-bottom": 20},
-            ),
-            dbc.Col([
-                Card_pan_accessory_pie_chart,
-                Card_sunburst_chart,
-                ],
-                lg={'size': 3, 'offset': 0, 'order': 2},
-                # width=2
-            ),
-        ]
-        )
+def create_content_third_row():
+    return dbc.Row([
+                dbc.Col(
+                    create_scatter_plot_card(),
+                    lg={'size': 9, 'offset': 0, 'order': 1},
+                    style={"margin-bottom": 20},
+                ),
+                dbc.Col([
+                    Card_pan_accessory_pie_chart,
+                    Card_sunburst_chart,
+                    ],
+                    lg={'size': 3, 'offset': 0, 'order': 2},
+                    # width=2
+                ),
+            ]
+            )
 
 content_fourth_row =         dbc.Row([
             dbc.Col(
@@ -802,9 +1152,9 @@ content_fourth_row =         dbc.Row([
 def create_content():
     content = html.Div(
         children=[
-            content_first_row,
+            create_content_first_row(),
             content_second_row,
-            content_third_row,
+            create_content_third_row(),
             content_fourth_row
         ],
     )
@@ -825,9 +1175,35 @@ def create_footer():
     return footer
 
 
+def create_loading_content():
+    if data_loader.state == FAILED:
+        message = "The datasets could not be loaded. Please try again later."
+    else:
+        message = "Loading datasets, the dashboard will appear in a moment..."
+    content = html.Div(
+        children=[
+            dbc.Card(
+                dbc.CardBody([
+                    dbc.Spinner(color="primary", type="border") if data_loader.state != FAILED else None,
+                    html.P(message, id="loading-message", className="text-secondary",
+                           style={"margin-top": "1rem"}),
+                ]),
+                style={"margin-bottom": 20,
+                       "margin-top": 20,
+                       "text-align": "center"},
+            ),
+            dcc.Interval(id="loading-poll", interval=2000, disabled=data_loader.state == FAILED),
+        ],
+    )
+    return content
+
+
 def serve_layout():
     layout = html.Div(
-        children=[create_header(), create_content(), create_footer(),
+        children=[create_header(),
+                  html.Div(create_content() if data_loader.ready else create_loading_content(),
+                           id="page-content"),
+                  create_footer(),
                   ],
         className="container",
         style={'background-color': '#f2f2f2'}
@@ -835,6 +1211,32 @@ def serve_layout():
     return layout
 
 app.layout = serve_layout
+
+
+@app.callback(
+    [Output('page-content', 'children'),
+     Output('loading-poll', 'disabled')],
+    [Input('loading-poll', 'n_intervals')])
+def swap_in_content(n_intervals):
+    if data_loader.ready:
+        return create_content(), True
+    if data_loader.state == FAILED:
+        return create_loading_content(), True
+    raise PreventUpdate()
+
+
+@server.route("/healthz")
+def healthz():
+    # liveness: the process is up; a failed load should get the worker restarted
+    status = data_loader.status()
+    return jsonify(status), 500 if data_loader.state == FAILED else 200
+
+
+@server.route("/readyz")
+def readyz():
+    status = data_loader.status()
+    status["datasets"] = load_timings
+    return jsonify(status), 200 if data_loader.ready else 503
 #server = app.server
 
 # for js in external_js:
@@ -845,6 +1247,54 @@ app.layout = serve_layout
 
 ################### STATIC ############################
 
+# genome figures by row set and options, per worker
+figure_cache = FigureCache(FIGURE_CACHE_BYTES)
+# accession -> row position maps of the recently clicked table views
+position_maps = FigureCache(16 * 2 ** 20, sizeof=lambda position_map: position_map.nbytes)
+
+callback_metrics.instrument(app, caches={"figures": figure_cache, "positions": position_maps})
+
+tracemalloc_diff = TracemallocDiff()
+
+
+@server.route("/debug/memory")
+def debug_memory():
+    """Memory held by the datasets, caches and indexes of this worker.
+
+    Requires an "Authorization: Bearer <SECRET_KEY>" header. With
+    ?tracemalloc=N the top N allocation differences since the previous
+    such request are included (the first one starts tracing),
+    ?tracemalloc=stop stops tracing.
+    """
+    token = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(token.encode(), "Bearer {}".format(server.secret_key).encode()):
+        return jsonify({"error": "forbidden"}), 403
+
+    report = {"process": process_memory(),
+              "loader": data_loader.status(),
+              "frames": {name: frame_usage(frame) for name, frame in
+                         [("df", df), ("full_hog_table", full_hog_table), ("genomes_df", genomes_df),
+                          ("hog2vir_df", hog2vir_df), ("protein_hogs", protein_hogs)]},
+              "indexes": {name: None if index is None else int(index.nbytes) for name, index in
+                          [("assembly_partitions", assembly_partitions), ("search_index", search_index),
+                           ("composition", composition), ("prevalence", prevalence)]},
+              "caches": {"figures": figure_cache.stats(),
+                         "positions": position_maps.stats(),
+                         "jobs": {"bytes": background_callback_manager.handle.volume()}}}
+    if feature_db is not None:
+        report["indexes"]["feature_db_file"] = feature_db.db_path.stat().st_size
+
+    option = request.args.get("tracemalloc")
+    if option == "stop":
+        report["tracemalloc"] = tracemalloc_diff.stop()
+    elif option is not None:
+        try:
+            limit = int(option or 10)
+        except ValueError:
+            return jsonify({"error": "tracemalloc must be a number or 'stop'"}), 400
+        report["tracemalloc"] = tracemalloc_diff.diff(limit)
+    return jsonify(report)
+
 CMAP = {'QI clade': px.colors.sequential.Greens[1],
         'BR clade': px.colors.sequential.Greens[2],
         'LW clade': px.colors.sequential.Greens[3],
@@ -871,6 +1321,7 @@ CMAP = {'QI clade': px.colors.sequential.Greens[1],
      Output('location-text', "children"),
      Output('assembly-acc', "children")],
     [Input('genome-dropdown', 'value')])
+@callback_metrics.measure
 def update_map(assembly_acc):
     # print("UPDATE_MAP", assembly_acc)
     gf = genomes_df.loc[assembly_acc]
@@ -884,24 +1335,25 @@ def update_map(assembly_acc):
     if pd.isnull(gf.loc["publication"]):
         gf.loc["publication"] = '#'
 
-    fig = px.choropleth(gf.to_frame().T, locations="iso_alpha3",
-                        locationmode="ISO-3",
-                        # color="lifeExp",  # lifeExp is a column of gapminder
-                        # hover_name="country",  # column to add to hover information,
-                        hover_data=["country", "location", "year"],
-                        color = ['sampled_country'],
-                        scope=gf.loc["scope"],
-                        projection='equirectangular',
-                        )
-
-    fig.layout.update(showlegend=False,
-                      height=280,
-                      #title='Sampled in {}, {}'.format(gf.loc["location"], gf.loc["country"]),
-                      margin=dict(l=0, r=0, t=0, b=0),
-                      #config = {"frameMargins": 0}
-                      )
+    with callback_metrics.phase("figure"):
+        fig = px.choropleth(gf.to_frame().T, locations="iso_alpha3",
+                            locationmode="ISO-3",
+                            # color="lifeExp",  # lifeExp is a column of gapminder
+                            # hover_name="country",  # column to add to hover information,
+                            hover_data=["country", "location", "year"],
+                            color = ['sampled_country'],
+                            scope=gf.loc["scope"],
+                            projection='equirectangular',
+                            )
+
+        fig.layout.update(showlegend=False,
+                          height=280,
+                          #title='Sampled in {}, {}'.format(gf.loc["location"], gf.loc["country"]),
+                          margin=dict(l=0, r=0, t=0, b=0),
+                          #config = {"frameMargins": 0}
+                          )
 
-    fig.update_traces(showscale=False)
+        fig.update_traces(showscale=False)
 
     # fig.layout.update(height=700)
     return fig, gf.loc["tax_id"], gf.loc["additions_and_corrections"], \
@@ -909,218 +1361,256 @@ def update_map(assembly_acc):
            'Sampled at: {}, {}'.format(gf.loc["location"], gf.loc["country"]), \
            assembly_acc
 
+def filter_rows(dff, filter_query):
+    try:
+        return filtering.filter_frame(dff, filter_query)
+    except FilterQueryError:
+        # the DataTable marks invalid queries itself, show the rows unfiltered
+        return dff
+
+
+def genome_rows(assembly_acc):
+    """All features of one genome from the configured DATA_BACKEND.
+    """
+    if feature_db is not None:
+        return feature_db.assembly_rows(assembly_acc)
+    return assembly_partitions.rows(assembly_acc)
+
+
+def genome_view(assembly_acc, filter_query=None, sort_by=None):
+    """Rows of one genome as ordered in the table: filtered, then sorted.
+    """
+    dff = filter_rows(genome_rows(assembly_acc), filter_query)
+    return filtering.sort_frame(dff, sort_by)
+
+
 @app.callback(
     #[
     [Output('datatable-interactivity', "data"),
+     Output('datatable-interactivity', "page_count"),
+     Output('datatable-interactivity', "selected_rows"),
      #Output('datatable-interactivity', "derived_virtual_selected_row_ids")],
     Output('graph-0', 'selectedData'),
      Output('datatable-interactivity','derived_filter_query_structure')],
-    [Input('assembly-acc', "children")],
-    [State("user_protein_acc", "value")])
-def update_table(assembly_acc, selprots):
+    [Input('assembly-acc', "children"),
+     Input('datatable-interactivity', "page_current"),
+     Input('datatable-interactivity', "page_size"),
+     Input('datatable-interactivity', "sort_by"),
+     Input('datatable-interactivity', "filter_query")],
+    [State("user_protein_acc", "value"),
+     State('selected-row-ids', 'data')])
+@callback_metrics.measure
+def update_table(assembly_acc, page_current, page_size, sort_by, filter_query, selprots, selected_row_ids):
     # print("UPDATE_TABLE", assembly_acc, selprots )
-    # con = sqlite3.connect("db_aci.sqlite")
-    # sql = "SELECT * from feat_tables WHERE assembly = '{}';".format(assembly_acc)
-    # dff = pd.read_sql_query(sql, con)
-    dff = df[df["assembly"]==assembly_acc]
+    dff = genome_view(assembly_acc, filter_query, sort_by)
+    # page_current is owned by display_click_data, which moves the table to
+    # the first page on a new genome, filter or sort order; until that
+    # arrives the last page is shown for a page beyond the (filtered) rows
+    page, page_count = filtering.page_frame(dff, page_current, page_size)
+
+    # only a genome change resets the selections, paging/sorting/filtering keeps them
+    triggered = [t['prop_id'] for t in callback_context.triggered]
+    if 'assembly-acc.children' in triggered or triggered == ['.']:
+        return page.to_dict("records"), page_count, [], None, None
+    # selected_rows are positions in the page, tick the selected rows of this one
+    selected_rows = np.flatnonzero(page.index.isin(selected_row_ids or [])).tolist()
+    return page.to_dict("records"), page_count, selected_rows, no_update, no_update
 
-    if len(dff.index) < 1:
-        return dff.to_dict("records"), None, None
-            #, []
-    return dff.to_dict("records"), None, None
-        #, dff.index
 
 @app.callback(
-    [Output('set_composi_graph', 'figure'),
-     Output('set_composi_graph2', 'figure'),
-     Output('graph-0', 'figure')],
-    [Input('hue-criterion-radio', "value"),
-     Input('x-axis', "value"),
-     Input('y-axis', "value"),
-     Input('jitter-option', "on"),
-     Input('highlights-checkb', "value"),
-     Input('assembly-acc', "children"),
-     Input('datatable-interactivity', 'derived_virtual_row_ids'),
-     Input('datatable-interactivity', 'derived_virtual_selected_row_ids'),
-     #Input('datatable-interactivity', 'active_cell')
-     ])
-def update_genome_info(hue_criterion, x_axis_category, y_axis_category, jitter, highlight,
-                       assembly_acc, row_ids, selected_row_ids
-                       #active_cell
-                       ):
-    # print("update_genome_info", hue_criterion, x_axis_category, y_axis_category, jitter, highlight, assembly_acc)
+    Output('selected-row-ids', 'data'),
+    [Input('datatable-interactivity', 'selected_row_ids'),
+     Input('assembly-acc', "children")],
+    [State('datatable-interactivity', 'data'),
+     State('selected-row-ids', 'data')])
+def update_selected_row_ids(page_selected_row_ids, assembly_acc, page_rows, selected_row_ids):
+    """Selected row ids of all pages: those of the current page replaced by
+    its selected_row_ids.
+    """
+    triggered = [t['prop_id'] for t in callback_context.triggered]
+    if 'assembly-acc.children' in triggered:
+        selection = []
+    else:
+        page_ids = {row["id"] for row in page_rows or []}
+        selection = sorted({i for i in selected_row_ids or [] if i not in page_ids} |
+                           set(page_selected_row_ids or []))
+    if selection == (selected_row_ids or []):
+        raise PreventUpdate
+    return selection
+
+
+def genome_figure_rows(assembly_acc, filter_query, selected_row_ids):
+    """Rows of one genome shown in the figures (filtered, then narrowed to
+    the selection) and the number of rows of the whole genome.
+    """
     # only selected genome
-    dff = df[df["assembly"]==assembly_acc]
-    #ctx = callback_context
-    #print(ctx.triggered[0]['prop_id'])
-    #    if ctx.triggered[0]['prop_id'] == 'assembly-acc.children':
+    dff = genome_rows(assembly_acc)
     genome_set_size = len(dff.index)
-
     # only filtered rows
-    if row_ids:
-        dff = dff.loc[dff.index.intersection(row_ids)] # since .loc does not allow for missing indexes
+    dff = filter_rows(dff, filter_query)
     # only selected rows
     if selected_row_ids:
         dff = dff.loc[dff.index.intersection(selected_row_ids)]
-    # if not active_cell is None:
-    #     print("Active Cell:", active_cell)
-    #     active_row_index = active_cell["row_id"]
-    #     if not active_row_index in dff.index:
-    #         active_row_index = None
-    # else:
-    #     active_row_index = None
-
-    proteins = dff["RefSeq Acc"].tolist()
-    hog_table = full_hog_table.loc[full_hog_table.index.intersection(proteins)]
-
-    strain_specifics = set(proteins).difference(hog_table.index)
-    strain_specific_vals = []
-    for c in hog_table.columns:
-        if c in ['gained_at', 'aci_core231_of_234', 'acb_core91_of_93']:
-            strain_specific_vals.append("Strain specific")
-        else:
-            strain_specific_vals.append(0)
-    ss_vals_array = [strain_specific_vals] * len(list(strain_specifics))
-    hog_table = pd.concat([hog_table, pd.DataFrame(ss_vals_array,
-                                                   columns=hog_table.columns,
-                                                   index=list(strain_specifics))])
-
-    # Pie Chart Prep
+    return dff, genome_set_size
 
-    stats = hog_table.groupby(hue_criterion).size().reset_index(name='counts')
 
-    cmap = CMAP
-
-    category_orders = {
-        "aci_core231_of_234" : ['Core', 'Accessory','Strain specific']
-    }
-
-    if len(dff.index) == genome_set_size:
-        pie_chart_header="#Proteins: {} (all)".format(len(dff.index))
-    else:
-        pie_chart_header="#Proteins: {}".format(len(dff.index))
-
-    pie_fig = px.pie(stats, values='counts', names=hue_criterion, title=pie_chart_header,
-                 color=hue_criterion, color_discrete_map=cmap)
-
-    pie_fig.layout.update(
-                      height=280,
-                      #title='Sampled in {}, {}'.format(gf.loc["location"], gf.loc["country"]),
-                      margin=dict(l=0, r=0, t=0, b=0),
-                      legend=dict(
-                            orientation="v",
-                            yanchor="bottom",
-                            y=-0.2,
-                            xanchor="right",
-                            x=1
-                      ),
-                      # showlegend=False,
-                      )
+@app.callback(
+    [Output('genome-rows', 'data'),
+     Output('genome-points', 'data')],
+    [Input('assembly-acc', "children"),
+     Input('datatable-interactivity', 'filter_query'),
+     Input('selected-row-ids', 'data')],
+    [State('genome-rows', 'data')])
+@callback_metrics.measure
+def update_genome_rows(assembly_acc, filter_query, selected_row_ids, current_rows):
+    # a filter can match the same rows as the previous one and a selection
+    # can lie outside the filtered rows, so the figures are only redrawn
+    # when the fingerprint of the sorted row ids changes
+    dff, genome_set_size = genome_figure_rows(assembly_acc, filter_query, selected_row_ids)
+    rows = {"assembly": assembly_acc,
+            "size": genome_set_size,
+            "count": len(dff.index),
+            "fingerprint": fingerprint(np.sort(dff.index.to_numpy()))}
+    if rows == current_rows:
+        raise PreventUpdate
+    # sent once per set of rows, the scatter and pie are drawn from it clientside
+    points = figure_cache.get_or_compute((assembly_acc, genome_set_size, rows["fingerprint"], "points"),
+                                         lambda: genome_point_data(dff))
+    return rows, dict(rows, **points)
+
+
+def taxonomic_ranges():
+    # the prevalence count columns, e.g. "baumannii(55)"
+    return [cat for cat in full_hog_table.columns if '(' in cat]
+
+
+def genome_point_data(dff):
+    """Columnar data of the proteins of dff for the clientside figures.
+    """
+    with callback_metrics.phase("figure"):
+        return figures.genome_points(genome_hog_table(dff), taxonomic_ranges(), COMPOSITION_COLUMNS,
+                                     HIGHLIGHT_COLUMNS, JITTER_COLUMN)
 
-    pie_fig.update_layout(
-        font_family= '"Source Sans Pro", -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif, "Apple Color Emoji", "Segoe UI Emoji", "Segoe UI Symbol"',
-        #font_size="1.3125rem",
-        font_color='#222222',
-        #title_font_family="Times New Roman",
-        #title_font_color="red",
-        #legend_title_font_color="green"
-    )
 
-    ## add jitter
-    if jitter:
-        hog_table[x_axis_category] = hog_table[x_axis_category].dropna().astype(int).apply(lambda n: n+(random.random_sample()-0.25))
-
-    scatter_fig = px.scatter(hog_table,
-                      y=y_axis_category, #"complete_acb(93)",
-                      x=x_axis_category, #"other(141)",
-                      color=hue_criterion,
-                      marginal_y="box",
-                      # marginal_x="box", #trendline="ols",
-                      color_discrete_map=cmap,
-                      custom_data=[hog_table.index],#needs to be as list as its arrayed(?)
-                      template="simple_white"
-                      )
+def cached_genome_figure(rows, filter_query, selected_row_ids, options, create):
+    """Figure of the genome rows identified by rows, built by
+    create(dff, genome_set_size) unless cached for the same options.
+    """
+    if rows is None:
+        raise PreventUpdate
+    key = (rows["assembly"], rows["size"], rows["fingerprint"]) + options
 
-    scatter_fig.layout.update(
-        clickmode='event+select',
-        #showlegend=False,
-        #height=300,
-        #title='Sampled in {}, {}'.format(gf.loc["location"], gf.loc["country"]),
-        margin=dict(l=0, r=0, t=40, b=0),
-        legend_title_text="",
-        height=500
-        #config = {"frameMargins": 0}
-        )
+    def compute():
+        dff, genome_set_size = genome_figure_rows(rows["assembly"], filter_query, selected_row_ids)
+        with callback_metrics.phase("figure"):
+            return create(dff, genome_set_size)
+    return figure_cache.get_or_compute(key, compute)
 
-    scatter_fig.update_traces(notched=False, selector=dict(type='box'))
-
-    ### highlight vir factors
-    if len(highlight) != 0: #list of possibly multiple features to be highlighted
-        for i in highlight:
-            a_list = [i if hog in hog2vir_df.index else float("NaN") for hog in hog_table['hog_id1'].to_list()]
-            #a_list = {v: (i if v in hog2vir_df.index else nan) for v in hog_table['hog_id1'].to_list()}
-            hog_table[i] = a_list
-            hog_table[i].fillna(hog_table[hue_criterion], inplace=True)
-
-        scatter_fig2 = px.scatter(hog_table,
-                          y=y_axis_category,  # "complete_acb(93)",
-                          x=x_axis_category,  # "other(141)",
-                          color=i,
-                          marginal_y="box",
-                          # marginal_x="box", #trendline="ols",
-                          color_discrete_map=cmap,
-                          custom_data=[hog_table.index],  # needs to be as list as its arrayed(?)
-                          template="simple_white"
-                          )
 
-        scatter_fig2.update_layout(clickmode='event+select')
+app.clientside_callback(
+    ClientsideFunction(namespace="aci_dash", function_name="renderPie"),
+    Output('set_composi_graph', 'figure'),
+    [Input('genome-points', 'data'),
+     Input('hue-criterion-radio', "value")],
+    [State('figure-style', 'data')])
 
-        scatter_fig2.layout.update(
-            margin=dict(l=0, r=0, t=40, b=0),
-            legend_title_text="",
-            height=500,
-            # config = {"frameMargins": 0}
-            )
 
-        scatter_fig2.update_traces(notched=False, selector=dict(type='box'))
+@app.callback(
+    Output('set_composi_graph2', 'figure'),
+    [Input('genome-rows', 'data'),
+     Input('hue-criterion-radio', "value"),
+     Input('highlights-checkb', "value")],
+    [State('datatable-interactivity', 'filter_query'),
+     State('selected-row-ids', 'data')])
+@callback_metrics.measure
+def update_composition_sunburst(rows, hue_criterion, highlight, filter_query, selected_row_ids):
+    if not highlight:
+        return create_empty_sunburst()
+    return cached_genome_figure(rows, filter_query, selected_row_ids,
+                                ("sunburst", hue_criterion, tuple(highlight)),
+                                lambda dff, genome_set_size: create_sunburst(
+                                    dff, rows["assembly"], genome_set_size, hue_criterion, highlight))
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace="aci_dash", function_name="renderScatter"),
+    Output('graph-0', 'figure'),
+    [Input('genome-points', 'data'),
+     Input('hue-criterion-radio', "value"),
+     Input('x-axis', "value"),
+     Input('y-axis', "value"),
+     Input('jitter-option', "on"),
+     Input('highlights-checkb', "value")],
+    [State('figure-style', 'data')])
 
-        stats2 = hog_table.groupby([hue_criterion, i]).size().reset_index(name='counts')
 
-        sunburst_fig3 = px.sunburst(stats2, path=[hue_criterion,i], values='counts', color=i,
-                           color_discrete_map=cmap)
+def composition_stats(categories, counts, hue_criterion, highlight=None):
+    """Count frames of the hue categories and, for a highlight, of the
+    sunburst from an (n_categories, 2) array of non-highlighted/highlighted
+    counts.
+    """
+    categories = np.asarray(categories, dtype=object)
+    totals = counts.sum(axis=1)
+    stats = pd.DataFrame({hue_criterion: categories[totals > 0], 'counts': totals[totals > 0]})
+    if highlight is None:
+        return stats, None
+    plain, highlighted = counts[:, 0] > 0, counts[:, 1] > 0
+    stats2 = pd.concat([
+        pd.DataFrame({hue_criterion: categories[plain], highlight: categories[plain],
+                      'counts': counts[plain, 0]}),
+        pd.DataFrame({hue_criterion: categories[highlighted], highlight: highlight,
+                      'counts': counts[highlighted, 1]})
+    ]).sort_values([hue_criterion, highlight], kind="stable", ignore_index=True)
+    return stats, stats2
+
+
+def genome_hog_table(dff):
+    # one row per protein, indexed by accession for the plots' custom data
+    hog_table = protein_hogs.loc[dff.index]
+    return hog_table[~hog_table["RefSeq Acc"].duplicated()].set_index("RefSeq Acc")
+
+
+def genome_composition(dff, assembly_acc, genome_set_size, hue_criterion, highlight):
+    """(categories, counts) of hue_criterion split by membership in the last
+    highlight option (VIR without one), precomputed for whole genomes.
+    """
+    # only the last highlight option is broken down in the sunburst
+    flag_column = HIGHLIGHT_COLUMNS[highlight[-1]] if highlight else VIR_COLUMN
+    if len(dff.index) == genome_set_size and flag_column == VIR_COLUMN:
+        precomputed = composition.get(assembly_acc, hue_criterion)
+        if precomputed is not None:
+            return precomputed
+    hog_table = genome_hog_table(dff)
+    hue_values = pd.Categorical(hog_table[hue_criterion])
+    return hue_values.categories, category_counts(hue_values.codes, len(hue_values.categories),
+                                                  hog_table[flag_column].to_numpy(dtype=bool))
+
+
+def create_sunburst(dff, assembly_acc, genome_set_size, hue_criterion, highlight):
+    categories, counts = genome_composition(dff, assembly_acc, genome_set_size, hue_criterion, highlight)
+    _, stats2 = composition_stats(categories, counts, hue_criterion, highlight[-1])
+
+    sunburst_fig3 = px.sunburst(stats2, path=[hue_criterion, highlight[-1]], values='counts',
+                                color=highlight[-1], color_discrete_map=CMAP)
+
+    sunburst_fig3.layout.update(
+        title= "VIR Composition",
+        height=300,
+        margin=dict(l=0, r=0, t=40, b=0),
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=-0.2,
+            xanchor="right",
+            x=1
+        ),
+        showlegend=True
+    )
+    return sunburst_fig3
 
-        sunburst_fig3.layout.update(
-            title= "VIR Composition",
-            height=300,
-            margin=dict(l=0, r=0, t=40, b=0),
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=-0.2,
-                xanchor="right",
-                x=1
-            ),
-            showlegend=True
-        )
 
-        return pie_fig, sunburst_fig3, scatter_fig2
-
-            #hog_table[i] = hog_table_vir_subset = hog_table[hog_table["hog_id1"].isin(hog2vir_df.index)].index
-        # colors = hog_table[hue_criterion].map(cmap)
-        # hog_table_vir_subset = hog_table[hog_table["hog_id1"].isin(hog2vir_df.index)].index
-        # #virs_cmap = {i:'rgb(240, 173, 78)' for i in hog_table_vir_subset}
-        # #new_colors = colors.map(virs_cmap).fillna(colors)
-        #
-        # fig2.for_each_trace(
-        #     lambda trace: trace.update(
-        #         marker_color="rgb(240,173,78)") if trace.customdata in hog_table_vir_subset else (),
-        # )
-        # #fig2.for_each_trace( # accessory #core #strain specific are the traces
-        # #    lambda trace: print(trace.__dict__),)
-        #     #lambda trace: trace.update(marker_color=new_colors}
-        # #print(new_colors)
-
-    default_fig =  {
+def create_empty_sunburst():
+    return {
               "layout": {
                             "title": "VIR Composition",
                             "height": 100,  # px
@@ -1144,31 +1634,37 @@ def update_genome_info(hue_criterion, x_axis_category, y_axis_category, jitter,
                         },
               }
 
-    return pie_fig, default_fig, scatter_fig
 
-
-def create_normalized_barchart(series, identifier):
-
-    if pd.isnull(series.loc["hog_id1"]):
+def create_prevalence_barchart(protein_accs):
+    """Prevalence of the HOGs of protein_accs in the taxonomic groups, one
+    bar per group and protein.
+    """
+    hogs, values = prevalence.rows(protein_accs)
+    known = ~pd.isnull(hogs)
+    if not known.any():
         return {}
+    protein_accs = np.asarray(protein_accs, dtype=object)[known]
+    hogs, values = hogs[known], values[known]
+
+    # reversed, so the first group is drawn on top
+    categories = prevalence.groups[::-1]
+    data_df = pd.DataFrame({
+        "Taxonomic Group": np.tile(categories, len(protein_accs)),
+        "Protein": np.repeat(protein_accs, len(categories)),
+        "Prevalence": np.round(values[:, ::-1].ravel().astype(np.float64), 1),
+    })
 
-    categories = ["baumannii(55)", "calcoaceticus(4)", "other_acb(34)", "haemolyticus(50)", "baylyi(9)",
-          "lwoffii(71)", "brisouii(7)",
-          "qingfengensis(4)"][::-1]
-    colors = ["#ff0000", "#e8e8ff", "#c8c8ff", "#ffd47f",'#00eeff', "#ff0088", "#4400ff", "#22ff00"][::-1]
-
-    cmap={ele:colors[i] for i,ele in enumerate(categories)}
+    if len(protein_accs) == 1:
+        title = "Ortho-Family: " + hogs[0]
+    else:
+        title = "Ortho-Families of {} proteins".format(len(protein_accs))
 
-    total_counts = [55, 4, 34, 50, 9, 71, 7, 4][::-1]
-    normalized = [round((int(series.loc[ele])/total_counts[i])*100,1) for i,ele in enumerate(categories)]
-    data_dict = {identifier: normalized}
-    data_df = pd.DataFrame.from_dict(data_dict, orient='index', columns=categories)
-    data_df = data_df.T
-
-    fig = px.bar(data_df, y=data_df.index, x=[identifier], title="Ortho-Family: " + series.loc["hog_id1"],
-                orientation='h', text=data_df[identifier].to_list(), height=340,
-                # color=data_df.index, color_discrete_map=cmap
-                )
+    fig = px.bar(data_df, y="Taxonomic Group", x="Prevalence", title=title,
+                 color="Protein" if len(protein_accs) > 1 else None, barmode="group",
+                 orientation='h', text="Prevalence",
+                 height=340 if len(protein_accs) == 1 else 340 + 20 * len(protein_accs),
+                 hover_data={"Protein": True},
+                 )
 
     #fig.update_traces(texttemplate='%{text:.2s}', textposition='outside')
     fig.update_layout(uniformtext_minsize=8,
@@ -1185,14 +1681,25 @@ def create_normalized_barchart(series, identifier):
     'plot_bgcolor': 'rgba(0, 0, 0, 0)',
     'paper_bgcolor': 'rgba(0, 0, 0, 0)',
     })
-    #fig.update_traces(marker_width=20)
 
-    #fig.update_layout(showlegend=False)
-    fig.layout.update(showlegend=False)
+    fig.layout.update(showlegend=len(protein_accs) > 1)
 
     return fig
 
 
+def view_positions(assembly_acc, filter_query, sort_by):
+    """PositionMap of the accessions in the table view of a genome, built
+    once per (genome, filter, sorting).
+    """
+    key = (assembly_acc, filter_query or "",
+           tuple((s.get("column_id"), s.get("direction")) for s in sort_by or []))
+
+    def compute():
+        dff = genome_view(assembly_acc, filter_query, sort_by)
+        return PositionMap(dff["RefSeq Acc"], dff.index)
+    return position_maps.get_or_compute(key, compute)
+
+
 @app.callback(
     [Output('click-data', 'children'),
      Output('protein-prevalence', 'figure'),
@@ -1212,48 +1719,79 @@ def create_normalized_barchart(series, identifier):
      Output('virulence_source', 'children'),
     ],
     [Input('graph-0', 'clickData'),
+     Input('graph-0', 'selectedData'),
      Input('assembly-acc', "children"),
-     Input('datatable-interactivity', 'derived_virtual_row_ids')
-     ])
-def display_click_data(clicked_data, assembly_acc, row_ids):
+     Input('datatable-interactivity', 'filter_query'),
+     Input('datatable-interactivity', 'sort_by')
+     ],
+    [State('datatable-interactivity', 'page_size')])
+@callback_metrics.measure
+def display_click_data(clicked_data, selected_data, assembly_acc, filter_query, sort_by, page_size):
     # print("DISPLAY_CLICKED_DATA", clicked_data, assembly_acc)
-    # ctx = callback_context
+    ctx = callback_context
     # print(ctx.triggered[0]['prop_id'])
+    triggered = [t['prop_id'] for t in ctx.triggered]
+
+    if 'assembly-acc.children' in triggered:
+        # a new genome starts on the first table page
+        return [no_update, no_update, None, 0] + [no_update] * 12
+
+    if triggered == ['graph-0.selectedData']:
+        # compare the prevalences of the proteins of a box/lasso selection
+        points = (selected_data or {}).get("points") or []
+        protein_accs = list(dict.fromkeys(p["customdata"][0] for p in points if p.get("customdata")))
+        # strain specific proteins have no prevalences to compare
+        hogs, _ = prevalence.rows(protein_accs)
+        protein_accs = [acc for acc, hog in zip(protein_accs, hogs) if hog is not None]
+        if len(protein_accs) < 2:
+            raise PreventUpdate()
+        shown = protein_accs[:MAX_COMPARED_PROTEINS]
+        header = "Clade Prevalences for {} selected proteins".format(len(protein_accs))
+        if len(shown) < len(protein_accs):
+            header += " (first {} shown)".format(len(shown))
+        with callback_metrics.phase("figure"):
+            figure = create_prevalence_barchart(shown)
+        return [[header], figure] + [no_update] * 14
+
+    # a new filter or sort order starts on the first table page, unless the
+    # clicked protein is still shown (then the table moves to its page below)
+    view_changed = bool({'datatable-interactivity.filter_query', 'datatable-interactivity.sort_by'} & set(triggered))
+    first_page = [no_update, no_update, None, 0] + [no_update] * 12
 
     if clicked_data is None: #needs to be triggerd du to genome-dropdown (can be solved by storing as a DIV value)
+        if view_changed:
+            return first_page
         raise PreventUpdate()
         #return ["Compare Prevalences: No protein selected."], {}, None, 0, "No protein selected.", "", "", "", "", "", "", "", "", "", "", ""
     else:
         protein_acc = clicked_data["points"][0]["customdata"][0]
         #x = df.loc[protein_acc].loc["RefSeq Acc"]
 
-        dff = df[df["assembly"]==assembly_acc]
-
-        dff = dff.loc[dff.index.intersection(row_ids)]  # since .loc does not allow for missing indexes
-
-        list_of_possible_row_indexes = dff[dff["RefSeq Acc"]== protein_acc].index
-        if list(list_of_possible_row_indexes):
-            active_row_index = list_of_possible_row_indexes[0] #select first if multiple
-        else:
+        positions = view_positions(assembly_acc, filter_query, sort_by)
+        position = positions.position(protein_acc) #select first if multiple
+        if position is None:
+            if view_changed:
+                return first_page
             raise PreventUpdate()
             #return ["Clade Prevalences: No protein selected."], {}, None, 0, "No protein selected.","","","","","","","","","","",""
-        position = dff.index.get_loc(active_row_index)
-        page = int(position/15)
-        row = position % 15
-        if row == 0 and page >=1:
-            page -= 1
+        active_row_index = int(positions.row_ids[position])
+        page_size = page_size or PAGE_SIZE
+        # position page * page_size is row 0 of that page; moving it to the
+        # previous page (as this callback once did) made the active cell
+        # mark the first row of the wrong page
+        page = int(position / page_size)
+        row = position % page_size
 
         try:
             hog_series = full_hog_table.loc[protein_acc] #f its not found it must be strain specific
-        except:
+        except KeyError:
             return ["Clade Prevalences: trivial for strain specific protein: " + protein_acc], \
                    {}, \
                    {'row': row, 'column': 4, 'column_id': 'RefSeq Acc', 'row_id': active_row_index}, \
                    page, \
                    "Strain specific protein selected.", "", "", "", "", "", "", "", "", "", "", ""
 
-        this_series = full_hog_table.loc[protein_acc]
-        this_series.fillna("N/A", inplace=True)
+        this_series = hog_series.astype(object).fillna("N/A")
 
         ###postprocessing:
 
@@ -1274,6 +1812,12 @@ def display_click_data(clicked_data, assembly_acc, row_ids):
                                 target='_blank'
                                        )
 
+        if this_series['virulence_hit_description'] == 'N/A':
+            # the VIR highlight comes from the virulence factor hits, show their best one
+            best_hit = protein_hogs.at[active_row_index, VIR_BEST_HIT_COLUMN]
+            if not pd.isnull(best_hit):
+                this_series['virulence_hit_description'] = best_hit
+
         if this_series['virulence_hit_patric_id'] != 'N/A':
             this_series['virulence_hit_patric_id'] = html.A(this_series['virulence_hit_patric_id'][4:-1],
                                                          href='https://www.patricbrc.org/search/?keyword({})'.format(
@@ -1306,8 +1850,10 @@ def display_click_data(clicked_data, assembly_acc, row_ids):
         #     ,
         #     name='{}_{}'.format(plot_position, wtg),
         #     selected_marker_color='red')
+        with callback_metrics.phase("figure"):
+            figure = create_prevalence_barchart([protein_acc])
         return ["Clade Prevalences for: " + protein_acc ], \
-               create_normalized_barchart(hog_series, protein_acc), \
+               figure, \
                {'row': row, 'column': 4 , 'column_id': 'RefSeq Acc', 'row_id':active_row_index}, \
                 page, \
                 this_series.loc['refseq'], \
@@ -1324,35 +1870,66 @@ def display_click_data(clicked_data, assembly_acc, row_ids):
                 this_series.loc['virulence_source']
 
 
-def toggle_modal(n1, n2, is_open):
-    # print("TOGGLE_MODAL",n1,n2,is_open)
-    if n1 == -1:
-        return False
-    if n1 or n2:
-        return not is_open
-    return is_open
+@app.callback(
+    [Output('protein-search-results', 'data'),
+     Output('protein-search-summary', 'children')],
+    [Input('protein-search-button', 'n_clicks'),
+     Input('protein-search-input', 'value')],
+    background=True,
+    manager=background_callback_manager,
+    running=[(Output('protein-search-button', 'disabled'), True, False),
+             (Output('protein-search-cancel', 'disabled'), False, True)],
+    cancel=[Input('protein-search-cancel', 'n_clicks')],
+    progress=[Output('protein-search-progress', 'value'),
+              Output('protein-search-progress', 'max')],
+    prevent_initial_call=True)
+def search_proteins(set_progress, n_clicks, query):
+    if not query or not query.strip():
+        return [], ""
+    if not data_loader.ready:
+        # the job process never sees datasets published after it was forked
+        return [], "The datasets are still loading, please search again in a moment."
+    start = time.perf_counter()
+    results = search_index.search(query, progress=lambda done, total: set_progress((done, total)))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    rows = [{"id": r["assembly"],
+             "Genome": genome_label(r["assembly"]) if r["assembly"] in genomes_dict else r["assembly"],
+             "Hits": r["hits"],
+             "Score": r["score"],
+             "Proteins": "; ".join("{} ({})".format(p["RefSeq Acc"], p["Protein Annotation"])
+                                   for p in r["proteins"])}
+            for r in results]
+    summary = "{} matching proteins in {} genomes ({:.0f} ms).".format(
+        sum(r["hits"] for r in results), len(results), elapsed_ms)
+    return rows, summary
+
+
+@app.callback(
+    Output('genome-dropdown', 'value'),
+    [Input('protein-search-results', 'active_cell')])
+def select_search_hit(active_cell):
+    if not active_cell or active_cell.get("row_id") not in genomes_dict:
+        raise PreventUpdate()
+    return active_cell["row_id"]
 
-app.callback(
+
+# the modal and filter query callbacks run in the browser, see assets/clientside.js
+app.clientside_callback(
+    ClientsideFunction(namespace="aci_dash", function_name="toggleModal"),
     Output("modal-xl", "is_open"),
     [Input("open-xl", "n_clicks"),
      Input("close-xl", "n_clicks")],
     [State("modal-xl", "is_open")],
-)(toggle_modal)
+)
 
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace="aci_dash", function_name="triggerModal"),
     [Output("user_protein_acc", "value"),
      Output("open-xl", "n_clicks"),
      Output("close-xl", "n_clicks")],
     [Input('selected_data_points', 'children')],
     State("close-xl", "n_clicks")
 )
-def trigger_modal(selected_data_points, close_n_clicks):
-    # print("TRIGGER_MODAL", selected_data_points)
-    if selected_data_points and len(selected_data_points) > 1:
-        return selected_data_points, 1, close_n_clicks
-    if selected_data_points == None or len(selected_data_points) == 1:
-        raise PreventUpdate()
-    return "", -1, 2
 
 @app.callback(
 ### The problem here is, if we select data then the data gets filtered and the unselected are filtered from the graph
@@ -1360,6 +1937,7 @@ def trigger_modal(selected_data_points, close_n_clicks):
     [Input('graph-0', 'selectedData')],
     State('selected_data_points', 'children')
 )
+@callback_metrics.measure
 def select_and_filter_selected_data(selectedData, selected_data_points):
     # print("SELECT_AND_FILTER", selectedData, selected_data_points)
     # ctx = callback_context
@@ -1425,45 +2003,17 @@ def select_and_filter_selected_data(selectedData, selected_data_points):
 #     return json.dumps(selectedData, indent=2)
 
 
-#IDEAD: multiindex the dataframe for assembly_accession if it takes too long
-
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace="aci_dash", function_name="updateOutput"),
     Output('datatable_query_structure', 'children'),
     [Input('close-xl', 'n_clicks')],
     [State('user_protein_acc', 'value')])
-def update_output(n_clicks, value):
-    # print("UPDATE_Output", n_clicks, value)
-    if value == "" or not n_clicks:
-        return None
-    else:
-        list_of_accessions = parse_input_accessions(value)
-        query = convert_list_to_filter_query(list_of_accessions)
-    return query
-
-def parse_input_accessions(values_string):
-    list_of_accessions = []
-    lines = values_string.split('\n')
-    for line in lines:
-        [ list_of_accessions.append(e.strip()) for e in line.strip().split(',') ]
-    return [l for l in list_of_accessions if l.strip()]
-
-def convert_list_to_filter_query(values_list, column="RefSeq Acc"):
-    # print("CONVERT", values_list)
-    res = []
-    for val in values_list:
-        res.append('{{{0}}} eq {1}'.format(column, val))
-    return ' or '.join(res) #gives an empty string if empty value_list
 
-@app.callback(
+app.clientside_callback(
+    ClientsideFunction(namespace="aci_dash", function_name="writeQuery"),
     Output('datatable-interactivity', 'filter_query'),
     [Input('datatable_query_structure', 'children')]
 )
-def write_query(query):
-    # print("WRITE_QUERY", query)
-    if not query:
-        return ''
-    else:
-        return query
 
 
 if __name__ == "__main__":
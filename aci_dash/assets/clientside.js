@@ -0,0 +1,240 @@
+// Clientside callbacks: the accession modal and the filter query it
+// writes only move strings between components, and the scatter and pie
+// are redrawn from the genome-points store when the axes, hue, jitter or
+// highlight change, so none of them cost a server round trip.
+(function (root) {
+    // the main plot takes the left 74% like px' marginal_y
+    var MARGINAL_DOMAIN = 0.74;
+    var FONT_FAMILY = '"Source Sans Pro", -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, ' +
+        '"Helvetica Neue", Arial, sans-serif, "Apple Color Emoji", "Segoe UI Emoji", "Segoe UI Symbol"';
+
+    function preventUpdate() {
+        throw root.dash_clientside.PreventUpdate;
+    }
+
+    // comma or new-line separated accessions, without blanks
+    function parseInputAccessions(valuesString) {
+        var accessions = [];
+        valuesString.split("\n").forEach(function (line) {
+            line.trim().split(",").forEach(function (value) {
+                accessions.push(value.trim());
+            });
+        });
+        return accessions.filter(function (value) { return value.trim(); });
+    }
+
+    // gives an empty string for an empty list
+    function convertListToFilterQuery(values, column) {
+        column = column || "RefSeq Acc";
+        return values.map(function (value) {
+            return "{" + column + "} eq " + value;
+        }).join(" or ");
+    }
+
+    // categories present (null is missing), those with a colour first in colour order
+    function categoryOrder(labels, colors) {
+        var present = [];
+        var seen = {};
+        labels.forEach(function (label) {
+            if (label !== null && !seen.hasOwnProperty(label)) {
+                seen[label] = true;
+                present.push(label);
+            }
+        });
+        var known = Object.keys(colors).filter(function (c) { return seen.hasOwnProperty(c); });
+        return known.concat(present.filter(function (c) { return !colors.hasOwnProperty(c); }));
+    }
+
+    // colours of the style, the default plotly palette for other categories
+    function categoryColors(order, style) {
+        var colors = {};
+        var unknown = 0;
+        order.forEach(function (c) {
+            colors[c] = style.colors.hasOwnProperty(c) ? style.colors[c] :
+                style.palette[unknown++ % style.palette.length];
+        });
+        return colors;
+    }
+
+    // hue category of every point, overridden by the highlight options it is flagged for
+    function hueLabels(points, hueCriterion, highlight) {
+        var hue = points.hues[hueCriterion];
+        var labels = hue.codes.map(function (code) { return code >= 0 ? hue.categories[code] : null; });
+        var title = hueCriterion;
+        (highlight || []).forEach(function (option) {
+            var flags = points.flags[option];
+            if (flags) {
+                labels = labels.map(function (label, i) { return flags[i] ? option : label; });
+                title = option;
+            }
+        });
+        return {labels: labels, title: title};
+    }
+
+    // linear interpolation between the closest ranks, like numpy.percentile
+    function percentile(sorted, q) {
+        var position = (sorted.length - 1) * q;
+        var lower = Math.floor(position);
+        var upper = Math.min(lower + 1, sorted.length - 1);
+        return sorted[lower] + (sorted[upper] - sorted[lower]) * (position - lower);
+    }
+
+    // precomputed box plot statistics (Tukey fences), null without values
+    function boxStatistics(values) {
+        var sorted = values.filter(function (v) { return v !== null && !isNaN(v); })
+            .sort(function (a, b) { return a - b; });
+        if (!sorted.length) {
+            return null;
+        }
+        var q1 = percentile(sorted, 0.25);
+        var q3 = percentile(sorted, 0.75);
+        var iqr = q3 - q1;
+        var lower = 0;
+        var upper = sorted.length - 1;
+        while (sorted[lower] < q1 - 1.5 * iqr) {
+            lower++;
+        }
+        while (sorted[upper] > q3 + 1.5 * iqr) {
+            upper--;
+        }
+        return {q1: [q1], median: [percentile(sorted, 0.5)], q3: [q3],
+                lowerfence: [sorted[lower]], upperfence: [sorted[upper]]};
+    }
+
+    var callbacks = {
+        parseInputAccessions: parseInputAccessions,
+        convertListToFilterQuery: convertListToFilterQuery,
+
+        toggleModal: function (n1, n2, isOpen) {
+            if (n1 === -1) {
+                return false;
+            }
+            if (n1 || n2) {
+                return !isOpen;
+            }
+            return isOpen;
+        },
+
+        triggerModal: function (selectedDataPoints, closeNClicks) {
+            if (selectedDataPoints && selectedDataPoints.length > 1) {
+                return [selectedDataPoints, 1, closeNClicks];
+            }
+            if (selectedDataPoints === null || selectedDataPoints === undefined ||
+                    selectedDataPoints.length === 1) {
+                preventUpdate();
+            }
+            return ["", -1, 2];
+        },
+
+        updateOutput: function (nClicks, value) {
+            if (value === "" || !nClicks) {
+                return null;
+            }
+            if (value === null || value === undefined) {
+                // nothing typed into the modal yet
+                preventUpdate();
+            }
+            return convertListToFilterQuery(parseInputAccessions(value));
+        },
+
+        writeQuery: function (query) {
+            return query ? query : "";
+        },
+
+        // WebGL scatter of the y against the x taxonomic range coloured by
+        // hue, one trace per category, with a box per category on a
+        // marginal y axis
+        renderScatter: function (points, hueCriterion, xAxis, yAxis, jitter, highlight, style) {
+            if (!points || !style || !points.hues[hueCriterion] || !points.ranges[xAxis] ||
+                    !points.ranges[yAxis]) {
+                preventUpdate();
+            }
+            var xs = points.ranges[xAxis];
+            var ys = points.ranges[yAxis];
+            var hue = hueLabels(points, hueCriterion, highlight);
+            var order = categoryOrder(hue.labels, style.colors);
+            var colors = categoryColors(order, style);
+            var groups = {};
+            order.forEach(function (c) { groups[c] = {x: [], y: [], customdata: []}; });
+            hue.labels.forEach(function (label, i) {
+                // proteins without a hue or a count in either range are not drawn
+                if (label === null || xs[i] == null || ys[i] == null) {
+                    return;
+                }
+                var group = groups[label];
+                group.x.push(jitter ? xs[i] + points.jitter[i] : xs[i]);
+                group.y.push(ys[i]);
+                group.customdata.push([points.ids[i]]);
+            });
+
+            var hovertemplate = hue.title + "=%{fullData.name}<br>" + xAxis + "=%{x}<br>" + yAxis +
+                "=%{y}<br>%{customdata[0]}<extra></extra>";
+            var traces = order.map(function (c) {
+                return {type: "scattergl", x: groups[c].x, y: groups[c].y, mode: "markers",
+                        name: c, legendgroup: c, marker: {color: colors[c]},
+                        customdata: groups[c].customdata, hovertemplate: hovertemplate,
+                        xaxis: "x", yaxis: "y"};
+            });
+            var boxes = [];
+            order.forEach(function (c) {
+                var stats = boxStatistics(groups[c].y);
+                if (stats) {
+                    boxes.push(Object.assign({type: "box", x: [c], name: c, legendgroup: c, showlegend: false,
+                                              marker: {color: colors[c]}, notched: false, hoverinfo: "skip",
+                                              xaxis: "x2", yaxis: "y2"}, stats));
+                }
+            });
+            return {
+                data: traces.concat(boxes),
+                layout: {
+                    template: style.templates.simple_white,
+                    xaxis: {domain: [0, MARGINAL_DOMAIN], title: {text: xAxis}},
+                    yaxis: {title: {text: yAxis}},
+                    xaxis2: {domain: [MARGINAL_DOMAIN + 0.01, 1], showticklabels: false, showline: false,
+                             ticks: ""},
+                    yaxis2: {matches: "y", anchor: "x2", showticklabels: false},
+                    boxmode: "group",
+                    clickmode: "event+select",
+                    margin: {l: 0, r: 0, t: 40, b: 0},
+                    legend: {title: {text: ""}},
+                    height: 500
+                }
+            };
+        },
+
+        // number of proteins per hue category
+        renderPie: function (points, hueCriterion, style) {
+            if (!points || !style || !points.hues[hueCriterion]) {
+                preventUpdate();
+            }
+            var hue = points.hues[hueCriterion];
+            var counts = hue.categories.map(function () { return 0; });
+            hue.codes.forEach(function (code) {
+                if (code >= 0) {
+                    counts[code]++;
+                }
+            });
+            var labels = hue.categories.filter(function (c, i) { return counts[i] > 0; });
+            var values = counts.filter(function (count) { return count > 0; });
+            var colors = categoryColors(labels, style);
+            var header = "#Proteins: " + points.count + (points.count === points.size ? " (all)" : "");
+            return {
+                data: [{type: "pie", labels: labels, values: values, name: "", showlegend: true,
+                        domain: {x: [0, 1], y: [0, 1]},
+                        marker: {colors: labels.map(function (c) { return colors[c]; })},
+                        hovertemplate: hueCriterion + "=%{label}<br>counts=%{value}<extra></extra>"}],
+                layout: {
+                    template: style.templates.plotly,
+                    title: {text: header},
+                    height: 280,
+                    margin: {l: 0, r: 0, t: 0, b: 0},
+                    legend: {tracegroupgap: 0, orientation: "v", yanchor: "bottom", y: -0.2,
+                             xanchor: "right", x: 1},
+                    font: {family: FONT_FAMILY, color: "#222222"}
+                }
+            };
+        }
+    };
+
+    root.dash_clientside = Object.assign({}, root.dash_clientside, {aci_dash: callbacks});
+})(typeof window !== "undefined" ? window : globalThis);
@@ -0,0 +1,215 @@
+# coding=utf8
+
+import os
+import json
+import fcntl
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .mappedstrings import MappedStringArray, encode_strings
+except ImportError:
+    from mappedstrings import MappedStringArray, encode_strings
+
+FORMAT_VERSION = 2
+MANIFEST = "manifest.json"
+
+
+def _code_dtype(n_categories):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _is_string_column(values):
+    if values.dtype != object and not pd.api.types.is_string_dtype(values.dtype):
+        return False
+    non_null = values.dropna()
+    return all(isinstance(v, str) for v in non_null)
+
+
+def _write_strings(values, directory, stem):
+    offsets, data, missing = encode_strings(values)
+    np.save(str(directory / (stem + ".offsets.npy")), offsets)
+    np.save(str(directory / (stem + ".data.npy")), data)
+    np.save(str(directory / (stem + ".missing.npy")), missing)
+    return bool(len(data) == 0 or data.max() < 0x80)
+
+
+def _read_strings(directory, stem, ascii, mmap_mode):
+    return MappedStringArray(np.load(str(directory / (stem + ".offsets.npy")), mmap_mode=mmap_mode),
+                             np.load(str(directory / (stem + ".data.npy")), mmap_mode=mmap_mode),
+                             np.load(str(directory / (stem + ".missing.npy")), mmap_mode=mmap_mode),
+                             ascii=ascii)
+
+
+def _write_column(values, directory, stem):
+    """Save one column and return its manifest entry.
+
+    The stored layout follows the dtype of the column, which
+    schema.normalize chose: categorical columns are dictionary encoded
+    (integer codes + categories), other string columns are stored as one
+    UTF-8 buffer with the offsets of every value, and numeric and boolean
+    columns as plain .npy files (plus a missing mask for nullable ones),
+    so all of them can be memory-mapped.
+    Anything else is pickled and loaded privately by each worker.
+    """
+    values = pd.Series(values)
+    entry = {"file": stem}
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        cat = values.cat
+        np.save(str(directory / (stem + ".codes.npy")),
+                cat.codes.to_numpy().astype(_code_dtype(len(cat.categories))))
+        if _is_string_column(cat.categories.to_series()):
+            entry.update(ascii=_write_strings(cat.categories, directory, stem + ".categories"))
+        else:
+            np.save(str(directory / (stem + ".categories.npy")), cat.categories.to_numpy())
+        entry.update(kind="dictionary", ordered=bool(cat.ordered))
+    elif _is_string_column(values):
+        entry.update(kind="strings", ascii=_write_strings(values.to_numpy(dtype=object), directory, stem))
+    elif isinstance(values.dtype, pd.api.extensions.ExtensionDtype) and values.dtype.kind in "biuf":
+        # nullable numbers: the values (0 where missing) and the missing mask
+        np.save(str(directory / (stem + ".npy")), values.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0))
+        np.save(str(directory / (stem + ".mask.npy")), values.isna().to_numpy())
+        entry.update(kind="masked")
+    elif values.dtype.kind in "biuf":
+        np.save(str(directory / (stem + ".npy")), values.to_numpy())
+        entry.update(kind="numeric")
+    else:
+        np.save(str(directory / (stem + ".npy")), values.to_numpy(dtype=object), allow_pickle=True)
+        entry.update(kind="object")
+    return entry
+
+
+def _read_column(directory, entry, mmap_mode):
+    stem = entry["file"]
+    if entry["kind"] == "dictionary":
+        codes = np.load(str(directory / (stem + ".codes.npy")), mmap_mode=mmap_mode)
+        if "ascii" in entry:
+            categories = np.asarray(_read_strings(directory, stem + ".categories", entry["ascii"], mmap_mode))
+        else:
+            categories = np.load(str(directory / (stem + ".categories.npy")))
+        return pd.Categorical.from_codes(codes, categories=pd.Index(categories),
+                                         ordered=entry["ordered"])
+    if entry["kind"] == "strings":
+        return _read_strings(directory, stem, entry["ascii"], mmap_mode)
+    if entry["kind"] == "numeric":
+        return np.load(str(directory / (stem + ".npy")), mmap_mode=mmap_mode)
+    if entry["kind"] == "masked":
+        values = np.load(str(directory / (stem + ".npy")), mmap_mode=mmap_mode)
+        mask = np.load(str(directory / (stem + ".mask.npy")), mmap_mode=mmap_mode)
+        array_type = {"b": pd.arrays.BooleanArray, "f": pd.arrays.FloatingArray}.get(values.dtype.kind,
+                                                                                  pd.arrays.IntegerArray)
+        return array_type(values, mask)
+    return np.load(str(directory / (stem + ".npy")), allow_pickle=True)
+
+
+def write_table(frame, directory, metadata=None):
+    """Write frame as a directory of column files, with the JSON-serialisable
+    metadata dict kept in its manifest.
+
+    The table is assembled in a temporary sibling directory and renamed
+    into place, so concurrent readers only ever see complete tables.
+    """
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=str(directory.parent), prefix=".tmp-"))
+    try:
+        manifest = {"version": FORMAT_VERSION,
+                    "length": len(frame.index),
+                    "index_name": frame.index.name,
+                    "index": _write_column(frame.index.to_series(), tmp_dir, "__index__"),
+                    "metadata": metadata or {},
+                    "columns": []}
+        for i, column in enumerate(frame.columns):
+            entry = _write_column(frame[column], tmp_dir, "c{:04d}".format(i))
+            entry["name"] = column
+            manifest["columns"].append(entry)
+        with open(str(tmp_dir / MANIFEST), "w") as fh:
+            json.dump(manifest, fh, indent=1)
+        try:
+            os.rename(str(tmp_dir), str(directory))
+        except OSError:
+            # another worker finished the same table first
+            if not (directory / MANIFEST).is_file():
+                raise
+            shutil.rmtree(str(tmp_dir), ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(str(tmp_dir), ignore_errors=True)
+        raise
+
+
+def read_table(directory, mmap_mode="r"):
+    """Load a table written by write_table, memory-mapping its columns.
+
+    Numeric columns, dictionary codes and the buffers of string columns
+    are backed directly by the read-only mapped files, so their pages are
+    shared between workers; string values are only decoded for the rows
+    that are read. The categories of dictionary columns and the index are
+    decoded into Python objects by every worker, which is cheap as long
+    as only low-cardinality columns are categorical.
+    """
+    directory = Path(directory)
+    with open(str(directory / MANIFEST)) as fh:
+        manifest = json.load(fh)
+    if manifest["version"] != FORMAT_VERSION:
+        raise ValueError("Unsupported columnar format version {}".format(manifest["version"]))
+
+    index_values = _read_column(directory, manifest["index"], mmap_mode)
+    if isinstance(index_values, (pd.Categorical, MappedStringArray)):
+        index_values = np.asarray(index_values, dtype=object)
+    index = pd.Index(index_values, name=manifest["index_name"])
+
+    columns = {entry["name"]: _read_column(directory, entry, mmap_mode)
+               for entry in manifest["columns"]}
+    # copy=False also keeps columns of one dtype from being consolidated
+    # into a (copied) 2-D block; it is passed explicitly because pandas
+    # with copy-on-write copies arrays handed to the constructor by default
+    return pd.DataFrame(columns, index=index, copy=False)
+
+
+def read_metadata(directory):
+    """The metadata stored with the table by write_table.
+    """
+    with open(str(Path(directory) / MANIFEST)) as fh:
+        return json.load(fh).get("metadata", {})
+
+
+def has_table(directory):
+    return (Path(directory) / MANIFEST).is_file()
+
+
+@contextmanager
+def build_lock(directory):
+    """Exclusive lock on directory's ".lock" sibling, shared by all processes.
+    """
+    directory = Path(directory)
+    directory.parent.mkdir(parents=True, exist_ok=True)
+    with open(str(directory.parent / (directory.name + ".lock")), "a") as fh:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def load_or_build(directory, build, metadata=None):
+    """Return the table stored in directory, building it with build() first if needed.
+
+    metadata() is called after a build and its result stored with the
+    table (see read_metadata). Workers starting together wait for the one
+    building the table instead of each building their own copy.
+    """
+    if not has_table(directory):
+        with build_lock(directory):
+            if not has_table(directory):
+                table = build()
+                write_table(table, directory, metadata() if metadata else None)
+    return read_table(directory)
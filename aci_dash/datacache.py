@@ -0,0 +1,193 @@
+# coding=utf8
+
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+
+import urllib3
+
+try:
+    from .exceptions import DatasetUnavailable
+except ImportError:
+    from exceptions import DatasetUnavailable
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20  # 1 MiB
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode("utf8")).hexdigest()
+
+
+def _atomic_write_bytes(target, payload):
+    """Write payload next to target and rename it into place, so readers
+    never see a partially written file.
+    """
+    fd, tmp_name = tempfile.mkstemp(dir=str(target.parent), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(payload)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_name, str(target))
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+class DatasetCache:
+    """Content-addressed on-disk cache for the remote datasets.
+
+    Downloaded files are stored under ``objects/<sha256>`` and every url
+    has a small json record under ``refs/`` pointing at its current
+    object together with the ETag/Last-Modified validators. Cached
+    entries are revalidated with a conditional request; if the server
+    cannot be reached (or ``offline`` is set), the last good copy is used.
+
+    When a url changes, its ``keep_previous`` most recent earlier objects
+    are kept (and listed in the record), so workers that looked up the
+    old record can still open its object; older ones are removed.
+    """
+
+    def __init__(self, cache_dir, offline=False, http=None, timeout=60.0, keep_previous=1):
+        self.cache_dir = Path(cache_dir)
+        self.offline = offline
+        self.timeout = timeout
+        self.keep_previous = keep_previous
+        self._http = http
+        self.objects_dir = self.cache_dir / "objects"
+        self.refs_dir = self.cache_dir / "refs"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.refs_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def http(self):
+        if self._http is None:
+            self._http = urllib3.PoolManager()
+        return self._http
+
+    def _ref_path(self, url):
+        return self.refs_dir / (_url_key(url) + ".json")
+
+    def object_path(self, digest):
+        return self.objects_dir / digest
+
+    def lookup(self, url):
+        """Return the cached record for url, or None if there is no usable copy.
+        """
+        try:
+            with open(str(self._ref_path(url))) as fh:
+                record = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if not self.object_path(record["sha256"]).is_file():
+            return None
+        return record
+
+    def _store_ref(self, url, record):
+        payload = json.dumps(record, indent=1, sort_keys=True).encode("utf8")
+        _atomic_write_bytes(self._ref_path(url), payload)
+
+    def _download(self, resp):
+        """Stream the response body into the object store and return its digest.
+        """
+        sha = hashlib.sha256()
+        fd, tmp_name = tempfile.mkstemp(dir=str(self.objects_dir), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                for chunk in resp.stream(CHUNK_SIZE):
+                    sha.update(chunk)
+                    fh.write(chunk)
+                fh.flush()
+                os.fsync(fh.fileno())
+            digest = sha.hexdigest()
+            # identical content from a concurrent worker is simply replaced
+            os.replace(tmp_name, str(self.object_path(digest)))
+        except BaseException:
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+            raise
+        finally:
+            resp.release_conn()
+        return digest
+
+    def fetch(self, url):
+        """Return the local path holding the current content of url.
+        """
+        record = self.lookup(url)
+
+        if self.offline:
+            if record is None:
+                raise DatasetUnavailable("Offline mode and no cached copy of {}".format(url))
+            return self.object_path(record["sha256"])
+
+        headers = {}
+        if record is not None:
+            if record.get("etag"):
+                headers["If-None-Match"] = record["etag"]
+            if record.get("last_modified"):
+                headers["If-Modified-Since"] = record["last_modified"]
+
+        try:
+            resp = self.http.request("GET", url, headers=headers, preload_content=False,
+                                     timeout=self.timeout, retries=urllib3.Retry(3, redirect=3))
+        except urllib3.exceptions.HTTPError as e:
+            return self._fallback(url, record, e)
+
+        if resp.status == 304 and record is not None:
+            resp.release_conn()
+            record["validated_at"] = time.time()
+            self._store_ref(url, record)
+            return self.object_path(record["sha256"])
+
+        if resp.status != 200:
+            resp.release_conn()
+            return self._fallback(url, record, "HTTP status {}".format(resp.status))
+
+        try:
+            digest = self._download(resp)
+        except (urllib3.exceptions.HTTPError, OSError) as e:
+            return self._fallback(url, record, e)
+
+        previous = []
+        if record is not None:
+            previous = [record["sha256"]] + record.get("previous", [])
+            previous = [d for d in dict.fromkeys(previous) if d != digest]
+        now = time.time()
+        self._store_ref(url, {"url": url,
+                              "sha256": digest,
+                              "previous": previous[:self.keep_previous],
+                              "etag": resp.headers.get("ETag"),
+                              "last_modified": resp.headers.get("Last-Modified"),
+                              "fetched_at": now,
+                              "validated_at": now})
+        for old_digest in previous[self.keep_previous:]:
+            self._remove_unreferenced(old_digest)
+        return self.object_path(digest)
+
+    def _fallback(self, url, record, reason):
+        if record is None:
+            raise DatasetUnavailable("Could not fetch {} ({}) and no cached copy exists".format(url, reason))
+        logger.warning("Could not revalidate %s (%s), using cached copy from %s",
+                       url, reason, time.ctime(record["fetched_at"]))
+        return self.object_path(record["sha256"])
+
+    def _remove_unreferenced(self, digest):
+        for ref in self.refs_dir.glob("*.json"):
+            try:
+                with open(str(ref)) as fh:
+                    record = json.load(fh)
+                if record.get("sha256") == digest or digest in record.get("previous", []):
+                    return
+            except (OSError, ValueError):
+                continue
+        try:
+            self.object_path(digest).unlink()
+        except OSError:
+            pass
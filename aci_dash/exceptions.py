@@ -2,3 +2,17 @@ class ImproperlyConfigured(Exception):
     """Raise this exception when an environment variable is not set.
     """
     pass
+
+
+class DatasetUnavailable(Exception):
+    """Raise this exception when a dataset can neither be downloaded nor
+    served from the local cache.
+    """
+    pass
+
+
+class FilterQueryError(ValueError):
+    """Raise this exception when a DataTable filter query cannot be parsed
+    or refers to an unknown column.
+    """
+    pass
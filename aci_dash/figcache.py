@@ -0,0 +1,100 @@
+# coding=utf8
+
+import sys
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def estimate_size(value):
+    """Rough number of bytes held by a figure, dict/list tree or array.
+    """
+    if hasattr(value, "to_plotly_json"):
+        value = value.to_plotly_json()
+    if isinstance(value, np.ndarray):
+        if value.dtype == object:
+            return value.nbytes + sum(estimate_size(v) for v in value.ravel())
+        return value.nbytes
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(estimate_size(v) for v in value)
+    if isinstance(value, (str, bytes)):
+        return 49 + len(value)
+    return sys.getsizeof(value)
+
+
+def fingerprint(values):
+    """Short, order-sensitive hash of an array of row ids.
+    """
+    values = np.ascontiguousarray(np.asarray(values, dtype=np.int64))
+    return hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest()
+
+
+class FigureCache:
+    """Thread-safe LRU cache bounded by entry count and estimated bytes.
+    """
+
+    def __init__(self, max_bytes, max_entries=256, sizeof=estimate_size):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sizeof = sizeof
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return value
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self._entries and (self.current_bytes > self.max_bytes or
+                                     len(self._entries) > self.max_entries):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value for key, computing and storing it on a miss.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries),
+                    "bytes": self.current_bytes,
+                    "max_bytes": self.max_bytes,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions}
@@ -0,0 +1,58 @@
+# coding=utf8
+"""Data for the genome figures rebuilt in the browser.
+
+The scatter and pie chart of a genome are drawn by clientside callbacks
+(assets/clientside.js) from a compact columnar copy of its proteins,
+sent once per set of shown rows, and from static style data sent with
+the layout. Changing the axes, hue or jitter then costs no server time.
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+
+
+def figure_style(cmap):
+    """Colours and templates of the clientside figures: cmap colours known
+    categories, the default plotly palette the others.
+    """
+    return {"colors": dict(cmap),
+            "palette": list(px.colors.qualitative.Plotly),
+            "templates": {name: pio.templates[name].to_plotly_json() for name in ("plotly", "simple_white")}}
+
+
+def encode_category(values):
+    """{"categories", "codes"} of a categorical column, -1 for missing.
+    """
+    values = pd.Categorical(values)
+    return {"categories": [str(c) for c in values.categories],
+            "codes": values.codes.astype(np.int32).tolist()}
+
+
+def encode_numbers(values):
+    """List of a numeric column, integers kept as such, NaN as None.
+    """
+    dtype = getattr(values, "dtype", None)
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in "iu":
+        # nullable integers
+        numbers = values.to_numpy(dtype=np.int64, na_value=0).tolist()
+        return [None if missing else n for n, missing in zip(numbers, values.isna().tolist())]
+    values = np.asarray(values)
+    if values.dtype.kind in "biu":
+        return values.tolist()
+    values = values.astype(np.float64)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def genome_points(hog_table, range_columns, hue_columns, flag_columns, jitter_column, decimals=4):
+    """Columnar data of the proteins of one genome (hog_table, indexed by
+    accession): the counts of the taxonomic ranges, hue categories,
+    highlight flags (option -> column) and jitter offsets.
+    """
+    return {"ids": [str(i) for i in hog_table.index],
+            "ranges": {c: encode_numbers(hog_table[c]) for c in range_columns},
+            "hues": {c: encode_category(hog_table[c]) for c in hue_columns},
+            "flags": {option: hog_table[c].to_numpy(dtype=bool).astype(np.int8).tolist()
+                      for option, c in flag_columns.items()},
+            "jitter": np.round(hog_table[jitter_column].to_numpy(dtype=np.float64), decimals).tolist()}
@@ -0,0 +1,291 @@
+# coding=utf8
+"""Server-side evaluation of DataTable ``filter_query`` and ``sort_by``.
+
+Supports the query syntax produced by the DataTable filter row and by
+the accession list dialog, e.g.::
+
+    {Start} > 5000 && {Protein Annotation} icontains "oxa"
+    {RefSeq Acc} eq WP_000446781.1 or {RefSeq Acc} eq WP_001984992.1
+
+Relations are turned into vectorized boolean masks; on categorical
+columns the predicate is evaluated once per category present in the
+rows and broadcast through the codes, and (case-sensitive) equality is
+a lookup of the value among the categories.
+"""
+
+import re
+import math
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .exceptions import FilterQueryError
+except ImportError:
+    from exceptions import FilterQueryError
+
+TOKEN_RE = re.compile(r"""
+    \s*(?:
+      (?P<column>\{(?:\\.|[^}\\])*\})
+    | (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*'|`(?:\\.|[^`\\])*`)
+    | (?P<symbol><=|>=|!=|&&|\|\||[=<>!()])
+    | (?P<word>[^\s(){}"'`!=<>&|]+)
+    )""", re.VERBOSE)
+
+SYMBOL_OPERATORS = {"=": "eq", "!=": "ne", "<": "lt", "<=": "le", ">": "gt", ">=": "ge"}
+WORD_OPERATORS = {"eq", "ne", "lt", "le", "gt", "ge", "contains", "datestartswith"}
+UNARY_OPERATORS = {"blank", "nil", "num", "str"}
+
+
+def _tokenize(query):
+    tokens = []
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = TOKEN_RE.match(query, position)
+        if match is None or match.end() == position:
+            raise FilterQueryError("Cannot parse filter query at: {!r}".format(query[position:]))
+        kind = match.lastgroup
+        text = match.group(kind)
+        if kind == "column":
+            tokens.append(("column", re.sub(r"\\(.)", r"\1", text[1:-1])))
+        elif kind == "string":
+            tokens.append(("value", re.sub(r"\\(.)", r"\1", text[1:-1])))
+        else:
+            tokens.append((kind, text))
+        position = match.end()
+    return tokens
+
+
+def _operator(token):
+    kind, text = token
+    if kind == "symbol" and text in SYMBOL_OPERATORS:
+        return SYMBOL_OPERATORS[text], None
+    if kind == "word":
+        lowered = text.lower()
+        if lowered in WORD_OPERATORS:
+            return lowered, None
+        if lowered[:1] in ("i", "s") and lowered[1:] in WORD_OPERATORS:
+            return lowered[1:], lowered[0] == "i"
+    return None, None
+
+
+def _literal(token):
+    kind, text = token
+    if kind == "value":
+        return text
+    if kind == "word":
+        try:
+            number = float(text)
+        except ValueError:
+            return text
+        return number if math.isfinite(number) else text
+    raise FilterQueryError("Expected a value, got {!r}".format(text))
+
+
+class _Parser:
+    """Recursive descent parser producing a nested tuple expression.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse(self):
+        expression = self.parse_or()
+        if self.position != len(self.tokens):
+            raise FilterQueryError("Unexpected {!r} in filter query".format(self.peek()[1]))
+        return expression
+
+    def _is_keyword(self, symbol, word):
+        kind, text = self.peek()
+        return (kind == "symbol" and text == symbol) or (kind == "word" and text.lower() == word)
+
+    def parse_or(self):
+        operands = [self.parse_and()]
+        while self._is_keyword("||", "or"):
+            self.take()
+            operands.append(self.parse_and())
+        return operands[0] if len(operands) == 1 else ("or", operands)
+
+    def parse_and(self):
+        operands = [self.parse_not()]
+        while self._is_keyword("&&", "and"):
+            self.take()
+            operands.append(self.parse_not())
+        return operands[0] if len(operands) == 1 else ("and", operands)
+
+    def parse_not(self):
+        if self._is_keyword("!", "not"):
+            self.take()
+            return ("not", self.parse_not())
+        return self.parse_primary()
+
+    def parse_primary(self):
+        kind, text = self.peek()
+        if kind == "symbol" and text == "(":
+            self.take()
+            expression = self.parse_or()
+            if self.take() != ("symbol", ")"):
+                raise FilterQueryError("Missing closing parenthesis in filter query")
+            return expression
+        if kind != "column":
+            raise FilterQueryError("Expected a {column}, got {!r}".format(text))
+        column = self.take()[1]
+
+        if self._is_keyword(None, "is"):
+            self.take()
+            kind, text = self.take()
+            if kind != "word" or text.lower() not in UNARY_OPERATORS:
+                raise FilterQueryError("Unknown unary operator 'is {}'".format(text))
+            return ("unary", column, text.lower())
+
+        operator, case_insensitive = _operator(self.peek())
+        if operator is None:
+            raise FilterQueryError("Unknown operator {!r}".format(self.peek()[1]))
+        self.take()
+        return ("relation", column, operator, _literal(self.take()), case_insensitive)
+
+
+def parse_filter_query(query):
+    """Parse a DataTable filter query into an expression tree (None if empty).
+    """
+    if not query or not query.strip():
+        return None
+    return _Parser(_tokenize(query)).parse()
+
+
+def _on_values(series, predicate):
+    """Apply predicate (object ndarray -> bool ndarray) to the non-missing
+    values of series, evaluating categoricals once per category present.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        # the rows of one genome use few of the categories of the whole table
+        present = np.unique(codes[codes >= 0])
+        per_category = np.zeros(len(series.cat.categories) + 1, dtype=bool)  # code -1 (missing) never matches
+        if len(present):
+            categories = series.cat.categories.to_numpy(dtype=object)
+            per_category[present] = np.asarray(predicate(categories[present]), dtype=bool)
+        return per_category[codes]
+    values = series.to_numpy(dtype=object)
+    mask = np.zeros(len(values), dtype=bool)
+    present = ~pd.isnull(values)
+    if present.any():
+        mask[present] = np.asarray(predicate(values[present]), dtype=bool)
+    return mask
+
+
+def _string_predicate(operator, value, case_insensitive):
+    value = str(value)
+    if case_insensitive:
+        value = value.lower()
+
+    def predicate(values):
+        strings = pd.Series(values, dtype=object).astype(str)
+        if case_insensitive:
+            strings = strings.str.lower()
+        if operator == "contains":
+            return strings.str.contains(value, regex=False).to_numpy()
+        if operator == "datestartswith":
+            return strings.str.startswith(value).to_numpy()
+        return {"eq": strings == value, "ne": strings != value,
+                "lt": strings < value, "le": strings <= value,
+                "gt": strings > value, "ge": strings >= value}[operator].to_numpy()
+    return predicate
+
+
+def _relation_mask(frame, column, operator, value, case_insensitive):
+    if column not in frame.columns:
+        raise FilterQueryError("Unknown column {!r} in filter query".format(column))
+    series = frame[column]
+
+    if series.dtype.kind in "iuf" and operator not in ("contains", "datestartswith"):
+        if not isinstance(value, float):
+            return np.full(len(series), operator == "ne")
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        with np.errstate(invalid="ignore"):
+            mask = {"eq": values == value, "ne": values != value,
+                    "lt": values < value, "le": values <= value,
+                    "gt": values > value, "ge": values >= value}[operator]
+        return np.asarray(mask & ~pd.isnull(values), dtype=bool)
+
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if (operator in ("eq", "ne") and not case_insensitive and isinstance(series.dtype, pd.CategoricalDtype)
+            and series.cat.categories.inferred_type == "string"):
+        codes = series.cat.codes.to_numpy()
+        code = series.cat.categories.get_indexer([str(value)])[0]
+        if operator == "eq":
+            return codes == code if code >= 0 else np.zeros(len(codes), dtype=bool)
+        return (codes >= 0) & (codes != code)
+    return _on_values(series, _string_predicate(operator, value, case_insensitive))
+
+
+def _unary_mask(frame, column, operator):
+    if column not in frame.columns:
+        raise FilterQueryError("Unknown column {!r} in filter query".format(column))
+    series = frame[column]
+    missing = series.isna().to_numpy()
+    if operator == "nil":
+        return missing
+    if operator == "blank":
+        return missing | _on_values(series, lambda values: np.array([str(v).strip() == "" for v in values]))
+    is_numeric = series.dtype.kind in "iuf"
+    if operator == "num":
+        return ~missing if is_numeric else np.zeros(len(series), dtype=bool)
+    return np.zeros(len(series), dtype=bool) if is_numeric else ~missing
+
+
+def evaluate(expression, frame):
+    """Boolean mask of the rows of frame matching a parsed expression.
+    """
+    if expression is None:
+        return np.ones(len(frame.index), dtype=bool)
+    kind = expression[0]
+    if kind == "and":
+        return np.logical_and.reduce([evaluate(e, frame) for e in expression[1]])
+    if kind == "or":
+        return np.logical_or.reduce([evaluate(e, frame) for e in expression[1]])
+    if kind == "not":
+        return ~evaluate(expression[1], frame)
+    if kind == "unary":
+        return _unary_mask(frame, expression[1], expression[2])
+    return _relation_mask(frame, *expression[1:])
+
+
+def filter_frame(frame, query):
+    """Rows of frame matching the DataTable filter query.
+    """
+    expression = parse_filter_query(query)
+    if expression is None:
+        return frame
+    return frame[evaluate(expression, frame)]
+
+
+def sort_frame(frame, sort_by):
+    """Sort frame by a DataTable ``sort_by`` list (stable, missing last).
+    """
+    sort_by = [s for s in (sort_by or []) if s.get("column_id") in frame.columns]
+    if not sort_by:
+        return frame
+    return frame.sort_values([s["column_id"] for s in sort_by],
+                             ascending=[s.get("direction", "asc") == "asc" for s in sort_by],
+                             kind="stable", na_position="last")
+
+
+def page_frame(frame, page_current, page_size):
+    """The rows of one page and the total number of pages.
+    """
+    page_size = max(int(page_size or 1), 1)
+    page_count = max(int(math.ceil(len(frame.index) / page_size)), 1)
+    page_current = min(max(int(page_current or 0), 0), page_count - 1)
+    return frame.iloc[page_current * page_size:(page_current + 1) * page_size], page_count
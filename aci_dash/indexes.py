@@ -0,0 +1,266 @@
+# coding=utf8
+
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+
+class PartitionIndex:
+    """Map every value of a column to the rows holding it.
+
+    If the rows of each value are contiguous (the feature table is sorted
+    by assembly when it is built), only a (start, stop) range is kept per
+    value and ``rows`` returns a cheap positional slice; otherwise the
+    row positions of each value are stored.
+    """
+
+    def __init__(self, frame, column):
+        self.frame = frame
+        self.column = column
+        codes, uniques = pd.factorize(frame[column], sort=False)
+        codes = np.asarray(codes)
+        # missing values (code -1) are left out of the index
+        self.contiguous = bool(len(codes) == 0 or
+                               (codes.min() >= 0 and
+                                np.count_nonzero(np.diff(codes)) == len(uniques) - 1))
+        self._parts = {}
+        if self.contiguous:
+            starts = np.concatenate([[0], np.flatnonzero(np.diff(codes)) + 1]) if len(codes) else []
+            stops = list(starts[1:]) + [len(codes)]
+            for start, stop in zip(starts, stops):
+                self._parts[uniques[codes[start]]] = slice(int(start), int(stop))
+        else:
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            for code, key in enumerate(uniques):
+                self._parts[key] = order[bounds[code]:bounds[code + 1]]
+
+    def __contains__(self, key):
+        return key in self._parts
+
+    def __len__(self):
+        return len(self._parts)
+
+    def keys(self):
+        return self._parts.keys()
+
+    def positions(self, key):
+        """Row positions of key, as a slice or an integer array.
+        """
+        return self._parts.get(key, slice(0, 0))
+
+    def size(self, key):
+        part = self.positions(key)
+        if isinstance(part, slice):
+            return part.stop - part.start
+        return len(part)
+
+    def rows(self, key):
+        """The rows of frame whose column equals key (empty if unknown).
+        """
+        return self.frame.iloc[self.positions(key)]
+
+    @property
+    def nbytes(self):
+        return sys.getsizeof(self._parts) + sum(part.nbytes if isinstance(part, np.ndarray)
+                                                else sys.getsizeof(part) for part in self._parts.values())
+
+
+class PositionMap:
+    """Position of the first row holding each key in an ordered view of a
+    table, e.g. accession -> position in the sorted, filtered DataTable.
+
+    Keys are looked up in the (shared) categories of the column and
+    resolved to a position by binary search over the view's sorted codes.
+    """
+
+    def __init__(self, keys, row_ids):
+        keys = pd.Categorical(keys)
+        self.categories = keys.categories
+        codes = np.asarray(keys.codes)
+        self._order = np.argsort(codes, kind="stable")
+        self._sorted_codes = codes[self._order]
+        self.row_ids = np.asarray(row_ids)
+
+    def __len__(self):
+        return len(self.row_ids)
+
+    def position(self, key):
+        """Position of the first row holding key, None if there is none.
+        """
+        if key not in self.categories:
+            return None
+        code = self.categories.get_loc(key)
+        i = np.searchsorted(self._sorted_codes, code)
+        if i == len(self._sorted_codes) or self._sorted_codes[i] != code:
+            return None
+        return int(self._order[i])
+
+    @property
+    def nbytes(self):
+        return self._order.nbytes + self._sorted_codes.nbytes + self.row_ids.nbytes
+
+
+TEXT_SPLIT_RE = re.compile(r"[^0-9a-z_.\-/]+")
+SUBTOKEN_SPLIT_RE = re.compile(r"[-_./]+")
+
+
+def text_tokens(text):
+    """Lower-cased words of text, plus the parts of compound words
+    ("OXA-23-like" -> oxa-23-like, oxa, 23, like).
+    """
+    tokens = set()
+    for word in TEXT_SPLIT_RE.split(str(text).lower()):
+        word = word.strip("-_./")
+        if not word:
+            continue
+        tokens.add(word)
+        tokens.update(part for part in SUBTOKEN_SPLIT_RE.split(word) if part)
+    return tokens
+
+
+class ProteinSearchIndex:
+    """Inverted token index over the protein annotations of all genomes.
+
+    Annotation words and gene symbols are tokenized once per distinct
+    value (the columns are categoricals) and every token maps to the
+    category codes containing it. Accessions and locus tags are looked
+    up in their sorted categories instead, with or without version
+    suffix. A query turns the matching categories into a row mask
+    through the codes, ranks rows by the idf weight of the matched terms
+    and groups the hits by assembly.
+    """
+
+    TEXT_FIELDS = {"Sym": 2.0, "Protein Annotation": 1.0}
+    ACCESSION_FIELDS = {"RefSeq Acc": 3.0, "Locus_tag": 3.0}
+
+    def __init__(self, frame, group_column="assembly", min_score_ratio=0.5):
+        self.frame = frame
+        self.group_column = group_column
+        self.min_score_ratio = min_score_ratio
+        self.n_rows = len(frame.index)
+        self.text_fields = {}
+        self.accession_fields = {}
+        for column, weight in self.TEXT_FIELDS.items():
+            if column not in frame.columns:
+                continue
+            codes, uniques = pd.factorize(frame[column], sort=False)
+            postings = {}
+            for code, value in enumerate(uniques):
+                for token in text_tokens(value):
+                    postings.setdefault(token, []).append(code)
+            postings = {token: np.asarray(c, dtype=np.int32) for token, c in postings.items()}
+            self.text_fields[column] = (np.asarray(codes), len(uniques), postings, weight)
+        for column, weight in self.ACCESSION_FIELDS.items():
+            if column not in frame.columns:
+                continue
+            codes, uniques = pd.factorize(frame[column], sort=True)
+            codes, uniques = np.asarray(codes), np.asarray(uniques, dtype=object)
+            if not pd.Index(uniques).is_monotonic_increasing:
+                # categoricals factorize in category order, which need not be lexical
+                order = np.argsort(uniques)
+                rank = np.empty_like(order)
+                rank[order] = np.arange(len(order))
+                codes = np.where(codes >= 0, rank[codes], -1)
+                uniques = uniques[order]
+            self.accession_fields[column] = (codes, uniques, weight)
+        self.group_codes, self.groups = pd.factorize(frame[group_column], sort=False)
+
+    def __len__(self):
+        return sum(len(postings) for _, _, postings, _ in self.text_fields.values())
+
+    @property
+    def nbytes(self):
+        # arrays held by the index; object arrays count their pointers only
+        total = self.group_codes.nbytes
+        for codes, _, postings, _ in self.text_fields.values():
+            total += codes.nbytes + sys.getsizeof(postings) + sum(c.nbytes for c in postings.values())
+        for codes, sorted_values, _ in self.accession_fields.values():
+            total += codes.nbytes + sorted_values.nbytes
+        return total
+
+    @staticmethod
+    def _mask_rows(codes, n_categories, categories):
+        # the extra last slot is hit by missing values (code -1) and never matches
+        category_mask = np.zeros(n_categories + 1, dtype=bool)
+        category_mask[categories] = True
+        return category_mask[codes]
+
+    def text_weights(self, token):
+        """Per-row weight of the best field containing the word token.
+        """
+        weights = np.zeros(self.n_rows, dtype=np.float32)
+        for codes, n_categories, postings, weight in self.text_fields.values():
+            categories = postings.get(token)
+            if categories is not None:
+                rows = self._mask_rows(codes, n_categories, categories)
+                np.maximum(weights, np.where(rows, weight, 0), out=weights)
+        return weights
+
+    def accession_weights(self, accession):
+        """Per-row weight of the accession fields equal to accession, which may
+        omit the version suffix.
+        """
+        weights = np.zeros(self.n_rows, dtype=np.float32)
+        for codes, sorted_values, weight in self.accession_fields.values():
+            categories = []
+            for candidate in {accession, accession.upper()}:
+                lo, hi = np.searchsorted(sorted_values, [candidate, candidate + "\x00"])
+                categories.extend(range(lo, hi))
+                prefix = candidate + "."
+                lo, hi = np.searchsorted(sorted_values, [prefix, prefix + "\uffff"])
+                categories.extend(range(lo, hi))
+            if categories:
+                rows = self._mask_rows(codes, len(sorted_values), categories)
+                np.maximum(weights, np.where(rows, weight, 0), out=weights)
+        return weights
+
+    def search(self, query, max_groups=None, proteins_per_group=3, progress=None):
+        """Rank the rows matching query and group them by assembly.
+
+        Returns a list of dicts (assembly, hits, score, proteins) ordered by
+        best score and number of hits. progress, if given, is called with
+        (done, total) after every query term.
+        """
+        if not query or self.n_rows == 0:
+            return []
+        lookups = [(self.text_weights, token) for token in text_tokens(query)]
+        lookups += [(self.accession_weights, unit) for unit in re.split(r"[\s,;]+", query.strip()) if unit]
+        terms = []
+        for lookup, term in lookups:
+            terms.append(lookup(term))
+            if progress is not None:
+                progress(len(terms), len(lookups))
+
+        scores = np.zeros(self.n_rows, dtype=np.float32)
+        total = 0.0
+        for weights in terms:
+            n_matching = np.count_nonzero(weights)
+            if n_matching == 0:
+                continue
+            idf = np.log1p(self.n_rows / n_matching)
+            scores += weights * idf
+            total += idf * weights.max()
+        if total == 0.0:
+            return []
+
+        hits = np.flatnonzero(scores >= self.min_score_ratio * total)
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        group_of_hit = self.group_codes[hits]
+
+        results = []
+        for code in pd.unique(group_of_hit):
+            if code < 0:
+                continue
+            rows = hits[group_of_hit == code]
+            sample = self.frame.iloc[rows[:proteins_per_group]]
+            results.append({"assembly": self.groups[code],
+                            "hits": int(len(rows)),
+                            "score": round(float(scores[rows[0]] / total), 3),
+                            "proteins": [{"RefSeq Acc": acc, "Protein Annotation": annotation}
+                                         for acc, annotation in zip(sample["RefSeq Acc"],
+                                                                    sample["Protein Annotation"])]})
+        results.sort(key=lambda r: (-r["score"], -r["hits"]))
+        return results[:max_groups] if max_groups else results
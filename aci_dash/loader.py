@@ -0,0 +1,98 @@
+# coding=utf8
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class BackgroundLoader:
+    """Run a (slow) load function in a daemon thread.
+
+    The loader is LOADING until load_fn returns, then READY with the
+    returned value available as ``result``. If load_fn raises, the loader
+    is FAILED and the exception is kept in ``error``. ``on_ready`` is
+    called with the result before the state switches to READY, so
+    readers never observe READY with half-published data.
+    """
+
+    def __init__(self, load_fn, on_ready=None, name="data-loader"):
+        self.load_fn = load_fn
+        self.on_ready = on_ready
+        self.name = name
+        self.state = LOADING
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            result = self.load_fn()
+            if self.on_ready is not None:
+                self.on_ready(result)
+            self.result = result
+            self.state = READY
+        except Exception as e:
+            logger.exception("Loading datasets failed")
+            self.error = e
+            self.state = FAILED
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def wait(self, timeout=None):
+        """Block until loading has finished; return True if it succeeded.
+        """
+        self._done.wait(timeout)
+        return self.ready
+
+    def status(self):
+        finished = self.finished_at or time.time()
+        status = {"state": self.state,
+                  "elapsed_s": round(finished - self.started_at, 3) if self.started_at else 0.0}
+        if self.error is not None:
+            status["error"] = "{}: {}".format(type(self.error).__name__, self.error)
+        return status
+
+
+def run_concurrently(tasks, max_workers=None):
+    """Run the callables in the dict tasks in a thread pool.
+
+    Returns a dict of results and a dict of wall times in seconds, both
+    keyed like tasks. The first exception raised by a task is re-raised
+    once all tasks have finished.
+    """
+    timings = {}
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            timings[name] = round(time.perf_counter() - start, 3)
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(tasks) or 1,
+                            thread_name_prefix="dataset") as pool:
+        futures = {name: pool.submit(timed, name, fn) for name, fn in tasks.items()}
+    results = {name: future.result() for name, future in futures.items()}
+    return results, timings
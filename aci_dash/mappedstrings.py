@@ -0,0 +1,200 @@
+# coding=utf8
+"""Read-only string column over one UTF-8 buffer and its offsets.
+
+columnar stores high-cardinality text columns (locus tags, KEGG and COG
+ids) as the concatenated UTF-8 bytes of all values, the offsets of every
+value and a missing mask. MappedStringArray is a pandas extension array
+over those arrays, which may be memory-mapped: slicing, taking and
+filtering rows only compose a row index, and values are decoded when
+they are read, e.g. for the rows of one table page.
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import (ExtensionArray, ExtensionDtype, register_extension_dtype,
+                                   take as take_array)
+from pandas.api.indexers import check_array_indexer
+
+# decode a whole byte range at once if it is at most this many times
+# larger than the bytes of the requested values
+_BULK_DECODE_SLACK = 4
+
+
+def encode_strings(values):
+    """Return (offsets, data, missing) arrays of a sequence of strings and missing values.
+    """
+    values = np.asarray(values, dtype=object)
+    missing = np.asarray(pd.isnull(values), dtype=bool)
+    encoded = [b"" if is_missing else str(value).encode("utf8")
+               for value, is_missing in zip(values, missing)]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded)),
+              out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return offsets, data, missing
+
+
+@register_extension_dtype
+class MappedStringDtype(ExtensionDtype):
+    name = "mapped_string"
+    type = str
+    kind = "O"
+    na_value = np.nan
+
+    @classmethod
+    def construct_array_type(cls):
+        return MappedStringArray
+
+
+class MappedStringArray(ExtensionArray):
+    """Strings stored as ``data[offsets[i]:offsets[i + 1]]``, missing where ``missing[i]``.
+
+    ``rows`` selects (and orders) the stored values this array holds,
+    -1 standing for a missing value; None means all of them.
+    """
+
+    _dtype = MappedStringDtype()
+
+    def __init__(self, offsets, data, missing, rows=None, ascii=None):
+        self._offsets = offsets
+        self._data = data
+        self._missing = missing
+        self._rows = rows
+        if ascii is None:
+            ascii = bool(len(data) == 0 or data.max() < 0x80)
+        self._ascii = ascii
+
+    def _select(self, rows):
+        return type(self)(self._offsets, self._data, self._missing, rows, self._ascii)
+
+    def _row_positions(self):
+        if self._rows is None:
+            return np.arange(len(self._missing))
+        return self._rows
+
+    def _decode(self):
+        rows = self._row_positions()
+        result = np.full(len(rows), np.nan, dtype=object)
+        valid = rows >= 0
+        valid[valid] = ~self._missing[rows[valid]]
+        selected = np.flatnonzero(valid)
+        if len(selected) == 0:
+            return result
+        starts = self._offsets[rows[selected]]
+        stops = self._offsets[rows[selected] + 1]
+        low, high = int(starts.min()), int(stops.max())
+        if self._ascii and high - low <= _BULK_DECODE_SLACK * int((stops - starts).sum()) + 4096:
+            # one decode of the covering byte range, then cheap str slices
+            text = self._data[low:high].tobytes().decode("ascii")
+            result[selected] = [text[start - low:stop - low]
+                                for start, stop in zip(starts.tolist(), stops.tolist())]
+        else:
+            data = self._data
+            result[selected] = [data[start:stop].tobytes().decode("utf8")
+                                for start, stop in zip(starts.tolist(), stops.tolist())]
+        return result
+
+    @classmethod
+    def _from_sequence(cls, scalars, *, dtype=None, copy=False):
+        offsets, data, missing = encode_strings(scalars)
+        return cls(offsets, data, missing)
+
+    @classmethod
+    def _from_factorized(cls, values, original):
+        return cls._from_sequence(values)
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def nbytes(self):
+        if self._rows is None:
+            return self._offsets.nbytes + self._data.nbytes + self._missing.nbytes
+        return self._rows.nbytes
+
+    def __len__(self):
+        return len(self._missing) if self._rows is None else len(self._rows)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, np.integer)):
+            row = range(len(self))[item] if self._rows is None else self._rows[item]
+            return self._select(np.array([row], dtype=np.int64))._decode()[0]
+        if isinstance(item, slice) and self._rows is None:
+            return self._select(np.arange(*item.indices(len(self)), dtype=np.int64))
+        if isinstance(item, tuple):
+            # the (Ellipsis, ...) keys pandas uses on 1-D arrays
+            item = next((key for key in item if key is not Ellipsis), slice(None))
+        if not isinstance(item, slice):
+            item = check_array_indexer(self, item)
+        return self._select(self._row_positions()[item])
+
+    def __setitem__(self, key, value):
+        # rare (pandas never writes to loaded tables), so re-encode the column
+        values = self._decode()
+        if not isinstance(key, (int, np.integer, slice)):
+            key = check_array_indexer(self, key)
+        values[key] = value
+        self._offsets, self._data, self._missing = encode_strings(values)
+        self._rows = None
+        self._ascii = bool(len(self._data) == 0 or self._data.max() < 0x80)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self._decode()
+        if dtype is None or np.dtype(dtype) == object:
+            return values
+        return values.astype(dtype)
+
+    def __eq__(self, other):
+        if isinstance(other, (pd.Series, pd.Index, pd.DataFrame)):
+            return NotImplemented
+        values = self._decode()
+        if pd.api.types.is_list_like(other):
+            other = np.asarray(other, dtype=object)
+        return np.asarray(values == other, dtype=bool) & ~self.isna()
+
+    def __ne__(self, other):
+        if isinstance(other, (pd.Series, pd.Index, pd.DataFrame)):
+            return NotImplemented
+        return ~self.__eq__(other)
+
+    def isna(self):
+        rows = self._row_positions()
+        result = np.ones(len(rows), dtype=bool)
+        valid = rows >= 0
+        result[valid] = self._missing[rows[valid]]
+        return result
+
+    def take(self, indices, allow_fill=False, fill_value=None):
+        if allow_fill and not pd.isnull(fill_value):
+            values = take_array(self._decode(), indices, allow_fill=True, fill_value=fill_value)
+            return self._from_sequence(values)
+        return self._select(take_array(self._row_positions(), indices, allow_fill=allow_fill,
+                                       fill_value=-1))
+
+    def copy(self):
+        # the stored arrays are never written to, only the selection is copied
+        return self._select(None if self._rows is None else self._rows.copy())
+
+    def astype(self, dtype, copy=True):
+        dtype = pd.api.types.pandas_dtype(dtype)
+        if dtype == self.dtype:
+            return self.copy() if copy else self
+        if isinstance(dtype, ExtensionDtype):
+            return dtype.construct_array_type()._from_sequence(self._decode(), dtype=dtype)
+        return self._decode().astype(dtype, copy=False)
+
+    def _values_for_factorize(self):
+        return self._decode(), np.nan
+
+    def _values_for_argsort(self):
+        values = self._decode()
+        values[self.isna()] = ""
+        return values
+
+    @classmethod
+    def _concat_same_type(cls, to_concat):
+        first = to_concat[0]
+        if all(array._data is first._data for array in to_concat):
+            return first._select(np.concatenate([array._row_positions() for array in to_concat]))
+        return cls._from_sequence(np.concatenate([array._decode() for array in to_concat]))
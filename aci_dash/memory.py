@@ -0,0 +1,77 @@
+# coding=utf8
+
+import os
+import sys
+import resource
+import threading
+import tracemalloc
+
+
+def frame_usage(frame):
+    """memory_usage(deep=True) of every column (and the index) of frame,
+    largest first.
+    """
+    if frame is None:
+        return None
+    usage = frame.memory_usage(deep=True).sort_values(ascending=False)
+    dtypes = frame.dtypes
+    return {"rows": int(len(frame.index)),
+            "bytes": int(usage.sum()),
+            "columns": [{"column": str(column),
+                         "bytes": int(size),
+                         "dtype": str(dtypes[column] if column in dtypes.index else frame.index.dtype)}
+                        for column, size in usage.items()]}
+
+
+def process_memory():
+    """Resident set size of this process and its peak, in bytes.
+    """
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    rss = None
+    try:
+        with open("/proc/self/statm") as fh:
+            rss = int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    return {"pid": os.getpid(), "rss_bytes": rss, "peak_rss_bytes": peak}
+
+
+class TracemallocDiff:
+    """Top allocation differences between consecutive snapshots.
+
+    The first ``diff`` starts tracing (which slows allocations down until
+    ``stop``) and takes the baseline snapshot; every following ``diff``
+    compares a new snapshot with the previous one.
+    """
+
+    def __init__(self, frames=1):
+        self.frames = frames
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def diff(self, limit=10, key_type="lineno"):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+                self._snapshot = None
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, tracemalloc.__file__)])
+            previous, self._snapshot = self._snapshot, snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        result = {"tracing": True, "traced_bytes": current, "traced_peak_bytes": peak, "top": []}
+        if previous is None:
+            result["baseline"] = True
+            return result
+        for stat in snapshot.compare_to(previous, key_type)[:limit]:
+            frame = stat.traceback[0]
+            result["top"].append({"location": "{}:{}".format(frame.filename, frame.lineno),
+                                  "size_diff": stat.size_diff, "size": stat.size,
+                                  "count_diff": stat.count_diff})
+        return result
+
+    def stop(self):
+        with self._lock:
+            self._snapshot = None
+            tracemalloc.stop()
+        return {"tracing": False}
@@ -0,0 +1,209 @@
+# coding=utf8
+"""Latency, phase and payload-size metrics of the Dash callbacks.
+
+Every _dash-update-component request is timed as a whole; callbacks
+decorated with ``measure`` also report the time spent in their function
+body ("callback") and the rest of the request ("overhead": request
+parsing, dispatch, JSON serialization and Flask). Code inside ``phase("figure")`` reports the
+figure building. The metrics are exposed as Prometheus histograms on
+/metrics and per response as a Server-Timing header. They are kept per
+process, so with several gunicorn workers every scrape sees one worker.
+
+When disabled, ``measure`` returns the function unchanged, ``phase``
+returns a shared no-op context and no request hooks are registered.
+"""
+
+import time
+import threading
+import functools
+
+from flask import Response, g, has_request_context, request
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 1e7)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values):
+    return ",".join('{}="{}"'.format(n, escape_label(v)) for n, v in zip(names, values))
+
+
+class Histogram:
+    """Thread-safe cumulative histogram per label set, in the Prometheus
+    text format.
+    """
+
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def expose(self):
+        lines = ["# HELP {} {}".format(self.name, self.description),
+                 "# TYPE {} histogram".format(self.name)]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            label_text = format_labels(self.label_names, labels)
+            for bound, count in zip(self.buckets + ("+Inf",), values[:len(self.buckets)] + [values[-1]]):
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(
+                    self.name, label_text, bound if bound == "+Inf" else repr(float(bound)), count))
+            lines.append("{}_sum{{{}}} {!r}".format(self.name, label_text, values[-2]))
+            lines.append("{}_count{{{}}} {}".format(self.name, label_text, values[-1]))
+        return lines
+
+
+class NullPhase:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class Phase:
+    """Adds the time spent in its block to the phases of the current
+    request.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        phases = g.setdefault("callback_phases", {})
+        phases[self.name] = phases.get(self.name, 0.0) + time.perf_counter() - self.start
+        return False
+
+
+class CallbackMetrics:
+    """Metrics of the callback requests of one Dash app.
+    """
+
+    def __init__(self, enabled=False, prefix="aci_dash"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.caches = {}
+        self._names = None
+        self.duration = Histogram(prefix + "_callback_duration_seconds",
+                                  "Wall time of callback requests.",
+                                  ("callback", "trigger", "status"), DURATION_BUCKETS)
+        self.phases = Histogram(prefix + "_callback_phase_seconds",
+                                "Time spent in the phases of callback requests.",
+                                ("callback", "phase"), DURATION_BUCKETS)
+        self.response_bytes = Histogram(prefix + "_callback_response_bytes",
+                                        "Size of callback responses.",
+                                        ("callback",), SIZE_BUCKETS)
+
+    def phase(self, name):
+        """Context manager timing a phase of the current callback request.
+        """
+        if not self.enabled or not has_request_context():
+            return NULL_PHASE
+        return Phase(name)
+
+    def measure(self, func):
+        """Decorator timing the body of a callback function as its
+        "callback" phase; place it below ``app.callback``.
+        """
+        if not self.enabled:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.phase("callback"):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def instrument(self, app, caches=None):
+        """Time the callback requests of app and serve /metrics from its
+        server. caches maps names to caches with FigureCache.stats().
+        """
+        self.caches = dict(caches or {})
+        if not self.enabled:
+            return
+        server = app.server
+        update_path = app.config.routes_pathname_prefix + "_dash-update-component"
+
+        @server.before_request
+        def start_callback_timer():
+            if request.path == update_path:
+                g.callback_start = time.perf_counter()
+
+        @server.after_request
+        def record_callback_metrics(response):
+            start = g.pop("callback_start", None)
+            if start is None:
+                return response
+            self.record(app, response, time.perf_counter() - start)
+            return response
+
+        server.add_url_rule("/metrics", "metrics", self.serve)
+
+    def callback_name(self, app, output):
+        if self._names is None or output not in self._names:
+            # callbacks are registered after instrument(), look them up lazily
+            self._names = {key: getattr(entry.get("callback"), "__name__", key)
+                           for key, entry in app.callback_map.items()}
+        return self._names.get(output, output)
+
+    def record(self, app, response, total):
+        body = request.get_json(silent=True) or {}
+        callback = self.callback_name(app, body.get("output"))
+        # the prop ids callback_context.triggered is built from
+        trigger = ",".join(sorted(body.get("changedPropIds") or [])) or "."
+        phases = dict(g.pop("callback_phases", {}))
+        if "callback" in phases:
+            phases["overhead"] = max(total - phases["callback"], 0.0)
+        size = 0 if response.direct_passthrough else len(response.get_data())
+
+        self.duration.observe((callback, trigger, str(response.status_code)), total)
+        for name, seconds in phases.items():
+            self.phases.observe((callback, name), seconds)
+        self.response_bytes.observe((callback,), size)
+
+        timings = ['total;dur={:.1f};desc="{}"'.format(total * 1000, callback)]
+        timings += ["{};dur={:.1f}".format(name, seconds * 1000) for name, seconds in phases.items()]
+        response.headers.add("Server-Timing", ", ".join(timings))
+
+    def expose(self):
+        lines = self.duration.expose() + self.phases.expose() + self.response_bytes.expose()
+        gauges = (("entries", "gauge", "Entries in the cache."),
+                  ("bytes", "gauge", "Estimated bytes held by the cache."),
+                  ("hits", "counter", "Cache hits."),
+                  ("misses", "counter", "Cache misses."),
+                  ("evictions", "counter", "Cache evictions."))
+        stats = {name: cache.stats() for name, cache in self.caches.items()}
+        for key, kind, description in gauges:
+            name = "{}_cache_{}{}".format(self.prefix, key, "_total" if kind == "counter" else "")
+            lines += ["# HELP {} {}".format(name, description), "# TYPE {} {}".format(name, kind)]
+            lines += ['{}{{cache="{}"}} {}'.format(name, escape_label(cache), values[key])
+                      for cache, values in sorted(stats.items())]
+        return "\n".join(lines) + "\n"
+
+    def serve(self):
+        return Response(self.expose(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,89 @@
+# coding=utf8
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# string columns with at most this share of distinct values become categoricals
+CATEGORICAL_MAX_RATIO = 0.5
+
+
+def _is_string_series(series):
+    if series.dtype != object and not pd.api.types.is_string_dtype(series.dtype):
+        return False
+    return all(isinstance(v, str) for v in series.dropna())
+
+
+def _is_integral(values):
+    finite = values[~np.isnan(values)]
+    return bool(np.all(np.mod(finite, 1) == 0))
+
+
+def compact_series(series, categorical_max_ratio=CATEGORICAL_MAX_RATIO):
+    """Return series converted to the narrowest dtype that holds its values.
+
+    Integers are downcast to the smallest signed type, integral floats
+    without missing values become integers and those with missing values
+    the smallest nullable integer type (Int8 .. Int32). Repetitive string
+    columns become categoricals; everything else is returned unchanged.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    kind = series.dtype.kind
+    if kind in "iu":
+        return pd.to_numeric(series, downcast="integer")
+    if kind == "f":
+        values = series.to_numpy()
+        if len(values) and _is_integral(values):
+            if not series.isna().any():
+                return pd.to_numeric(series.astype(np.int64), downcast="integer")
+            if np.nanmax(np.abs(values)) < 2 ** 31:
+                return pd.to_numeric(series.astype("Int64"), downcast="integer")
+        return series
+    if _is_string_series(series):
+        n_distinct = series.nunique(dropna=True)
+        if len(series) and n_distinct <= categorical_max_ratio * len(series):
+            return series.astype("category")
+    return series
+
+
+def compact_frame(frame, categorical_max_ratio=CATEGORICAL_MAX_RATIO, keep=()):
+    """Return a copy of frame with every column (except those in keep) and a
+    numeric index compacted by compact_series.
+    """
+    columns = {column: frame[column] if column in keep
+               else compact_series(frame[column], categorical_max_ratio)
+               for column in frame.columns}
+    compacted = pd.DataFrame(columns, index=frame.index)
+    if frame.index.dtype.kind in "iu":
+        compacted.index = pd.Index(pd.to_numeric(frame.index.to_series(), downcast="integer"),
+                                   name=frame.index.name)
+    return compacted
+
+
+def memory_report(before, after):
+    """Compare memory_usage(deep=True) of two versions of a table.
+    """
+    usage_before = before.memory_usage(deep=True)
+    usage_after = after.memory_usage(deep=True)
+    columns = {str(column): {"before": int(usage_before[column]),
+                             "after": int(usage_after[column]),
+                             "dtype": str(after[column].dtype) if column in after.columns
+                             else str(after.index.dtype)}
+               for column in usage_before.index}
+    return {"before": int(usage_before.sum()),
+            "after": int(usage_after.sum()),
+            "columns": columns}
+
+
+def normalize(frame, name, **kwargs):
+    """compact_frame with a log line summarising the memory saved.
+    """
+    compacted = compact_frame(frame, **kwargs)
+    report = memory_report(frame, compacted)
+    logger.info("Schema normalisation of %s: %.1f MiB -> %.1f MiB", name,
+                report["before"] / 2 ** 20, report["after"] / 2 ** 20)
+    return compacted, report
@@ -0,0 +1,113 @@
+# coding=utf8
+
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+TABLE = "feat_tables"
+
+INDEXES = {
+    "idx_feat_tables_assembly": ["assembly"],
+    "idx_feat_tables_refseq": ["RefSeq Acc"],
+    "idx_feat_tables_genomic_start": ["Genomic Acc", "Start"],
+}
+
+
+def _quote(identifier):
+    return '"{}"'.format(identifier.replace('"', '""'))
+
+
+def build_database(frame, db_path):
+    """Write the feature table frame (indexed by id) into an SQLite file.
+
+    The database is built next to db_path and renamed into place, so
+    concurrent workers either see no database or a complete one.
+    """
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=str(db_path.parent), prefix=".tmp-", suffix=".sqlite")
+    os.close(fd)
+    try:
+        con = sqlite3.connect(tmp_name)
+        try:
+            columns = {column: (frame[column].astype(object)
+                                if isinstance(frame[column].dtype, pd.CategoricalDtype)
+                                else frame[column])
+                       for column in frame.columns if column != "id"}
+            table = pd.DataFrame(columns, index=frame.index.rename("id"))
+            table.to_sql(TABLE, con, index=True, index_label="id", chunksize=50000)
+            for name, columns in INDEXES.items():
+                con.execute("CREATE INDEX {} ON {} ({})".format(
+                    name, TABLE, ", ".join(_quote(c) for c in columns)))
+            con.execute("ANALYZE")
+            con.commit()
+        finally:
+            con.close()
+        os.replace(tmp_name, str(db_path))
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+class FeatureDatabase:
+    """Read-only access to a feature table database built by build_database.
+
+    Connections are pooled per process (a forked gunicorn worker opens
+    its own) and handed out one per thread at a time.
+    """
+
+    def __init__(self, db_path, pool_size=4):
+        self.db_path = Path(db_path)
+        self.pool_size = pool_size
+        self._pid = None
+        self._pool = None
+        self._lock = threading.Lock()
+        with self.connection() as con:
+            self.columns = [row[1] for row in con.execute("PRAGMA table_info({})".format(TABLE))]
+
+    def _connect(self):
+        con = sqlite3.connect("file:{}?mode=ro".format(self.db_path), uri=True,
+                              check_same_thread=False)
+        con.execute("PRAGMA query_only = ON")
+        return con
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pool = queue.LifoQueue(maxsize=self.pool_size)
+            return self._pool
+
+    @contextmanager
+    def connection(self):
+        pool = self._get_pool()
+        try:
+            con = pool.get_nowait()
+        except queue.Empty:
+            con = self._connect()
+        try:
+            yield con
+        finally:
+            try:
+                pool.put_nowait(con)
+            except queue.Full:
+                con.close()
+
+    def query(self, where, params):
+        sql = "SELECT * FROM {} WHERE {} ORDER BY rowid".format(TABLE, where)
+        with self.connection() as con:
+            frame = pd.read_sql_query(sql, con, params=params, index_col="id")
+        frame["id"] = frame.index
+        return frame
+
+    def assembly_rows(self, assembly_acc):
+        """All features of one assembly, in table order.
+        """
+        return self.query("assembly = ?", (assembly_acc,))
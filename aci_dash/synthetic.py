@@ -0,0 +1,215 @@
+# coding=utf8
+"""Synthetic stand-ins for the published datasets.
+
+The tables have the schema (and file formats) of the files served from
+DATA_URL, at a configurable number of genomes and proteins per genome,
+so callbacks can be benchmarked and load tested offline::
+
+    python -m aci_dash.synthetic /tmp/aci-data --genomes 50 --proteins 4000
+    DATA_URL=http://localhost:8000/ ...   # after serving /tmp/aci-data
+"""
+
+import bz2
+import pickle
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# the genome selected when the page is opened
+DEFAULT_ASSEMBLY = "GCF_000737145.1"
+
+# taxonomic groups of full_hog_table; complete_acb and other sum up the species
+SPECIES_GROUPS = {"baumannii": 55, "calcoaceticus": 4, "other_acb": 34, "haemolyticus": 50,
+                  "baylyi": 9, "lwoffii": 71, "brisouii": 7, "qingfengensis": 4}
+ACB_GROUPS = ("baumannii", "calcoaceticus", "other_acb")
+
+CLADES = ["QI clade", "BR clade", "LW clade", "BA clade", "HA clade", "ACB clade", "BNS clade", "B clade"]
+
+GENOME_COLUMNS = ["#OMA_genome_identifier", "refseq_assembly_acc", "biosample_accession", "tax_id",
+                  "species_name", "additions_and_corrections", "short_name", "corrected_short_name",
+                  "internal_infection_sample_boolean", "sample_class", "sample_type",
+                  "comments_on_isolation", "scope", "country", "iso_alpha3", "location", "year",
+                  "publication"]
+
+COUNTRIES = [("Germany", "DEU", "europe", "Giessen"), ("Italy", "ITA", "europe", "Rome"),
+             ("USA", "USA", "north america", "Buffalo,NY"), ("China", "CHN", "asia", "Beijing"),
+             ("Brazil", "BRA", "south america", None)]
+
+ANNOTATIONS = ["OXA-{} family carbapenem-hydrolyzing class D beta-lactamase",
+               "hypothetical protein", "outer membrane protein OmpA-{}", "MFS transporter",
+               "TonB-dependent siderophore receptor", "efflux RND transporter periplasmic adaptor subunit",
+               "LysR family transcriptional regulator", "porin {}"]
+
+
+def feature_table(assemblies, proteins_per_genome, accessions, rng):
+    """NCBI feature table of all assemblies: one CDS (with protein) and
+    every 20th protein also a gene row, like p_feature_tables.pickle.
+    """
+    n_genomes = len(assemblies)
+    n_rows = n_genomes * proteins_per_genome
+    genome = np.repeat(np.arange(n_genomes), proteins_per_genome)
+    position = np.tile(np.arange(proteins_per_genome), n_genomes)
+    protein = rng.integers(0, len(accessions), n_rows)
+    start = position * 1100 + 1 + rng.integers(0, 100, n_rows)
+    length = 3 * rng.integers(60, 600, n_rows)
+    symbols = np.array(["bla", "omp", "ade", "bau", "csu", "pgl"], dtype=object)
+
+    cds = pd.DataFrame({
+        "# feature": "CDS",
+        "class": "with_protein",
+        "assembly": np.asarray(assemblies, dtype=object)[genome],
+        "assembly_unit": "Primary Assembly",
+        "seq_type": "chromosome",
+        "chromosome": np.nan,
+        "genomic_accession": ["NZ_CP{:06d}.1".format(g) for g in genome],
+        "start": start,
+        "end": start + length - 1,
+        "strand": np.where(rng.random(n_rows) < 0.5, "+", "-"),
+        "product_accession": accessions[protein],
+        "non-redundant_refseq": accessions[protein],
+        "related_accession": np.nan,
+        "name": [ANNOTATIONS[p % len(ANNOTATIONS)].format(p % 97) for p in protein],
+        "symbol": np.where(protein % 3 == 0, symbols[protein % len(symbols)] + (protein % 50).astype(str), None),
+        "GeneID": np.nan,
+        "locus_tag": ["SYN{:03d}_{:05d}".format(g, p) for g, p in zip(genome, position)],
+        "feature_interval_length": length,
+        "product_length": length // 3 - 1,
+        "attributes": np.where(rng.random(n_rows) < 0.05, "pseudo", None),
+    })
+    genes = cds.iloc[::20].assign(**{"# feature": "gene", "class": "protein_coding",
+                                     "product_accession": np.nan, "non-redundant_refseq": np.nan})
+    features = pd.concat([cds, genes]).sort_values(["assembly", "start"], kind="stable")
+    return features.reset_index(drop=True)
+
+
+def annotation_table(accessions, rng, strain_specific_ratio=0.1):
+    """full_hog_table (p_full_annot.pickle): HOG, core/pan genome and
+    prevalence annotation of every protein that is not strain specific.
+    """
+    annotated = accessions[rng.random(len(accessions)) >= strain_specific_ratio]
+    n = len(annotated)
+    # a few proteins per ortho-family
+    hog_ids = np.array(["HOG{:05d}".format(i // 3) for i in range(n)], dtype=object)
+    table = pd.DataFrame(index=pd.Index(annotated))
+    table["hog_id1"] = hog_ids
+    table["aci_core231_of_234"] = rng.choice(["Core", "Accessory"], n, p=[0.4, 0.6])
+    table["acb_core91_of_93"] = rng.choice(["Core", "Accessory"], n, p=[0.5, 0.5])
+    table["gained_at"] = rng.choice(CLADES, n)
+
+    # the proteins of a HOG share its prevalences
+    family = np.arange(n) // 3
+    prevalences = {}
+    for group, size in SPECIES_GROUPS.items():
+        per_family = rng.integers(0, size + 1, family.max() + 1 if n else 0)
+        prevalences["{}({})".format(group, size)] = per_family[family]
+    acb = sum(prevalences["{}({})".format(g, SPECIES_GROUPS[g])] for g in ACB_GROUPS)
+    other = sum(v for k, v in prevalences.items() if k.split("(")[0] not in ACB_GROUPS)
+    table["complete_acb({})".format(sum(SPECIES_GROUPS[g] for g in ACB_GROUPS))] = acb
+    table["other({})".format(sum(s for g, s in SPECIES_GROUPS.items() if g not in ACB_GROUPS))] = other
+    for column, values in prevalences.items():
+        table[column] = values
+
+    table["keggKO"] = np.where(rng.random(n) < 0.6, ["K{:05d}".format(i % 3000) for i in range(n)], None)
+    table["kegg_description"] = np.where(table["keggKO"].notna(), "synthetic KEGG orthology", None)
+    table["cogid_1"] = np.where(rng.random(n) < 0.7, ["COG{:04d}".format(i % 5000) for i in range(n)], None)
+    table["cog_letter_1"] = np.where(table["cogid_1"].notna(), rng.choice(list("CEGJKLMP"), n), None)
+    table["cog_description_1"] = np.where(table["cogid_1"].notna(), "synthetic COG", None)
+    table["scl_pred"] = "SCL=" + rng.choice(["Cytoplasmic", "CytoplasmicMembrane", "Periplasmic",
+                                             "OuterMembrane", "Extracellular", "Unknown"], n)
+    table["scl_pc_across_hog"] = rng.random(n) * 100
+    is_vir = rng.random(n) < 0.05
+    table["virulence_hit_patric_id"] = np.where(
+        is_vir, ["fig|470.{}.peg.{}|".format(i % 9000, i) for i in range(n)], None)
+    table["virulence_hit_evalue"] = np.where(is_vir, 10.0 ** -rng.integers(5, 150, n), np.nan)
+    table["virulence_hit_description"] = np.where(is_vir, "synthetic virulence factor", None)
+    table["virulence_source"] = np.where(is_vir, rng.choice(["VFDB", "PATRIC_VF"], n), None)
+    return table
+
+
+def genome_table(assemblies, rng):
+    """extended_assembly2strain.csv: metadata of every assembly.
+    """
+    n = len(assemblies)
+    places = [COUNTRIES[i % len(COUNTRIES)] for i in range(n)]
+    return pd.DataFrame({
+        "#OMA_genome_identifier": ["{}_{}_protein".format(*a.split(".")) for a in assemblies],
+        "refseq_assembly_acc": assemblies,
+        "biosample_accession": ["SAMN{:08d}".format(i) for i in range(n)],
+        "tax_id": "470",
+        "species_name": "A. baumannii",
+        "additions_and_corrections": ["A. baumannii SYN{:03d}".format(i) for i in range(n)],
+        "short_name": ["SYN{:03d}".format(i) for i in range(n)],
+        "corrected_short_name": ["SYN{:03d}".format(i) for i in range(n)],
+        "internal_infection_sample_boolean": "1",
+        "sample_class": "human",
+        "sample_type": rng.choice(["blood", "sputum", "wound", "urine"], n),
+        "comments_on_isolation": None,
+        "scope": [p[2] for p in places],
+        "country": [p[0] for p in places],
+        "iso_alpha3": [p[1] for p in places],
+        "location": [p[3] for p in places],
+        "year": rng.integers(1990, 2020, n).astype(str),
+        "publication": None,
+    }, columns=GENOME_COLUMNS)
+
+
+def virulence_factor_hits(annotations):
+    """hogs2virulence_factors_with_source.tsv: the virulence factor hits of
+    the HOGs, with the no_colname header line of the published file.
+    """
+    hits = annotations[annotations["virulence_hit_patric_id"].notna()]
+    return pd.DataFrame({"hog": hits["hog_id1"].to_numpy(),
+                         "query": hits.index.to_numpy(),
+                         "eval": hits["virulence_hit_evalue"].to_numpy(),
+                         "hit_id": hits["virulence_hit_patric_id"].to_numpy(),
+                         "hit_description": hits["virulence_hit_description"].to_numpy(),
+                         "source": hits["virulence_source"].to_numpy()})
+
+
+def synthetic_datasets(n_genomes=5, proteins_per_genome=400, seed=0):
+    """All datasets by file name, as DataFrames.
+    """
+    rng = np.random.default_rng(seed)
+    assemblies = [DEFAULT_ASSEMBLY] + ["GCF_{:09d}.1".format(900000000 + i) for i in range(1, n_genomes)]
+    # shared between genomes, so proteins occur in several of them
+    accessions = np.array(["WP_{:09d}.1".format(i) for i in range(2 * proteins_per_genome)], dtype=object)
+    annotations = annotation_table(accessions, rng)
+    return {"p_feature_tables.pickle.bz2": feature_table(assemblies, proteins_per_genome, accessions, rng),
+            "p_full_annot.pickle.bz2": annotations,
+            "extended_assembly2strain.csv": genome_table(assemblies, rng),
+            "hogs2virulence_factors_with_source.tsv": virulence_factor_hits(annotations)}
+
+
+def write_datasets(directory, n_genomes=5, proteins_per_genome=400, seed=0):
+    """Write the synthetic datasets in the formats served from DATA_URL.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name, table in synthetic_datasets(n_genomes, proteins_per_genome, seed).items():
+        path = directory / name
+        if name.endswith(".pickle.bz2"):
+            with bz2.open(str(path), "wb") as fh:
+                pickle.dump(table, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        elif name.endswith(".tsv"):
+            with open(str(path), "w") as fh:
+                fh.write("\t".join(["no_colname"] * len(table.columns)) + "\n")
+                table.to_csv(fh, sep="\t", header=False, index=False)
+        else:
+            table.to_csv(str(path), sep="\t", index=False)
+    return directory
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic aci-dash datasets.")
+    parser.add_argument("directory")
+    parser.add_argument("--genomes", type=int, default=5)
+    parser.add_argument("--proteins", type=int, default=400, help="proteins per genome")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    write_datasets(args.directory, args.genomes, args.proteins, args.seed)
+
+
+if __name__ == "__main__":
+    main()
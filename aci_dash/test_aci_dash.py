@@ -1,7 +1,36 @@
+import json
+import time
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 import pytest
+import urllib3
+import plotly
 import dash_html_components as html
-from app import app
-from exceptions import ImproperlyConfigured
+from dash import no_update
+from dash._callback_context import context_value
+from dash._utils import AttributeDict
+from dash.exceptions import PreventUpdate
+import app as aci_app
+from app import app, prepare_feature_table, annotate_virulence_factors, join_protein_hogs, protein_jitter, VIR_COLUMN, VIR_BEST_HIT_COLUMN
+from exceptions import ImproperlyConfigured, DatasetUnavailable, FilterQueryError
+from datacache import DatasetCache
+import columnar
+import schema
+from indexes import PartitionIndex, PositionMap, ProteinSearchIndex
+import filtering
+import sqlstore
+from figcache import FigureCache, fingerprint
+import figures
+import synthetic
+from aggregates import CompositionTable, PrevalenceMatrix, category_counts, group_sizes
+from loader import BackgroundLoader, READY, FAILED, run_concurrently
+from metrics import CallbackMetrics, NULL_PHASE
+from memory import TracemallocDiff, frame_usage, process_memory
+import numpy as np
+import pandas as pd
 
 
 def f():
@@ -16,3 +45,942 @@ def test_debug_is_disabled():
 
 def test_layout_is_a_function_that_returns_a_div_element():
     assert isinstance(app.layout(), html.Div)
+
+
+class FakeResponse:
+    def __init__(self, status, body=b"", headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    def stream(self, amt):
+        yield self.body
+
+    def release_conn(self):
+        pass
+
+
+class FakeHttp:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.requests.append(headers)
+        resp = self.responses.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+
+def test_dataset_cache_revalidates_with_etag(tmp_path):
+    http = FakeHttp(FakeResponse(200, b"payload", {"ETag": '"abc"'}),
+                    FakeResponse(304))
+    cache = DatasetCache(tmp_path, http=http)
+    first = cache.fetch("https://example.org/data.tsv")
+    second = cache.fetch("https://example.org/data.tsv")
+    assert first == second
+    assert first.read_bytes() == b"payload"
+    assert http.requests[1]["If-None-Match"] == '"abc"'
+
+
+def test_dataset_cache_keeps_the_previous_version_of_changed_files(tmp_path):
+    http = FakeHttp(FakeResponse(200, b"v1"), FakeResponse(200, b"v2"), FakeResponse(200, b"v3"))
+    cache = DatasetCache(tmp_path, http=http)
+    v1 = cache.fetch("https://example.org/data.tsv")
+    v2 = cache.fetch("https://example.org/data.tsv")
+    # a worker that resolved the old record can still read it
+    assert v1.read_bytes() == b"v1" and v2.read_bytes() == b"v2"
+    v3 = cache.fetch("https://example.org/data.tsv")
+    assert not v1.exists()
+    assert v2.read_bytes() == b"v2" and v3.read_bytes() == b"v3"
+    assert cache.lookup("https://example.org/data.tsv")["previous"] == [v2.name]
+
+
+def test_dataset_cache_falls_back_to_last_good_copy(tmp_path):
+    http = FakeHttp(FakeResponse(200, b"payload"),
+                    urllib3.exceptions.MaxRetryError(None, "https://example.org/data.tsv"))
+    cache = DatasetCache(tmp_path, http=http)
+    cache.fetch("https://example.org/data.tsv")
+    assert cache.fetch("https://example.org/data.tsv").read_bytes() == b"payload"
+    offline = DatasetCache(tmp_path, offline=True)
+    assert offline.fetch("https://example.org/data.tsv").read_bytes() == b"payload"
+
+
+def test_dataset_cache_offline_without_copy_raises(tmp_path):
+    with pytest.raises(DatasetUnavailable):
+        DatasetCache(tmp_path, offline=True).fetch("https://example.org/data.tsv")
+
+
+def test_columnar_round_trip_memory_maps_columns(tmp_path):
+    frame = pd.DataFrame({"assembly": ["GCF_1", "GCF_1", "GCF_2"],
+                          "Start": [1, 200, 3000],
+                          "Comments": ["a", None, "c"],
+                          "mixed": [1.5, "x", None]},
+                         index=pd.Index([10, 11, 12], name="id"))
+    columnar.write_table(frame, tmp_path / "table")
+    loaded = columnar.read_table(tmp_path / "table")
+
+    assert loaded.index.name == "id"
+    assert loaded.index.tolist() == [10, 11, 12]
+    assert isinstance(loaded["Start"].values, np.memmap)
+    assert loaded["assembly"].tolist() == ["GCF_1", "GCF_1", "GCF_2"]
+    assert pd.isnull(loaded["Comments"].iloc[1])
+    assert loaded["mixed"].tolist()[:2] == [1.5, "x"]
+
+
+def is_memory_mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def test_columnar_columns_stay_memory_mapped(tmp_path):
+    frame = pd.DataFrame({"assembly": pd.Categorical(["GCF_1", "GCF_1", "GCF_2"]),
+                          "Locus_tag": ["A_1", "A_2", "B_1"],
+                          "Start": np.array([1, 200, 3000], dtype=np.int32),
+                          "End": np.array([90, 800, 3900], dtype=np.int32)})
+    columnar.write_table(frame, tmp_path / "table")
+    loaded = columnar.read_table(tmp_path / "table")
+
+    # same-dtype columns are not consolidated into a copied block
+    assert is_memory_mapped(loaded["Start"].to_numpy()) and is_memory_mapped(loaded["End"].to_numpy())
+    assert is_memory_mapped(loaded["assembly"].cat.codes.to_numpy())
+    # near-unique strings are not dictionary encoded but kept in their mapped buffer
+    assert not isinstance(loaded["Locus_tag"].dtype, pd.CategoricalDtype)
+    assert is_memory_mapped(loaded["Locus_tag"].array._data)
+    pd.testing.assert_frame_equal(loaded.astype({"Locus_tag": object}), frame)
+
+
+def test_columnar_strings_decode_only_the_rows_read(tmp_path):
+    tags = ["SYN_{:04d}".format(i) for i in range(1000)]
+    frame = pd.DataFrame({"Locus_tag": tags,
+                          "keggKO": [None if i % 3 else "K{:05d}".format(i) for i in range(1000)],
+                          "name": ["β-lactamase", None, "porin"] * 333 + ["OmpA"]})
+    columnar.write_table(frame, tmp_path / "table")
+    loaded = columnar.read_table(tmp_path / "table")
+
+    # one buffer of the encoded values, no fixed-width padding
+    assert loaded["Locus_tag"].array._data.nbytes == sum(len(t) for t in tags)
+    page = loaded.iloc[500:510]
+    assert page["Locus_tag"].array.nbytes == 10 * 8
+    assert page["Locus_tag"].tolist() == tags[500:510]
+    assert page["keggKO"].isna().tolist() == [i % 3 != 0 for i in range(500, 510)]
+    assert loaded["name"].iloc[0] == "β-lactamase" and pd.isnull(loaded["name"].iloc[1])
+
+    ordered = loaded.sort_values("Locus_tag", ascending=False)
+    assert ordered["Locus_tag"].iloc[0] == tags[-1]
+    assert (loaded["keggKO"] == "K00003").sum() == 1
+    assert loaded[loaded["Locus_tag"].isin(tags[:5])].index.tolist() == [0, 1, 2, 3, 4]
+    pd.testing.assert_frame_equal(loaded.astype(object), frame.astype(object))
+
+
+def test_columnar_keeps_the_schema_dtypes(tmp_path):
+    frame = pd.DataFrame({"assembly": ["GCF_1"] * 3 + ["GCF_2"],
+                          "Locus_tag": ["A_1", "A_2", "A_3", "B_1"],
+                          "other(141)": [0.0, 12.0, 141.0, float("nan")]})
+    compact, report = schema.normalize(frame, "test")
+    loaded = columnar.load_or_build(tmp_path / "table", lambda: compact, metadata=lambda: {"schema": report})
+
+    assert isinstance(loaded["assembly"].dtype, pd.CategoricalDtype)
+    assert not isinstance(loaded["Locus_tag"].dtype, pd.CategoricalDtype)
+    assert loaded["other(141)"].dtype == "Int16"
+    assert is_memory_mapped(loaded["other(141)"].array._data)
+    assert loaded["other(141)"].isna().tolist() == [False, False, False, True]
+    pd.testing.assert_frame_equal(loaded.astype({"Locus_tag": object}), compact)
+
+    def build():
+        raise AssertionError("the cached table is rebuilt")
+    columnar.load_or_build(tmp_path / "table", build)
+    assert columnar.read_metadata(tmp_path / "table")["schema"]["after"] == report["after"]
+
+
+def test_columnar_load_or_build_builds_once_across_workers(tmp_path):
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.2)
+        return pd.DataFrame({"Start": [1, 2]})
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        tables = list(pool.map(lambda _: columnar.load_or_build(tmp_path / "table", build), range(3)))
+    assert len(builds) == 1
+    assert all(t["Start"].tolist() == [1, 2] for t in tables)
+
+
+def test_background_loader_publishes_before_ready():
+    published = []
+    loader = BackgroundLoader(lambda: {"df": 1}, on_ready=published.append).start()
+    assert loader.wait(5)
+    assert loader.state == READY
+    assert published == [{"df": 1}]
+    assert loader.status()["state"] == "ready"
+
+
+def test_background_loader_reports_failure():
+    def load():
+        raise DatasetUnavailable("bucket unreachable")
+    loader = BackgroundLoader(load).start()
+    assert not loader.wait(5)
+    assert loader.state == FAILED
+    assert "bucket unreachable" in loader.status()["error"]
+
+
+def test_run_concurrently_returns_results_and_timings():
+    results, timings = run_concurrently({"a": lambda: 1, "b": lambda: 2})
+    assert results == {"a": 1, "b": 2}
+    assert set(timings) == {"a", "b"}
+
+    def unavailable():
+        raise DatasetUnavailable("p_full_annot.pickle.bz2 is unreachable")
+    with pytest.raises(DatasetUnavailable, match="unreachable"):
+        run_concurrently({"a": lambda: 1, "b": unavailable})
+
+
+def test_schema_normalisation_compacts_columns():
+    frame = pd.DataFrame({"assembly": ["GCF_1"] * 3 + ["GCF_2"],
+                          "Start": [1, 200, 3000, 70000],
+                          "other(141)": [0.0, 12.0, 141.0, float("nan")],
+                          "complete_acb(93)": [0.0, 12.0, 93.0, 1.0],
+                          "Locus_tag": ["A_1", "A_2", "A_3", "B_1"]},
+                         index=pd.Index([0, 1, 2, 3], name="id"))
+    compact, report = schema.normalize(frame, "test")
+
+    assert isinstance(compact["assembly"].dtype, pd.CategoricalDtype)
+    assert compact["Start"].dtype == np.int32
+    assert compact["complete_acb(93)"].dtype == np.int8
+    assert compact["other(141)"].dtype == "Int16"
+    assert compact["other(141)"].iloc[:3].tolist() == [0, 12, 141] and pd.isna(compact["other(141)"].iloc[3])
+    assert compact["Locus_tag"].dtype == frame["Locus_tag"].dtype
+    assert compact.index.dtype == np.int8
+    assert report["after"] < report["before"]
+    pd.testing.assert_frame_equal(compact.astype(frame.dtypes.to_dict()).set_axis(frame.index),
+                                  frame)
+
+
+def test_partition_index_returns_rows_of_one_assembly():
+    frame = pd.DataFrame({"assembly": ["GCF_1", "GCF_1", "GCF_2", "GCF_3", "GCF_3"],
+                          "Start": [1, 2, 3, 4, 5]})
+    index = PartitionIndex(frame, "assembly")
+    assert index.contiguous
+    assert index.rows("GCF_3")["Start"].tolist() == [4, 5]
+    assert index.size("GCF_1") == 2
+    assert index.rows("GCF_unknown").empty
+
+    shuffled = PartitionIndex(frame.iloc[[0, 2, 1, 3, 4]], "assembly")
+    assert not shuffled.contiguous
+    assert shuffled.rows("GCF_1")["Start"].tolist() == [1, 2]
+
+
+def feature_frame():
+    return pd.DataFrame({"RefSeq Acc": pd.Categorical(["WP_1.1", "WP_2.1", "WP_3.1", None]),
+                         "Protein Annotation": ["OXA-23 beta-lactamase", "hypothetical protein",
+                                                "oxa-like protein", "porin"],
+                         "Start": np.array([100, 2000, 30000, 400000], dtype=np.int32)},
+                        index=pd.Index([7, 8, 9, 10], name="id"))
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("", [7, 8, 9, 10]),
+    ("{Start} > 2000", [9, 10]),
+    ("{Start} <= 2000 && {Protein Annotation} contains OXA", [7]),
+    ('{Protein Annotation} icontains "oxa"', [7, 9]),
+    ("{RefSeq Acc} eq WP_1.1 or {RefSeq Acc} eq WP_3.1", [7, 9]),
+    ("{RefSeq Acc} ne WP_1.1", [8, 9]),
+    ("{RefSeq Acc} eq WP_9.1", []),
+    ("{RefSeq Acc} ieq wp_2.1", [8]),
+    ("{RefSeq Acc} is blank", [10]),
+    ("!({Start} ge 2000)", [7]),
+    ("{Protein Annotation} > p", [10]),
+])
+def test_filter_frame_matches_datatable_queries(query, expected):
+    assert filtering.filter_frame(feature_frame(), query).index.tolist() == expected
+
+
+def test_filter_predicates_run_on_present_categories_only():
+    column = pd.Series(pd.Categorical(["b", None, "d", "b"], categories=["a", "b", "c", "d"]))
+    evaluated = []
+
+    def predicate(values):
+        evaluated.extend(values)
+        return [v == "b" for v in values]
+    assert filtering._on_values(column, predicate).tolist() == [True, False, False, True]
+    assert evaluated == ["b", "d"]
+
+
+def test_filter_frame_rejects_invalid_queries():
+    with pytest.raises(FilterQueryError):
+        filtering.filter_frame(feature_frame(), "{Unknown} eq 1")
+    with pytest.raises(FilterQueryError):
+        filtering.filter_frame(feature_frame(), "{Start} >")
+
+
+def test_sort_and_page_frame():
+    frame = filtering.sort_frame(feature_frame(), [{"column_id": "Protein Annotation", "direction": "desc"}])
+    assert frame.index.tolist() == [10, 9, 8, 7]
+    page, page_count = filtering.page_frame(frame, 1, 3)
+    assert page.index.tolist() == [7]
+    assert page_count == 2
+
+
+def test_sqlite_store_serves_assembly_rows(tmp_path):
+    frame = pd.DataFrame({"Genomic Acc": pd.Categorical(["NZ_1", "NZ_1", "NZ_2"]),
+                          "assembly": ["GCF_1", "GCF_1", "GCF_2"],
+                          "Start": [1, 200, 3000],
+                          "RefSeq Acc": ["WP_1.1", "WP_2.1", "WP_1.1"]},
+                         index=pd.Index([4, 5, 6], name="id"))
+    frame["id"] = frame.index
+    sqlstore.build_database(frame, tmp_path / "features.sqlite")
+    db = sqlstore.FeatureDatabase(tmp_path / "features.sqlite")
+
+    rows = db.assembly_rows("GCF_1")
+    assert rows.index.tolist() == [4, 5]
+    assert rows.columns.tolist() == frame.columns.tolist()
+    assert db.assembly_rows("GCF_unknown").empty
+    with db.connection() as con:
+        indexes = {row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert set(sqlstore.INDEXES) <= indexes
+        with pytest.raises(Exception):
+            con.execute("DELETE FROM feat_tables")
+
+
+def test_protein_search_groups_ranked_hits_by_genome():
+    frame = pd.DataFrame({"assembly": pd.Categorical(["GCF_1", "GCF_1", "GCF_2", "GCF_3"]),
+                          "RefSeq Acc": pd.Categorical(["WP_1.1", "WP_2.1", "WP_3.1", "WP_4.1"]),
+                          "Protein Annotation": pd.Categorical([
+                              "OXA-23 family carbapenem-hydrolyzing class D beta-lactamase OXA-23",
+                              "hypothetical protein",
+                              "OXA-51 family carbapenem-hydrolyzing class D beta-lactamase",
+                              "porin"]),
+                          "Sym": pd.Categorical(["blaOXA", None, "blaOXA", None]),
+                          "Locus_tag": pd.Categorical(["A1_0001", "A1_0002", "A2_0001", "A3_0001"])})
+    index = ProteinSearchIndex(frame)
+
+    results = index.search("OXA-23")
+    assert [r["assembly"] for r in results] == ["GCF_1"]
+    assert results[0]["proteins"][0]["RefSeq Acc"] == "WP_1.1"
+
+    assert [r["assembly"] for r in index.search("blaOXA")] == ["GCF_1", "GCF_2"]
+    assert [r["assembly"] for r in index.search("WP_3")] == ["GCF_2"]
+    assert [r["assembly"] for r in index.search("a3_0001")] == ["GCF_3"]
+    assert index.search("nothing-like-this") == []
+
+    progress = []
+    index.search("OXA-23", progress=lambda done, total: progress.append((done, total)))
+    assert progress[-1][0] == progress[-1][1] == len(progress)
+
+
+def test_figure_cache_evicts_least_recently_used_by_bytes():
+    cache = FigureCache(max_bytes=250, sizeof=lambda value: 100)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get_or_compute("c", lambda: 0) == 3
+    assert cache.stats() == {"entries": 2, "bytes": 200, "max_bytes": 250,
+                             "hits": 2, "misses": 1, "evictions": 1}
+
+
+def test_fingerprint_depends_on_rows_and_order():
+    assert fingerprint([1, 2, 3]) == fingerprint(np.array([1, 2, 3], dtype=np.int16))
+    assert fingerprint([1, 2, 3]) != fingerprint([3, 2, 1])
+
+
+def test_genome_points_encode_columns_compactly():
+    hog_table = pd.DataFrame({"other(141)": np.array([0, 7, 141], dtype=np.int16),
+                              "baumannii(55)": [np.nan, 1.0, 2.5],
+                              "gained_at": pd.Categorical(["QI clade", None, "QI clade"]),
+                              "vir_hit": [False, True, False],
+                              "jitter": np.array([0.123456, -0.25, 0.5], dtype=np.float32)},
+                             index=pd.Index(["WP_1", "WP_2", "WP_3"], name="RefSeq Acc"))
+    points = figures.genome_points(hog_table, ["other(141)", "baumannii(55)"], ["gained_at"],
+                                   {"VIR": "vir_hit"}, "jitter")
+    assert points == {"ids": ["WP_1", "WP_2", "WP_3"],
+                      "ranges": {"other(141)": [0, 7, 141], "baumannii(55)": [None, 1.0, 2.5]},
+                      "hues": {"gained_at": {"categories": ["QI clade"], "codes": [0, -1, 0]}},
+                      "flags": {"VIR": [0, 1, 0]},
+                      "jitter": [0.1235, -0.25, 0.5]}
+    style = figures.figure_style({"Core": "blue"})
+    assert style["colors"] == {"Core": "blue"} and {"plotly", "simple_white"} <= set(style["templates"])
+
+
+def test_annotate_virulence_factors_joins_best_hit_per_hog():
+    hog_table = pd.DataFrame({"hog_id1": ["H1", "H2", None, "H3"]}, index=["WP_1", "WP_2", "WP_3", "WP_4"])
+    hog2vir = pd.DataFrame({"eval": ["1e-5", "2e-30", "1e-10"],
+                            "hit_description": ["weak", "strong", "other"]},
+                           index=pd.Index(["H1", "H1", "H3"], name="query"))
+    annotate_virulence_factors(hog_table, hog2vir)
+    assert hog_table[VIR_COLUMN].tolist() == [True, False, False, True]
+    assert hog_table[VIR_BEST_HIT_COLUMN].iloc[[0, 3]].tolist() == ["strong", "other"]
+    assert hog_table[VIR_BEST_HIT_COLUMN].iloc[[1, 2]].isna().all()
+
+
+def test_join_protein_hogs_fills_strain_specific_defaults():
+    features = pd.DataFrame({"RefSeq Acc": ["WP_2", "WP_9", "WP_1"]}, index=pd.Index([10, 11, 12], name="id"))
+    hog_table = pd.DataFrame({"aci_core231_of_234": pd.Categorical(["Core", "Accessory"]),
+                              "other(141)": np.array([5, 7], dtype=np.int16),
+                              "keggKO": ["K1", "K2"]},
+                             index=["WP_1", "WP_2"])
+    joined = join_protein_hogs(features, hog_table)
+    assert joined.index.tolist() == [10, 11, 12]
+    assert joined["aci_core231_of_234"].tolist() == ["Accessory", "Strain specific", "Core"]
+    assert joined["other(141)"].tolist() == [7, 0, 5]
+    assert joined["keggKO"].tolist() == ["K2", None, "K1"]
+
+
+def test_loaded_protein_hogs_keep_the_hog_table_columns(datasets):
+    hogs, hog_table = datasets.protein_hogs, datasets.full_hog_table
+    accessions = datasets.df["RefSeq Acc"]
+    strain_specific = ~accessions.isin(hog_table.index).to_numpy()
+    assert strain_specific.any() and not strain_specific.all()
+
+    # the text columns are loaded as the schema stored them, not re-categorised
+    for column in ["keggKO", "cogid_1", "other(141)"]:
+        assert hogs[column].dtype == hog_table[column].dtype
+    assert hogs["keggKO"][strain_specific].isna().all()
+    assert (hogs["gained_at"][strain_specific] == datasets.STRAIN_SPECIFIC).all()
+    assert (hogs["other(141)"][strain_specific] == 0).all()
+    expected = hog_table["keggKO"].reindex(accessions[~strain_specific].to_numpy(dtype=object))
+    assert hogs["keggKO"][~strain_specific].astype(object).fillna("").tolist() == \
+        expected.astype(object).fillna("").tolist()
+
+
+def test_protein_jitter_is_stable_per_accession():
+    offsets = protein_jitter(["WP_1", "WP_2", "WP_1", None])
+    assert offsets.dtype == np.float32
+    assert offsets[0] == offsets[2] != offsets[1]
+    assert offsets[3] == 0
+    assert ((offsets >= -0.25) & (offsets < 0.75)).all()
+    assert protein_jitter(["WP_2"])[0] == offsets[1]
+
+
+def test_composition_table_matches_bincount_per_group():
+    groups = ["A", "A", "B", "A", "B"]
+    hue = pd.Categorical(["Core", "Accessory", "Core", "Core", None], categories=["Core", "Accessory"])
+    vir = [True, False, False, False, True]
+    table = CompositionTable(groups, {"aci_core231_of_234": hue}, vir)
+    categories, counts = table.get("A", "aci_core231_of_234")
+    assert categories.tolist() == ["Core", "Accessory"]
+    assert counts.tolist() == [[1, 1], [1, 0]]
+    assert table.get("B", "aci_core231_of_234")[1].tolist() == [[1, 0], [0, 0]]
+    assert table.get("C", "aci_core231_of_234") is None
+    assert (category_counts(hue.codes[:4][[0, 1, 3]], 2, [True, False, False]) == counts).all()
+
+
+def test_position_map_finds_first_row_of_accession():
+    accessions = pd.Categorical(["WP_3", "WP_1", "WP_3", None], categories=["WP_1", "WP_2", "WP_3"])
+    positions = PositionMap(accessions, [30, 10, 31, 40])
+    assert positions.position("WP_3") == 0
+    assert positions.position("WP_1") == 1
+    assert positions.row_ids[positions.position("WP_1")] == 10
+    assert positions.position("WP_2") is None
+    assert positions.position("WP_9") is None
+
+
+def test_prevalence_matrix_normalizes_by_group_sizes_from_headers():
+    hog_table = pd.DataFrame({"hog_id1": ["H1", "H2", "H1", None],
+                              "baumannii(55)": [55, 11, 55, 0],
+                              "baylyi(9)": [0, 9, 0, 0],
+                              "keggKO": ["K1", None, "K1", None]},
+                             index=["WP_1", "WP_2", "WP_3", "WP_4"])
+    assert group_sizes(hog_table.columns) == {"baumannii(55)": 55, "baylyi(9)": 9}
+    matrix = PrevalenceMatrix(hog_table, ["baumannii(55)", "baylyi(9)"])
+    assert matrix.values.shape == (2, 2)
+    hogs, values = matrix.rows(["WP_2", "WP_3", "WP_4", "WP_9"])
+    assert hogs.tolist() == ["H2", "H1", None, None]
+    assert values[:2].tolist() == [[20.0, 100.0], [100.0, 0.0]]
+    assert np.isnan(values[2:]).all()
+
+
+def test_prevalence_matrix_of_empty_or_hogless_tables_has_no_rows():
+    for hog_ids in [[], [None, None]]:
+        hog_table = pd.DataFrame({"hog_id1": pd.Series(hog_ids, dtype=object),
+                                  "baumannii(55)": np.zeros(len(hog_ids), dtype=np.int16)},
+                                 index=["WP_{}".format(i) for i in range(len(hog_ids))])
+        matrix = PrevalenceMatrix(hog_table, ["baumannii(55)"])
+        assert matrix.values.shape == (0, 1)
+        hogs, values = matrix.rows(["WP_0", "WP_9"])
+        assert hogs.tolist() == [None, None]
+        assert values.shape == (2, 1) and np.isnan(values).all()
+        assert matrix.rows([])[1].shape == (0, 1)
+
+
+def test_synthetic_datasets_have_the_published_schema(tmp_path):
+    synthetic.write_datasets(tmp_path, n_genomes=3, proteins_per_genome=50)
+    features = prepare_feature_table(pd.read_pickle(str(tmp_path / "p_feature_tables.pickle.bz2")))
+    assert features["assembly"].nunique() == 3 and len(features.index) == 150
+    annotations = pd.read_pickle(str(tmp_path / "p_full_annot.pickle.bz2"))
+    assert {"hog_id1", "aci_core231_of_234", "gained_at", "baumannii(55)"} <= set(annotations.columns)
+    genomes = pd.read_csv(str(tmp_path / "extended_assembly2strain.csv"), sep='\t', index_col=1, dtype=str)
+    assert synthetic.DEFAULT_ASSEMBLY in genomes.index
+    hits = pd.read_csv(str(tmp_path / "hogs2virulence_factors_with_source.tsv"), header=None, sep='\t',
+                       index_col=0, names=["query", "eval", "hit_id", "hit_description", "source"])
+    assert hits.index[1:].isin(annotations["hog_id1"]).all()
+
+
+def test_callback_metrics_time_requests_and_phases():
+    from dash import Dash
+    from dash.dependencies import Input, Output
+
+    metrics_app = Dash(__name__)
+    metrics_app.layout = html.Div([html.Div(id="in"), html.Div(id="out")])
+    metrics = CallbackMetrics(enabled=True)
+    metrics.instrument(metrics_app, caches={"figures": FigureCache(100)})
+
+    @metrics_app.callback(Output("out", "children"), [Input("in", "children")])
+    @metrics.measure
+    def echo(value):
+        with metrics.phase("figure"):
+            return value
+
+    client = metrics_app.server.test_client()
+    response = client.post("/_dash-update-component", json={
+        "output": "out.children", "outputs": {"id": "out", "property": "children"},
+        "inputs": [{"id": "in", "property": "children", "value": "x"}], "changedPropIds": ["in.children"]})
+    assert response.status_code == 200
+    assert response.headers["Server-Timing"].startswith('total;dur=')
+    assert 'desc="echo"' in response.headers["Server-Timing"]
+    assert "figure;dur=" in response.headers["Server-Timing"]
+
+    exposed = client.get("/metrics").get_data(as_text=True)
+    assert 'aci_dash_callback_duration_seconds_count{callback="echo",trigger="in.children",status="200"} 1' in exposed
+    assert 'aci_dash_callback_phase_seconds_count{callback="echo",phase="overhead"} 1' in exposed
+    assert 'aci_dash_callback_response_bytes_bucket{callback="echo",le="+Inf"} 1' in exposed
+    assert 'aci_dash_cache_misses_total{cache="figures"} 0' in exposed
+
+
+def test_disabled_callback_metrics_leave_callbacks_untouched():
+    metrics = CallbackMetrics(enabled=False)
+    func = lambda: 1
+    assert metrics.measure(func) is func
+    assert metrics.phase("figure") is NULL_PHASE
+
+
+def test_frame_usage_lists_largest_columns_first():
+    frame = pd.DataFrame({"small": np.zeros(10, dtype=np.int8), "large": ["x" * 100] * 10})
+    usage = frame_usage(frame)
+    assert usage["rows"] == 10
+    assert [c["column"] for c in usage["columns"]][:2] == ["large", "Index"]
+    assert usage["columns"][-1] == {"column": "small", "bytes": 10, "dtype": "int8"}
+    assert frame_usage(None) is None
+    assert process_memory()["peak_rss_bytes"] > 0
+
+
+def test_tracemalloc_diff_reports_growth_after_baseline():
+    tracer = TracemallocDiff()
+    try:
+        assert tracer.diff()["baseline"]
+        kept = [bytearray(1000) for _ in range(100)]
+        top = tracer.diff(limit=3)["top"]
+        assert len(top) <= 3 and top[0]["size_diff"] >= 100000
+    finally:
+        assert tracer.stop() == {"tracing": False}
+    del kept
+
+
+def test_debug_memory_requires_secret_key():
+    client = app.server.test_client()
+    assert client.get("/debug/memory").status_code == 403
+    assert client.get("/debug/memory", headers={"Authorization": "Bearer wrong"}).status_code == 403
+    response = client.get("/debug/memory", headers={"Authorization": "Bearer " + app.server.secret_key})
+    assert response.status_code == 200
+    assert {"process", "frames", "indexes", "caches"} <= set(response.get_json())
+
+
+CLIENTSIDE_JS = Path(__file__).parent / "assets" / "clientside.js"
+
+
+def run_clientside(calls):
+    """Results of window.dash_clientside.aci_dash functions run by node, as
+    [name, args] -> value or "PreventUpdate".
+    """
+    script = """
+    globalThis.dash_clientside = {PreventUpdate: {description: "PreventUpdate"}};
+    require(%s);
+    const callbacks = globalThis.dash_clientside.aci_dash;
+    const results = %s.map(([name, args]) => {
+        try {
+            return callbacks[name](...args);
+        } catch (e) {
+            if (e === globalThis.dash_clientside.PreventUpdate) return "PreventUpdate";
+            throw e;
+        }
+    });
+    console.log(JSON.stringify(results));
+    """ % (json.dumps(str(CLIENTSIDE_JS)), json.dumps(calls))
+    output = subprocess.run(["node", "-e", script], check=True, stdout=subprocess.PIPE,
+                            universal_newlines=True).stdout
+    return json.loads(output)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_clientside_modal_and_filter_query_callbacks():
+    calls = [
+        ["toggleModal", [-1, 1, True]], ["toggleModal", [1, None, False]], ["toggleModal", [None, 2, True]],
+        ["toggleModal", [None, None, None]],
+        ["triggerModal", ["WP_1, WP_2", 3]], ["triggerModal", [None, 3]], ["triggerModal", ["x", 3]],
+        ["triggerModal", ["", 3]],
+        ["updateOutput", [None, "WP_1"]], ["updateOutput", [1, ""]], ["updateOutput", [1, None]],
+        ["updateOutput", [1, " WP_1, WP_2 \n\n WP_3,\t, \r\n"]],
+        ["writeQuery", [None]], ["writeQuery", ["{RefSeq Acc} eq WP_1"]],
+        ["parseInputAccessions", ["a,b\n c ,,\n"]], ["convertListToFilterQuery", [[], None]],
+        ["convertListToFilterQuery", [["P1"], "Locus_tag"]],
+    ]
+    assert run_clientside(calls) == [
+        False, True, False,
+        None,
+        ["WP_1, WP_2", 1, 3], "PreventUpdate", "PreventUpdate",
+        ["", -1, 2],
+        None, None, "PreventUpdate",
+        "{RefSeq Acc} eq WP_1 or {RefSeq Acc} eq WP_2 or {RefSeq Acc} eq WP_3",
+        "", "{RefSeq Acc} eq WP_1",
+        ["a", "b", "c"], "",
+        "{Locus_tag} eq P1",
+    ]
+
+
+def test_modal_callbacks_are_registered_clientside():
+    clientside = {c["output"]: c["clientside_function"] for c in app._callback_list if c.get("clientside_function")}
+    assert clientside["modal-xl.is_open"]["function_name"] == "toggleModal"
+    assert clientside["datatable-interactivity.filter_query"]["function_name"] == "writeQuery"
+    assert clientside["graph-0.figure"]["function_name"] == "renderScatter"
+    assert clientside["set_composi_graph.figure"]["function_name"] == "renderPie"
+    assert {f["namespace"] for f in clientside.values()} == {"aci_dash"}
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_clientside_scatter_and_pie_are_built_from_genome_points():
+    points = {"ids": ["WP_1", "WP_2", "WP_3", "WP_4", "WP_5", "WP_6"], "count": 7, "size": 7,
+              "ranges": {"other(141)": [0, 1, 2, 3, 4, 5], "complete_acb(93)": [1, 2, 3, 4, 40, 9]},
+              "hues": {"aci_core231_of_234": {"categories": ["Accessory", "Core", "new"],
+                                              "codes": [0, 1, 1, 1, 2, -1]}},
+              "flags": {"VIR": [0, 0, 0, 1, 0, 0]},
+              "jitter": [0.5, 0.5, 0.5, 0.5, 0.5, 0.5]}
+    style = {"colors": {"Core": "blue", "Accessory": "red", "VIR": "black"}, "palette": ["green"],
+             "templates": {"plotly": {}, "simple_white": {}}}
+    scatter, highlighted, jittered, pie = run_clientside([
+        ["renderScatter", [points, "aci_core231_of_234", "other(141)", "complete_acb(93)", False, [], style]],
+        ["renderScatter", [points, "aci_core231_of_234", "other(141)", "complete_acb(93)", False, ["VIR"], style]],
+        ["renderScatter", [points, "aci_core231_of_234", "other(141)", "complete_acb(93)", True, [], style]],
+        ["renderPie", [points, "aci_core231_of_234", style]],
+    ])
+    traces = [t for t in scatter["data"] if t["type"] == "scattergl"]
+    boxes = [t for t in scatter["data"] if t["type"] == "box"]
+    assert [t["name"] for t in traces] == ["Core", "Accessory", "new"]
+    assert [t["marker"]["color"] for t in traces] == ["blue", "red", "green"]
+    assert [c[0] for c in traces[0]["customdata"]] == ["WP_2", "WP_3", "WP_4"]
+    assert len(boxes) == 3
+    assert boxes[0]["median"] == [3]
+    assert boxes[0]["lowerfence"] == [2] and boxes[0]["upperfence"] == [4]
+    assert [t["name"] for t in highlighted["data"] if t["type"] == "scattergl"] == ["Core", "Accessory", "VIR", "new"]
+    assert highlighted["data"][0]["hovertemplate"].startswith("VIR=")
+    assert jittered["data"][0]["x"] == [1.5, 2.5, 3.5]
+
+    # a missing count does not become a point at 0 (or at the jitter offset)
+    points["ranges"]["other(141)"][2] = None
+    missing, missing_jittered = run_clientside([
+        ["renderScatter", [points, "aci_core231_of_234", "other(141)", "complete_acb(93)", False, [], style]],
+        ["renderScatter", [points, "aci_core231_of_234", "other(141)", "complete_acb(93)", True, [], style]],
+    ])
+    assert [c[0] for c in missing["data"][0]["customdata"]] == ["WP_2", "WP_4"]
+    assert missing["data"][0]["y"] == [2, 4]
+    assert missing_jittered["data"][0]["x"] == [1.5, 3.5]
+    assert pie["data"][0]["labels"] == ["Accessory", "Core", "new"]
+    assert pie["data"][0]["values"] == [1, 3, 1]
+    assert pie["data"][0]["marker"]["colors"] == ["red", "blue", "green"]
+    assert pie["layout"]["title"]["text"] == "#Proteins: 7 (all)"
+
+
+PUBLISHED = ["df", "genomes_df", "genomes_dict", "hog2vir_df", "full_hog_table", "load_timings",
+             "assembly_partitions", "feature_db", "search_index", "protein_hogs", "composition", "prevalence"]
+
+
+@pytest.fixture
+def datasets(tmp_path, monkeypatch):
+    """The app module with synthetic datasets (3 genomes of 40 proteins)
+    loaded and published as at startup; restored afterwards.
+    """
+    return publish_synthetic_datasets(tmp_path, monkeypatch)
+
+
+def publish_synthetic_datasets(tmp_path, monkeypatch):
+    data_dir = tmp_path / "data"
+    if not data_dir.is_dir():
+        synthetic.write_datasets(data_dir, n_genomes=3, proteins_per_genome=40)
+
+    def fetch(name, timings):
+        local_path = data_dir / name
+        timings[name] = {"fetch_s": 0.0, "bytes": local_path.stat().st_size}
+        return local_path
+
+    monkeypatch.setattr(aci_app, "fetch", fetch)
+    monkeypatch.setattr(aci_app, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(aci_app, "figure_cache", FigureCache(2 ** 20))
+    monkeypatch.setattr(aci_app, "position_maps", FigureCache(2 ** 20))
+    for name in PUBLISHED:
+        monkeypatch.setattr(aci_app, name, getattr(aci_app, name))
+    aci_app.publish_datasets(aci_app.load_datasets())
+    return aci_app
+
+
+def call_callback(callback, *args, trigger):
+    """Call a callback function as Dash does for a change of trigger.
+    """
+    context_value.set(AttributeDict(triggered_inputs=[{"prop_id": trigger, "value": None}]))
+    return callback(*args)
+
+
+def test_cached_startup_reports_the_schema_memory(datasets):
+    built = datasets.load_timings["p_full_annot.pickle.bz2"]
+    # a second start loads the columnar tables written by the first one
+    cached = datasets.load_datasets()["timings"]["p_full_annot.pickle.bz2"]
+    assert cached["memory_after"] == built["memory_after"] < built["memory_before"] == cached["memory_before"]
+
+
+def test_table_pages_keep_the_selection_of_other_pages(datasets):
+    assembly_acc = datasets.df["assembly"].iloc[0]
+    ids = datasets.genome_view(assembly_acc).index.tolist()
+    page_size = datasets.PAGE_SIZE
+
+    first, count, selected_rows, selected_data, _ = call_callback(
+        datasets.update_table, assembly_acc, 0, page_size, [], "", None, [], trigger="assembly-acc.children")
+    assert [r["id"] for r in first] == ids[:page_size] and count == 3
+    assert selected_rows == [] and selected_data is None
+
+    selection = call_callback(datasets.update_selected_row_ids, [ids[1], ids[3]], assembly_acc, first, [],
+                              trigger="datatable-interactivity.selected_row_ids")
+    assert selection == sorted([ids[1], ids[3]])
+
+    second, _, selected_rows, selected_data, _ = call_callback(
+        datasets.update_table, assembly_acc, 1, page_size, [], "", None, selection,
+        trigger="datatable-interactivity.page_current")
+    assert selected_rows == [] and selected_data is no_update
+    # the table derives selected_row_ids of the new page from selected_rows
+    with pytest.raises(PreventUpdate):
+        call_callback(datasets.update_selected_row_ids, [], assembly_acc, second, selection,
+                      trigger="datatable-interactivity.selected_row_ids")
+    selection = call_callback(datasets.update_selected_row_ids, [ids[page_size + 2]], assembly_acc, second,
+                              selection, trigger="datatable-interactivity.selected_row_ids")
+    assert selection == sorted([ids[1], ids[3], ids[page_size + 2]])
+
+    _, _, selected_rows, _, _ = call_callback(
+        datasets.update_table, assembly_acc, 0, page_size, [], "", None, selection,
+        trigger="datatable-interactivity.page_current")
+    assert selected_rows == [1, 3]
+
+    rows, points = call_callback(datasets.update_genome_rows, assembly_acc, "", selection, None,
+                                 trigger="selected-row-ids.data")
+    assert rows["count"] == len(points["ids"]) == 3 and rows["size"] == 40
+
+    assert call_callback(datasets.update_selected_row_ids, [ids[1]], assembly_acc, first, selection,
+                         trigger="assembly-acc.children") == []
+
+
+def test_update_table_pages_sorts_and_filters_on_the_server(datasets):
+    assembly_acc = datasets.df["assembly"].iloc[0]
+    sort_by = [{"column_id": "Start", "direction": "desc"}]
+    query = "{Start} > 0"
+    view = datasets.genome_view(assembly_acc, query, sort_by)
+
+    data, page_count, _, selected_data, query_structure = call_callback(
+        datasets.update_table, assembly_acc, 1, 10, sort_by, query, None, [],
+        trigger="datatable-interactivity.sort_by")
+    assert [r["id"] for r in data] == view.index[10:20].tolist()
+    assert [r["Start"] for r in data] == sorted((r["Start"] for r in data), reverse=True)
+    assert page_count == -(-len(view.index) // 10)
+    # paging, sorting and filtering keep the lasso selection, a new genome clears it
+    assert selected_data is no_update and query_structure is no_update
+    for trigger in ["datatable-interactivity.page_current", "datatable-interactivity.filter_query"]:
+        assert call_callback(datasets.update_table, assembly_acc, 0, 10, sort_by, query, None, [],
+                             trigger=trigger)[3] is no_update
+    assert call_callback(datasets.update_table, assembly_acc, 0, 10, sort_by, query, None, [],
+                         trigger="assembly-acc.children")[3] is None
+
+    # invalid queries show the rows unfiltered, like the DataTable marks them
+    data, page_count, _, _, _ = call_callback(
+        datasets.update_table, assembly_acc, 0, 15, [], "{Start} >", None, [],
+        trigger="datatable-interactivity.filter_query")
+    assert len(data) == 15 and page_count == 3
+
+
+def test_filtering_from_a_late_page_returns_to_the_first_page(datasets):
+    assembly_acc = datasets.df["assembly"].iloc[0]
+    query = "{Len} < 900"
+    view = datasets.genome_view(assembly_acc, query)
+    page_size = 5
+    late_page = -(-len(datasets.genome_view(assembly_acc).index) // page_size) - 1
+    assert len(view.index) <= late_page * page_size
+
+    # the filtered rows end before the current page: its last page is shown ...
+    data, page_count, _, _, _ = call_callback(
+        datasets.update_table, assembly_acc, late_page, page_size, [], query, None, [],
+        trigger="datatable-interactivity.filter_query")
+    assert page_count == -(-len(view.index) // page_size)
+    assert [r["id"] for r in data] == view.index[(page_count - 1) * page_size:].tolist()
+    # ... until the table is moved to the first one
+    for trigger in ["datatable-interactivity.filter_query", "datatable-interactivity.sort_by"]:
+        outputs = call_callback(datasets.display_click_data, None, None, assembly_acc, query, [], page_size,
+                                trigger=trigger)
+        assert outputs[3] == 0 and outputs[2] is None
+    data = call_callback(datasets.update_table, assembly_acc, 0, page_size, [], query, None, [],
+                         trigger="datatable-interactivity.page_current")[0]
+    assert [r["id"] for r in data] == view.index[:page_size].tolist()
+
+
+def sunburst_total(figure):
+    trace = figure.data[0]
+    return sum(v for v, parent in zip(trace.values, trace.parents) if parent == "")
+
+
+def test_genome_rows_and_sunburst_are_redrawn_only_for_new_rows(datasets):
+    assembly_acc = datasets.df["assembly"].iloc[0]
+    rows, points = call_callback(datasets.update_genome_rows, assembly_acc, "", [], None,
+                                 trigger="assembly-acc.children")
+    assert rows["count"] == rows["size"] == 40
+    # the figures show every protein of the rows once
+    assert points["count"] == 40 and len(points["ids"]) == len(set(points["ids"])) <= 40
+    # a filter matching every row keeps the fingerprint
+    with pytest.raises(PreventUpdate):
+        call_callback(datasets.update_genome_rows, assembly_acc, "{Start} > 0", [], rows,
+                      trigger="datatable-interactivity.filter_query")
+    filtered, filtered_points = call_callback(datasets.update_genome_rows, assembly_acc, "{Str} eq +", [], rows,
+                                trigger="datatable-interactivity.filter_query")
+    assert 0 < filtered["count"] < 40 and filtered["fingerprint"] != rows["fingerprint"]
+
+    sunburst = call_callback(datasets.update_composition_sunburst, rows, "aci_core231_of_234", ["VIR"], "", [],
+                             trigger="genome-rows.data")
+    assert sunburst_total(sunburst) == len(points["ids"])
+    assert call_callback(datasets.update_composition_sunburst, rows, "aci_core231_of_234", ["VIR"], "", [],
+                         trigger="highlights-checkb.value") is sunburst
+    assert datasets.figure_cache.stats()["hits"] >= 1
+    filtered_sunburst = call_callback(datasets.update_composition_sunburst, filtered, "aci_core231_of_234",
+                                      ["VIR"], "{Str} eq +", [], trigger="genome-rows.data")
+    assert sunburst_total(filtered_sunburst) == len(filtered_points["ids"])
+
+    assert "annotations" in call_callback(datasets.update_composition_sunburst, rows, "gained_at", [], "", [],
+                                          trigger="highlights-checkb.value")["layout"]
+    with pytest.raises(PreventUpdate):
+        call_callback(datasets.update_composition_sunburst, None, "gained_at", ["VIR"], "", [],
+                      trigger="hue-criterion-radio.value")
+
+
+def test_display_click_data_opens_the_page_of_the_clicked_protein(datasets):
+    assembly_acc = datasets.df["assembly"].iloc[0]
+    sort_by = [{"column_id": "Start", "direction": "desc"}]
+    view = datasets.genome_view(assembly_acc, "", sort_by)
+    accessions = view["RefSeq Acc"].astype(object).tolist()
+    page_size = 8
+
+    resolved = {}
+    for position, protein_acc in enumerate(accessions):
+        if accessions.index(protein_acc) != position:
+            continue  # a protein found twice opens its first row
+        outputs = call_callback(datasets.display_click_data, {"points": [{"customdata": [protein_acc]}]},
+                                None, assembly_acc, "", sort_by, page_size, trigger="graph-0.clickData")
+        active_cell, page = outputs[2], outputs[3]
+        assert active_cell["row_id"] == view.index[position]
+        assert view.index[page * page_size + active_cell["row"]] == view.index[position]
+        assert datasets.full_hog_table.index.isin([protein_acc]).any() == (outputs[1] != {})
+        resolved[position] = (page, active_cell["row"])
+    assert all(cell == divmod(position, page_size) for position, cell in resolved.items())
+    # the first row of a page stays on that page
+    assert any(row == 0 and page >= 1 for page, row in resolved.values())
+
+    with pytest.raises(PreventUpdate):
+        call_callback(datasets.display_click_data, {"points": [{"customdata": ["WP_unknown"]}]}, None,
+                      assembly_acc, "", sort_by, page_size, trigger="graph-0.clickData")
+    assert call_callback(datasets.display_click_data, None, None, assembly_acc, "", sort_by, page_size,
+                         trigger="assembly-acc.children")[2:4] == [None, 0]
+
+
+def test_protein_search_waits_for_the_datasets(monkeypatch):
+    release = threading.Event()
+    loader = BackgroundLoader(lambda: release.wait(5) and {}).start()
+    monkeypatch.setattr(aci_app, "data_loader", loader)
+    monkeypatch.setattr(aci_app, "search_index", None)
+    rows, summary = aci_app.search_proteins(lambda progress: None, 1, "OXA-23")
+    assert rows == [] and "still loading" in summary
+    release.set()
+    assert loader.wait(5)
+
+
+def test_health_endpoints_follow_the_loader_state(monkeypatch):
+    release = threading.Event()
+    loader = BackgroundLoader(lambda: release.wait(5) and {}).start()
+    monkeypatch.setattr(aci_app, "data_loader", loader)
+    monkeypatch.setattr(aci_app, "load_timings", {"p_feature_tables.pickle.bz2": {"total_s": 1.0}})
+    client = app.server.test_client()
+
+    assert client.get("/healthz").status_code == 200
+    response = client.get("/readyz")
+    assert response.status_code == 503 and response.get_json()["state"] == "loading"
+
+    release.set()
+    assert loader.wait(5)
+    assert client.get("/healthz").status_code == 200
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.get_json()["datasets"] == {"p_feature_tables.pickle.bz2": {"total_s": 1.0}}
+
+    def load():
+        raise DatasetUnavailable("bucket unreachable")
+    failed = BackgroundLoader(load).start()
+    assert not failed.wait(5)
+    monkeypatch.setattr(aci_app, "data_loader", failed)
+    response = client.get("/healthz")
+    assert response.status_code == 500 and "bucket unreachable" in response.get_json()["error"]
+    assert client.get("/readyz").status_code == 503
+
+
+def test_sqlite_backend_serves_the_same_genome_views(datasets, tmp_path, monkeypatch):
+    assembly_acc = datasets.df["assembly"].iloc[0]
+    sort_by = [{"column_id": "Start", "direction": "desc"}]
+
+    def views():
+        table = call_callback(datasets.update_table, assembly_acc, 1, 15, sort_by, '{Sym} is nil', None, [],
+                              trigger="datatable-interactivity.sort_by")
+        rows, points = call_callback(datasets.update_genome_rows, assembly_acc, "{Str} eq +", [], None,
+                                     trigger="assembly-acc.children")
+        # as sent to the browser, where missing values of either backend are null
+        return json.loads(json.dumps([table[:2], rows, points], cls=plotly.utils.PlotlyJSONEncoder))
+    in_memory = views()
+    assert datasets.assembly_partitions is not None and datasets.feature_db is None
+
+    monkeypatch.setattr(datasets, "DATA_BACKEND", "sqlite")
+    datasets.figure_cache.clear()
+    builds = []
+    build_database = sqlstore.build_database
+
+    def build(frame, db_path):
+        builds.append(db_path)
+        time.sleep(0.2)
+        build_database(frame, db_path)
+    monkeypatch.setattr(sqlstore, "build_database", build)
+    # workers starting together build the database once
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        list(pool.map(lambda _: datasets.load_datasets(), range(3)))
+    assert len(builds) == 1
+    publish_synthetic_datasets(tmp_path, monkeypatch)
+    assert datasets.assembly_partitions is None and datasets.feature_db is not None
+    assert list((tmp_path / "cache" / "sqlite").glob("*.sqlite"))
+    assert views() == in_memory
+
+
+def test_click_panel_falls_back_to_the_best_virulence_hit(datasets):
+    # the proteins of a HOG share its virulence factor hits, but only one
+    # of them carries the hit in its own annotation
+    hogs = datasets.protein_hogs[datasets.protein_hogs[VIR_COLUMN]]
+    annotations = datasets.full_hog_table[~datasets.full_hog_table.index.duplicated()]
+    shown = {}
+    for row_id, protein_acc in hogs["RefSeq Acc"].astype(object).items():
+        own = annotations.loc[protein_acc, "virulence_hit_description"]
+        assembly_acc = datasets.df.loc[row_id, "assembly"]
+        outputs = call_callback(datasets.display_click_data, {"points": [{"customdata": [protein_acc]}]}, None,
+                                assembly_acc, "", [], 15, trigger="graph-0.clickData")
+        expected = hogs.loc[row_id, VIR_BEST_HIT_COLUMN] if pd.isnull(own) else own
+        assert outputs[14] == expected
+        shown[pd.isnull(own)] = outputs[14]
+    assert set(shown) == {True, False}
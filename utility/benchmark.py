@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# coding=utf8
+"""Micro-benchmarks of the aci-dash callbacks on synthetic data.
+
+    python utility/benchmark.py --scale 5x400 --scale 50x4000 --repeat 20
+
+For every scale (genomes x proteins per genome) synthetic datasets with
+the schema of the published files are written to a temporary directory
+and served over HTTP to a fresh app process, which loads them like the
+real data. The callbacks are then called directly, on a different
+genome in every repetition and with the figure and position caches
+cleared (unless --warm), and their latencies are reported.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextvars
+from pathlib import Path
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aci_dash.synthetic import write_datasets  # noqa: E402
+
+FILTER_QUERY = '{Start} > 10000 && {Protein Annotation} icontains "protein"'
+SORT_BY = [{"column_id": "Start", "direction": "desc"}]
+
+
+def parse_scale(text):
+    genomes, proteins = text.lower().split("x")
+    return int(genomes), int(proteins)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory):
+    """Serve directory over HTTP from a daemon thread, return its URL.
+    """
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(directory)))
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return "http://127.0.0.1:{}/".format(httpd.server_address[1])
+
+
+def call(callback, *args, trigger="."):
+    """Call a callback outside of a request, with the triggered input
+    callback_context would report for it.
+    """
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    def run():
+        context_value.set(AttributeDict(triggered_inputs=[{"prop_id": trigger, "value": None}]))
+        return callback(*args)
+    return contextvars.copy_context().run(run)
+
+
+def benchmark_cases(app, assembly_acc):
+    """(name, function) of every callback measured for one genome.
+    """
+    rows = {}
+
+    def genome_rows():
+        # the rows and, for the clientside scatter and pie, their points
+        rows["data"] = call(app.update_genome_rows, assembly_acc, FILTER_QUERY, [], None)
+
+    protein_acc = app.genome_view(assembly_acc, FILTER_QUERY, SORT_BY)["RefSeq Acc"].iloc[-1]
+    proteins = app.genome_rows(assembly_acc)["RefSeq Acc"].astype(object).unique()[:12].tolist()
+    return [
+        ("update_map", lambda: app.update_map(assembly_acc)),
+        ("update_table", lambda: call(app.update_table, assembly_acc, 0, app.PAGE_SIZE, SORT_BY,
+                                      FILTER_QUERY, None, [], trigger="assembly-acc.children")),
+        ("update_genome_rows", genome_rows),
+        ("update_composition_sunburst", lambda: call(app.update_composition_sunburst, rows["data"][0],
+                                                     "gained_at", ["VIR"], FILTER_QUERY, [])),
+        ("display_click_data", lambda: call(app.display_click_data, {"points": [{"customdata": [protein_acc]}]},
+                                            None, assembly_acc, FILTER_QUERY, SORT_BY, app.PAGE_SIZE,
+                                            trigger="graph-0.clickData")),
+        ("create_prevalence_barchart", lambda: app.create_prevalence_barchart(proteins)),
+    ]
+
+
+def run_scale(n_genomes, proteins_per_genome, repeat, warm, seed):
+    """Benchmark one scale in this process; returns the timings in ms.
+    """
+    work_dir = Path(tempfile.mkdtemp(prefix="aci-dash-benchmark-"))
+    write_datasets(work_dir / "data", n_genomes, proteins_per_genome, seed)
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ["DATA_URL"] = serve(work_dir / "data")
+    os.environ["DATA_CACHE_DIR"] = str(work_dir / "cache")
+
+    from aci_dash import app
+    app.data_loader.wait()
+    status = app.data_loader.status()
+    if status["state"] != "ready":
+        raise RuntimeError("Datasets failed to load: {}".format(status))
+
+    assemblies = list(app.genomes_df.index)
+    timings = {}
+    for i in range(repeat):
+        if not warm:
+            app.figure_cache.clear()
+            app.position_maps.clear()
+        for name, function in benchmark_cases(app, assemblies[i % len(assemblies)]):
+            start = time.perf_counter()
+            function()
+            timings.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+    return {"genomes": n_genomes, "proteins_per_genome": proteins_per_genome,
+            "rows": int(len(app.df.index)), "load_s": status.get("elapsed_s"), "timings_ms": timings}
+
+
+def summarize(result):
+    lines = ["{} genomes x {} proteins ({} rows), loaded in {}s".format(
+        result["genomes"], result["proteins_per_genome"], result["rows"], result["load_s"]),
+        "  {:<30} {:>10} {:>10} {:>10}".format("callback", "median ms", "p95 ms", "min ms")]
+    for name, values in result["timings_ms"].items():
+        values = np.asarray(values)
+        lines.append("  {:<30} {:>10.2f} {:>10.2f} {:>10.2f}".format(
+            name, np.median(values), np.percentile(values, 95), values.min()))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", action="append", type=parse_scale,
+                        help="genomes x proteins per genome, e.g. 50x4000 (repeatable, default 5x400)")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warm", action="store_true", help="keep the figure and position caches")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the raw timings to this file")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    scales = args.scale or [(5, 400)]
+
+    if args.single:
+        # one scale per process, the app keeps its datasets in module globals
+        print(json.dumps(run_scale(*scales[0], args.repeat, args.warm, args.seed)))
+        return
+
+    results = []
+    for n_genomes, proteins_per_genome in scales:
+        command = [sys.executable] + ["-W" + option for option in sys.warnoptions] + [
+            __file__, "--single", "--scale", "{}x{}".format(n_genomes, proteins_per_genome),
+            "--repeat", str(args.repeat), "--seed", str(args.seed)] + (["--warm"] if args.warm else [])
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+        print(summarize(results[-1]))
+        print()
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(results, fh, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+# coding=utf8
+"""Load test of a running aci-dash server with scripted user sessions.
+
+Start the server on stand-in data, e.g.::
+
+    python -m aci_dash.synthetic /tmp/aci-data --genomes 50 --proteins 4000
+    (cd /tmp/aci-data && python -m http.server 8000) &
+    SECRET_KEY=... DATA_URL=http://127.0.0.1:8000/ gunicorn aci_dash.app:server -w 4 --bind 127.0.0.1:8050
+
+and replay sessions against it::
+
+    python utility/loadtest.py http://127.0.0.1:8050 --users 20 --duration 60
+
+Every session posts the _dash-update-component requests the renderer
+sends when a user picks a genome, gets its table and figures, filters
+the table, clicks a point of graph-0, toggles the VIR highlight and
+lasso-selects points. The scatter and pie are drawn clientside from
+genome-points and cost no requests. Payloads are built from /_dash-dependencies and
+chained through the server's responses. Latency percentiles and
+throughput are reported per callback.
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+# callbacks by their first output
+CALLBACKS = {
+    "update_map": "world-map.figure",
+    "update_table": "datatable-interactivity.data",
+    "update_genome_rows": "genome-rows.data",
+    "update_composition_sunburst": "set_composi_graph2.figure",
+    "display_click_data": "click-data.children",
+    "select_and_filter_selected_data": "selected_data_points.children",
+}
+
+# component properties as the page starts out
+INITIAL_PROPS = {
+    "hue-criterion-radio.value": "aci_core231_of_234",
+    "highlights-checkb.value": [],
+    "datatable-interactivity.page_current": 0,
+    "datatable-interactivity.page_size": 15,
+    "datatable-interactivity.sort_by": [],
+    "datatable-interactivity.filter_query": "",
+    "selected-row-ids.data": [],
+}
+
+FILTER_QUERY = '{Start} > 10000 && {Protein Annotation} icontains "protein"'
+LASSO_POINTS = 20
+
+
+def output_specs(output):
+    """[(id, property)] of a dependency's output string.
+    """
+    parts = output[2:-2].split("...") if output.startswith("..") else [output]
+    return [tuple(part.rsplit(".", 1)) for part in parts]
+
+
+class DashClient:
+    """Posts callback requests for one user and records their latency.
+    """
+
+    def __init__(self, url, dependencies, stats):
+        self.url = url.rstrip("/")
+        self.http = requests.Session()
+        self.dependencies = dependencies
+        self.stats = stats
+
+    def update(self, name, props, changed):
+        """Run callback name with the current props; merge its outputs
+        into props. Returns False if the server did not update anything.
+        """
+        dependency = self.dependencies[CALLBACKS[name]]
+        outputs = [{"id": i, "property": p} for i, p in output_specs(dependency["output"])]
+        payload = {
+            "output": dependency["output"],
+            "outputs": outputs if dependency["output"].startswith("..") else outputs[0],
+            "inputs": [dict(spec, value=props.get("{id}.{property}".format(**spec)))
+                       for spec in dependency["inputs"]],
+            "state": [dict(spec, value=props.get("{id}.{property}".format(**spec)))
+                      for spec in dependency["state"]],
+            "changedPropIds": changed,
+        }
+        start = time.perf_counter()
+        try:
+            response = self.http.post(self.url + "/_dash-update-component", json=payload, timeout=300)
+        except requests.RequestException:
+            self.stats.record(name, time.perf_counter() - start, error=True)
+            return False
+        self.stats.record(name, time.perf_counter() - start, error=response.status_code not in (200, 204))
+        if response.status_code != 200:
+            return False
+        for component_id, values in response.json().get("response", {}).items():
+            for prop, value in values.items():
+                props["{}.{}".format(component_id, prop)] = value
+        return True
+
+    def session(self, assembly_acc, rng):
+        props = dict(INITIAL_PROPS)
+
+        # pick a genome, receive its table and figures
+        props["genome-dropdown.value"] = assembly_acc
+        self.update("update_map", props, ["genome-dropdown.value"])
+        self.genome_changed(props, ["assembly-acc.children"])
+
+        # filter the table
+        props["datatable-interactivity.filter_query"] = FILTER_QUERY
+        self.genome_changed(props, ["datatable-interactivity.filter_query"])
+
+        # click a point of graph-0
+        proteins = list((props.get("genome-points.data") or {}).get("ids", []))
+        if proteins:
+            props["graph-0.clickData"] = {"points": [{"customdata": [rng.choice(proteins)]}]}
+            self.update("display_click_data", props, ["graph-0.clickData"])
+
+        # toggle the VIR highlight
+        props["highlights-checkb.value"] = ["VIR"]
+        self.update("update_composition_sunburst", props, ["highlights-checkb.value"])
+
+        # lasso-select some points
+        if proteins:
+            selected = rng.sample(proteins, min(LASSO_POINTS, len(proteins)))
+            props["graph-0.selectedData"] = {"points": [{"customdata": [p]} for p in selected]}
+            self.update("display_click_data", props, ["graph-0.selectedData"])
+            self.update("select_and_filter_selected_data", props, ["graph-0.selectedData"])
+
+    def genome_changed(self, props, changed):
+        self.update("update_table", props, changed)
+        if self.update("update_genome_rows", props, changed):
+            self.update("update_composition_sunburst", props, ["genome-rows.data"])
+        self.update("display_click_data", props, changed)
+
+
+class Stats:
+    """Thread-safe latencies and error counts per callback.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.sessions = 0
+
+    def record(self, name, seconds, error=False):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds * 1000)
+            self.errors[name] = self.errors.get(name, 0) + int(error)
+
+    def report(self, wall_s):
+        total = sum(len(v) for v in self.latencies.values())
+        result = {"wall_s": round(wall_s, 2), "sessions": self.sessions, "requests": total,
+                  "requests_per_s": round(total / wall_s, 2) if wall_s else None, "callbacks": {}}
+        for name, values in self.latencies.items():
+            values = np.asarray(values)
+            result["callbacks"][name] = {
+                "count": len(values), "errors": self.errors[name],
+                "per_s": round(len(values) / wall_s, 2) if wall_s else None,
+                "p50_ms": round(float(np.percentile(values, 50)), 1),
+                "p95_ms": round(float(np.percentile(values, 95)), 1),
+                "p99_ms": round(float(np.percentile(values, 99)), 1)}
+        return result
+
+
+def find_component(layout, component_id):
+    if isinstance(layout, dict):
+        if layout.get("props", {}).get("id") == component_id:
+            return layout
+        children = layout.get("props", {}).get("children")
+        return find_component(children, component_id)
+    if isinstance(layout, list):
+        for child in layout:
+            found = find_component(child, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+def wait_until_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if requests.get(url + "/readyz", timeout=10).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        if time.monotonic() > deadline:
+            raise SystemExit("{} did not become ready within {}s".format(url, timeout))
+        time.sleep(1)
+
+
+def print_report(result):
+    print("{sessions} sessions, {requests} requests in {wall_s}s ({requests_per_s} requests/s)".format(**result))
+    print("  {:<32} {:>7} {:>7} {:>8} {:>9} {:>9} {:>9}".format(
+        "callback", "count", "errors", "per s", "p50 ms", "p95 ms", "p99 ms"))
+    for name, c in result["callbacks"].items():
+        print("  {:<32} {:>7} {:>7} {:>8} {:>9} {:>9} {:>9}".format(
+            name, c["count"], c["errors"], c["per_s"], c["p50_ms"], c["p95_ms"], c["p99_ms"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("url", help="base URL of the running server")
+    parser.add_argument("--users", type=int, default=10, help="concurrent sessions")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to start new sessions for")
+    parser.add_argument("--sessions", type=int, help="stop after this many sessions instead")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ready-timeout", type=float, default=300)
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args(argv)
+    url = args.url.rstrip("/")
+
+    wait_until_ready(url, args.ready_timeout)
+    dependencies = {"{}.{}".format(*output_specs(d["output"])[0]): d
+                    for d in requests.get(url + "/_dash-dependencies", timeout=60).json()}
+    missing = [name for name, output in CALLBACKS.items() if output not in dependencies]
+    if missing:
+        raise SystemExit("Callbacks not served by {}: {}".format(url, ", ".join(missing)))
+    dropdown = find_component(requests.get(url + "/_dash-layout", timeout=60).json(), "genome-dropdown")
+    assemblies = [option["value"] for option in dropdown["props"]["options"]]
+
+    stats = Stats()
+    deadline = time.monotonic() + args.duration
+    started = iter(range(args.sessions)) if args.sessions else None
+    counter_lock = threading.Lock()
+
+    def user(index):
+        rng = random.Random(args.seed * 1000 + index)
+        client = DashClient(url, dependencies, stats)
+        while True:
+            with counter_lock:
+                if started is not None:
+                    if next(started, None) is None:
+                        return
+                elif time.monotonic() > deadline:
+                    return
+            client.session(rng.choice(assemblies), rng)
+            with stats.lock:
+                stats.sessions += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        for future in [pool.submit(user, i) for i in range(args.users)]:
+            future.result()
+    result = stats.report(time.perf_counter() - start)
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as fh:
+            json.dump(result, fh, indent=1)
+    return 1 if any(c["errors"] for c in result["callbacks"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())